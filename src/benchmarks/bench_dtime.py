@@ -0,0 +1,95 @@
+"""Benchmark of flights_with_dtime_objects against the row-wise version.
+
+The row-wise implementation below is the one flights_with_dtime_objects used
+before it was vectorized (four ``apply(axis=1)`` calls with a Python
+``parse_dtime`` per row and three ``apply`` calls building
+``datetime.timedelta`` objects). Both run on the same flights, and the
+results are compared value by value before the timings are printed.
+
+Run from the src directory::
+
+    python benchmarks/bench_dtime.py [db_path] [rows]
+"""
+import datetime
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flightlib.config import DB_PATH  # noqa: E402
+from flightlib.times import flights_with_dtime_objects  # noqa: E402
+
+TIME_COLUMNS = ["dep_time", "sched_dep_time", "arr_time", "sched_arr_time"]
+DURATION_COLUMNS = ["dep_delay", "arr_delay", "air_time"]
+
+
+def rowwise_flights_with_dtime_objects(flights):
+    def parse_dtime(year, month, day, num):
+        if pd.isna(num):
+            return pd.NA
+        if num == 2400:
+            return datetime.datetime(year=year, month=month, day=day) + datetime.timedelta(days=1)
+        hours, minutes = divmod(num, 100)
+        return datetime.datetime(year=year, month=month, day=day, hour=int(hours % 24), minute=int(minutes))
+
+    flights = flights.copy()
+    for col in TIME_COLUMNS:
+        flights[col] = flights.apply(lambda row: parse_dtime(
+            row["year"], row["month"], row["day"], row[col]), axis=1)
+    for col in DURATION_COLUMNS:
+        flights[col] = flights[col].apply(
+            lambda value: datetime.timedelta(minutes=value) if not pd.isna(value) else pd.NA)
+    return flights
+
+
+def load(db_path, rows):
+    query = "SELECT * FROM flights" + (f" LIMIT {int(rows)}" if rows else "")
+    with sqlite3.connect(db_path) as conn:
+        flights = pd.read_sql(query, conn)
+    conn.close()
+    return flights
+
+
+def mismatches(expected, actual):
+    """Number of values per column that differ, treating NA and NaT as equal."""
+    counts = {}
+    for col in TIME_COLUMNS + DURATION_COLUMNS:
+        converter = pd.to_datetime if col in TIME_COLUMNS else pd.to_timedelta
+        left = converter(expected[col].astype(object).where(expected[col].notna(), None))
+        right = actual[col]
+        same = (left == right) | (left.isna() & right.isna())
+        counts[col] = int((~same).sum())
+    return counts
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(db_path=DB_PATH, rows=None):
+    flights = load(db_path, rows)
+    print(f"{len(flights)} flights from {db_path}")
+
+    expected, rowwise_seconds = timed(rowwise_flights_with_dtime_objects, flights)
+    actual, vectorized_seconds = timed(flights_with_dtime_objects, flights)
+
+    print(f"{'row-wise':<12}{rowwise_seconds:>10.3f} s  "
+          f"{expected[TIME_COLUMNS + DURATION_COLUMNS].memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    print(f"{'vectorized':<12}{vectorized_seconds:>10.3f} s  "
+          f"{actual[TIME_COLUMNS + DURATION_COLUMNS].memory_usage(deep=True).sum() / 1e6:.1f} MB")
+    print(f"speed-up: {rowwise_seconds / vectorized_seconds:.0f}x")
+
+    diff = mismatches(expected, actual)
+    print("mismatches:", diff)
+    return 1 if any(diff.values()) else 0
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(main(args[0] if args else DB_PATH, int(args[1]) if len(args) > 1 else None))
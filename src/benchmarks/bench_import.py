@@ -0,0 +1,79 @@
+"""Import-time benchmark for flights.py and the flightlib package.
+
+Every module is imported in a fresh interpreter while an audit hook records
+all files that are opened and all SQLite connections that are made. Reading
+Python sources, compiled extensions and the system time zone database is
+expected; anything else (CSV files, the database, snapshots, ...) means the
+import does I/O and makes the benchmark fail.
+
+Run from the src directory::
+
+    python benchmarks/bench_import.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "flightlib.geo",
+    "flightlib.airports",
+    "flightlib.analysis",
+    "flightlib.cleaning",
+    "flightlib.times",
+    "flightlib.timezones",
+    "flightlib.pipelines",
+    "flights",
+]
+
+# executed in the child interpreter
+PROBE = r"""
+import json, sys, time
+code_suffixes = (".py", ".pyc", ".so", ".pyd", ".pth", ".json", ".typed", ".dylib")
+events = []
+def hook(event, args):
+    if event == "sqlite3.connect":
+        events.append(["sqlite3.connect", str(args[0])])
+    elif event == "open" and isinstance(args[0], str):
+        path = args[0]
+        if path.endswith(code_suffixes) or "site-packages" in path or "/lib/python" in path:
+            return
+        if "zoneinfo" in path:  # the system time zone database, read by pandas
+            return
+        events.append(["open", path])
+sys.addaudithook(hook)
+start = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "io": events}))
+"""
+
+
+def measure(module):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, module],
+        cwd=SRC_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    import json
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(repeat=3):
+    failed = False
+    print(f"{'module':<22}{'best import time':>18}  data I/O")
+    for module in MODULES:
+        runs = [measure(module) for _ in range(repeat)]
+        best = min(run["seconds"] for run in runs)
+        io = runs[0]["io"]
+        failed = failed or bool(io)
+        print(f"{module:<22}{best:>16.3f} s  {'none' if not io else io}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    status = main()
+    print(f"total benchmark time: {time.perf_counter() - start:.1f} s")
+    sys.exit(status)
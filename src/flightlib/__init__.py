@@ -0,0 +1,5 @@
+"""Shared data and analysis helpers for the flights project.
+
+The modules in this package are used by both ``flights.py`` and the
+Streamlit dashboard (``helloDash.py``).
+"""
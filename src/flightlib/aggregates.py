@@ -0,0 +1,126 @@
+"""Chart aggregates computed on the server.
+
+Plotting every flight sends hundreds of thousands of points to the browser.
+The General Results charts are drawn from these aggregates instead: a 2D
+binned density for scatter plots, histogram bins per group and group means,
+so the size of a figure depends on the number of bins, not on the number
+of flights.
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+
+def _range(values, quantiles):
+    # bin range covering the values between the quantiles (the whole range without them)
+    if quantiles is None:
+        return float(values.min()), float(values.max())
+    lo, hi = np.quantile(values, quantiles)
+    return float(lo), float(hi)
+
+
+def _edges(values, bins, quantiles=None):
+    lo, hi = _range(values, quantiles)
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return np.linspace(lo, hi, bins + 1)
+
+
+def binned_density(x, y, bins=(60, 60), quantiles=(0.001, 0.999)):
+    """Counts of the (x, y) pairs on a regular grid.
+
+    The grid covers the values between the quantiles; values outside are
+    counted in the first or last bin, so every pair is counted. Pairs with a
+    missing value are left out. Returns the counts (shape y bins by x bins)
+    and the x and y bin centers.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+    if len(x) == 0:
+        return np.zeros((0, 0)), np.empty(0), np.empty(0)
+    x_edges = _edges(x, bins[0], quantiles)
+    y_edges = _edges(y, bins[1], quantiles)
+    x = np.clip(x, x_edges[0], x_edges[-1])
+    y = np.clip(y, y_edges[0], y_edges[-1])
+    counts, _, _ = np.histogram2d(x, y, bins=[x_edges, y_edges])
+    return counts.T, (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2
+
+
+def histogram_bins(values, groups=None, bins=50):
+    """Histogram counts per group, on the same bin edges for every group.
+
+    Returns a long frame with the group, the bin edges and middle and the
+    count of every (group, bin); missing values are left out.
+    """
+    values = pd.Series(np.asarray(values, dtype=float))
+    groups = pd.Series("all" if groups is None else np.asarray(groups, dtype=object))
+    valid = values.notna() & groups.notna()
+    values, groups = values[valid].to_numpy(), groups[valid].to_numpy()
+    if len(values) == 0:
+        return pd.DataFrame(columns=["group", "bin_left", "bin_right", "bin_mid", "count"])
+    edges = np.histogram_bin_edges(values, bins=bins)
+    # the last bin includes its right edge, like np.histogram
+    positions = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+    counts = (pd.DataFrame({"group": groups, "bin": positions})
+              .groupby(["group", "bin"]).size().rename("count").reset_index())
+    counts["bin_left"] = edges[counts["bin"]]
+    counts["bin_right"] = edges[counts["bin"] + 1]
+    counts["bin_mid"] = (counts["bin_left"] + counts["bin_right"]) / 2
+    return counts[["group", "bin_left", "bin_right", "bin_mid", "count"]]
+
+
+def group_means(df, by, column):
+    """Mean and number of the non-missing values of a column per group."""
+    return (df.groupby(by, observed=True)[column].agg(["mean", "count"])
+            .reset_index().rename(columns={"mean": column}))
+
+
+def binned_means(x, y, bins=30, quantiles=(0.001, 0.999)):
+    """Mean of y per bin of x, for a trend line over a density plot."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+    if len(x) == 0:
+        return pd.DataFrame(columns=["x", "mean", "count"])
+    edges = _edges(x, bins, quantiles)
+    positions = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, bins - 1)
+    sums = np.bincount(positions, weights=y, minlength=bins)
+    counts = np.bincount(positions, minlength=bins)
+    filled = counts > 0
+    return pd.DataFrame({"x": ((edges[:-1] + edges[1:]) / 2)[filled],
+                         "mean": sums[filled] / counts[filled],
+                         "count": counts[filled]})
+
+
+def density_figure(x, y, title, x_label, y_label, bins=(60, 60)):
+    """Heatmap of the binned (x, y) density with the mean of y per x bin (WebGL)."""
+    counts, x_mid, y_mid = binned_density(x, y, bins)
+    means = binned_means(x, y, bins[0])
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(x=x_mid, y=y_mid, z=np.where(counts > 0, counts, np.nan),
+                             colorscale="Viridis", colorbar={"title": "Flights"},
+                             hovertemplate=f"{x_label}: %{{x:.1f}}<br>{y_label}: %{{y:.1f}}"
+                                           "<br>Flights: %{z}<extra></extra>"))
+    fig.add_trace(go.Scattergl(x=means["x"], y=means["mean"], mode="lines+markers",
+                               name=f"Mean {y_label}", line={"color": "red"}))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title=y_label,
+                      legend={"orientation": "h", "y": -0.2})
+    return fig
+
+
+def histogram_figure(bins_df, title, x_label, group_label):
+    """Stacked bar chart of histogram_bins, one color per group."""
+    fig = go.Figure()
+    for group, rows in bins_df.groupby("group", sort=True):
+        fig.add_trace(go.Bar(x=rows["bin_mid"], y=rows["count"], width=rows["bin_right"] - rows["bin_left"],
+                             name=str(group),
+                             customdata=np.stack([rows["bin_left"], rows["bin_right"]], axis=-1),
+                             hovertemplate=f"{group_label}: {group}<br>{x_label}: "
+                                           "%{customdata[0]:.0f}-%{customdata[1]:.0f}"
+                                           "<br>Flights: %{y}<extra></extra>"))
+    fig.update_layout(title=title, barmode="stack", bargap=0, xaxis_title=x_label,
+                      yaxis_title="count", legend_title_text=group_label)
+    return fig
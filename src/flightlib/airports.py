@@ -0,0 +1,271 @@
+"""Loading, cleaning and exploring the airports data (Part 1, 2).
+
+The cleaned airports are stored in the cache directory and only cleaned
+again when their source (airports.csv or the airports table) changes.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import seaborn as sns
+
+from flightlib.config import CACHE_DIR, DATA_DIR, DB_PATH
+from flightlib.db import connect, table_version
+from flightlib.geo import euclidean_km, haversine_km
+from flightlib.timezones import fill_missing_tzones
+
+AIRPORTS_CSV = os.path.join(DATA_DIR, "airports.csv")
+# bump when clean_airports changes, so stored cleaned airports are redone
+CLEANING_FORMAT = 1
+
+_lock = threading.Lock()
+
+
+def load_airports_csv(path=AIRPORTS_CSV):
+    """Read airports.csv."""
+    return pd.read_csv(path)
+
+
+# infer dst based on the most common dst setting per tzone
+def infer_dst_from_tzone(tzone):
+    if pd.isnull(tzone):
+        return 'U'
+    if "America/" in tzone:
+        return 'A'
+    elif "Europe/" in tzone:
+        return 'E'
+    else:
+        return 'N'
+
+
+def infer_dst_from_tzones(tzones):
+    """infer_dst_from_tzone for a whole column."""
+    tzones = pd.Series(tzones)
+    america = tzones.str.contains("America/", regex=False, na=False)
+    europe = tzones.str.contains("Europe/", regex=False, na=False)
+    dst = np.select([tzones.isna(), america, europe], ['U', 'A', 'E'], default='N')
+    return pd.Series(dst, index=tzones.index)
+
+
+def clean_airports(df):
+    """Infer missing tzone, tz and dst values and add alt_meters."""
+    # inferring missing values instead of deleting them
+    # missing time zones are looked up from the coordinates (cached across runs)
+    df["tzone"] = fill_missing_tzones(df)
+    # update tz values based on the inferred tzone
+    tz_mapping_dynamic = dict(
+        df[["tzone", "tz"]].dropna().drop_duplicates().values)
+    df["tz"] = df["tz"].fillna(df["tzone"].map(tz_mapping_dynamic))
+
+    df["dst"] = df["dst"].fillna(infer_dst_from_tzones(df["tzone"]))
+
+    df.loc[df["tzone"] == "America/Boise", "tz"] = - \
+        7  # fix missing values in America/Boise
+
+    df.loc[df['tz'] == 8, 'tz'] = -8  # fix incorrect tz value
+
+    # convert altitude to meters
+    df["alt_meters"] = df["alt"] * 0.3048
+    df["tz"] = df["tz"].astype("Int64")  # convert tz to integer
+    return df
+
+
+def _cleaned_path(source_path):
+    source_path = os.path.abspath(source_path)
+    name = os.path.basename(source_path).replace(".", "-")
+    digest = hashlib.sha1(source_path.encode()).hexdigest()[:8]
+    return os.path.join(CACHE_DIR, "airports", f"{name}-{digest}.parquet")
+
+
+def _load_cleaned(source_path, version, load_raw):
+    """Return the cleaned airports of a source, cleaning them only when it changed.
+
+    The cleaned airports are stored as Parquet next to a stamp with the
+    version of the source and of the cleaning code.
+    """
+    path = _cleaned_path(source_path)
+    stamp = {"format": CLEANING_FORMAT, "source": os.path.abspath(source_path),
+             "version": json.loads(json.dumps(version))}
+    with _lock:
+        try:
+            with open(path + ".json") as f:
+                if json.load(f) == stamp:
+                    return pd.read_parquet(path, engine="pyarrow")
+        except (OSError, ValueError):
+            pass
+        df = clean_airports(load_raw())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df.to_parquet(path + ".tmp", index=False, engine="pyarrow")
+            os.replace(path + ".tmp", path)
+            with open(path + ".json.tmp", "w") as f:
+                json.dump(stamp, f)
+            os.replace(path + ".json.tmp", path + ".json")
+        except OSError:
+            pass  # a read-only cache only means cleaning again next time
+        return df
+
+
+def load_clean_airports(path=AIRPORTS_CSV):
+    """The cleaned airports of airports.csv."""
+    stat = os.stat(path)
+    return _load_cleaned(path, [(stat.st_mtime_ns, stat.st_size)],
+                         lambda: load_airports_csv(path))
+
+
+def load_clean_airports_db(db_path=DB_PATH):
+    """The cleaned airports table of the database."""
+    def load_raw():
+        conn = connect(db_path)
+        try:
+            return pd.read_sql_query("SELECT * FROM airports", conn)
+        finally:
+            conn.close()
+    return _load_cleaned(db_path, table_version(db_path, "airports"), load_raw)
+
+
+def plot_airport_overview(df):
+    """Matplotlib figures exploring altitude, time zones and DST."""
+    # scatter plot: altitude vs latitude
+    plt.figure(figsize=(10, 6))
+    plt.scatter(df["lat"], df["alt_meters"], alpha=0.5, color="blue")
+
+    plt.xlabel("Latitude")
+    plt.ylabel("Altitude (meters)")
+    plt.title("Scatter Plot: Airport Altitude vs Latitude")
+    plt.grid(True)
+
+    # countplot: number of airports in each time zone
+    plt.figure(figsize=(10, 6))
+    sns.countplot(x=df["tzone"], hue=df["tzone"], palette="coolwarm", legend=False)
+    plt.xlabel("Time Zone")
+    plt.xticks(rotation=25, ha='right', fontsize=6)
+    plt.ylabel("Number of Airports")
+    plt.title("Number of Airports in Each Time Zone")
+    plt.grid(True)
+
+    # find airports that do not observe daylight saving time, later visualizing these airports on a map
+    df_no_dst = df[df["dst"] == "N"]
+
+    plt.figure(figsize=(10, 6))
+    sns.scatterplot(x=df_no_dst["lon"], y=df_no_dst["lat"], color="red")
+
+    plt.xlabel("Longitude")
+    plt.ylabel("Latitude")
+    plt.title("Airports That Do NOT Observe DST")
+
+
+def airport_maps(df):
+    """Return the global and the US airport maps, colored by altitude."""
+    # plot global airport distribution, with color coded by 'alt' (altitude)
+    fig_global = px.scatter_geo(df,
+                                lat="lat", lon="lon",
+                                hover_name="name",
+                                color="alt_meters",  # color by altitude
+                                title="Global Airport Distribution (Colored by Altitude)",
+                                projection="natural earth",
+                                color_continuous_scale="Viridis",  # Choose color scale
+                                # Set color legend title
+                                labels={"alt_meters": "Altitude (m)"}
+                                )
+
+    # plot US airport distribution, with color coded by 'alt' (altitude)
+    # use scatter_geo funcion, scope="usa"
+    fig_us = px.scatter_geo(df,
+                            lat="lat", lon="lon",
+                            hover_name="name",
+                            color="alt_meters",  # color by altitude
+                            title="us airport distribution (colored by altitude)",
+                            scope="usa",
+                            color_continuous_scale="Viridis",
+                            labels={"alt_meters": "Altitude (m)"}
+                            )
+    return fig_global, fig_us
+
+
+def add_jfk_distances(df):
+    """Add the euclidean and geodesic distances (km) between JFK and every airport."""
+    jfk_data = df[df["faa"] == "JFK"]
+    jfk_lat, jfk_lon = jfk_data["lat"].iloc[0], jfk_data["lon"].iloc[0]
+    df["euc_dist"] = euclidean_km(jfk_lat, jfk_lon, df["lat"], df["lon"])
+    df["geo_dist"] = haversine_km(jfk_lat, jfk_lon, df["lat"], df["lon"])
+    return df
+
+
+def plot_jfk_distances(df):
+    """Histograms of the distances computed by add_jfk_distances."""
+    plt.figure(figsize=(10, 6))
+    plt.hist(df["euc_dist"], bins=30, alpha=0.5, color="blue")
+
+    plt.xlabel("Euclidean distance")
+    plt.ylabel("Count")
+    plt.title("Distribution of the euclidean distances between the eirports and JFK")
+    plt.grid(True)
+
+    plt.figure(figsize=(10, 6))
+    plt.hist(df["geo_dist"], bins=30, alpha=0.5, color="blue")
+
+    plt.xlabel("Geodesic distance")
+    plt.ylabel("Count")
+    plt.title("Distribution of the geodesic distances between the eirports and JFK")
+    plt.grid(True)
+
+
+def plot_multiple_flight_routes(df, faa_codes):
+    nyc_airport = df[df["faa"] == "EWR"]
+    if nyc_airport.empty:
+        print("Error: No airport found for EWR.")
+        return
+
+    nyc_lat = nyc_airport["lat"].values[0]
+    nyc_lon = nyc_airport["lon"].values[0]
+
+    fig = px.scatter_geo(
+        lat=[],
+        lon=[],
+        title="Flight Routes from NYC (EWR)",
+        projection="natural earth",
+    )
+
+    for faa_code in faa_codes:
+        airport = df[df["faa"] == faa_code.upper()]
+
+        if airport.empty:
+            print(f"Warning: No airport found with FAA code '{faa_code}'.")
+            continue
+
+        airport_name = airport["name"].values[0]
+        airport_lat = airport["lat"].values[0]
+        airport_lon = airport["lon"].values[0]
+
+        fig.add_trace(
+            go.Scattergeo(
+                lon=[nyc_lon, airport_lon],
+                lat=[nyc_lat, airport_lat],
+                mode="lines",
+                line=dict(width=2, color="blue"),
+                name=f"NYC → {airport_name}",
+            )
+        )
+
+        fig.add_trace(
+            go.Scattergeo(
+                lon=[airport_lon],
+                lat=[airport_lat],
+                text=[airport_name],
+                mode="markers",
+                marker=dict(size=8, color="green"),
+                name=f"{airport_name}",
+            )
+        )
+
+    fig.show()
+
+# Example usage
+# plot_multiple_flight_routes(df, ["LAX", "JFK", "SFO", "AAF", "AAP"])
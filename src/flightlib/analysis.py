@@ -0,0 +1,492 @@
+"""Analyses of flights_database.db (Part 3)."""
+import sqlite3
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from flightlib.config import DB_PATH
+from flightlib.geo import wind_alignment
+from flightlib.migrations import migrate
+from flightlib.routes import MI_TO_KM, RouteTable, get_routes
+from flightlib.snapshot import read_table
+from flightlib.speeds import refresh_speeds
+from flightlib.weather import get_weather_cube
+
+
+def load_flights(db_path=DB_PATH):
+    """Load the whole flights table."""
+    with sqlite3.connect(db_path) as conn:
+        flights = pd.read_sql_query("SELECT * FROM flights", conn)
+    conn.close()
+    return flights
+
+
+# verify the distances
+def compare_distances(db_path=DB_PATH, limit=None):
+    """Computed and database distance of every flight (or of the first ``limit``).
+
+    The computed distance is gathered from the route table, where it is
+    computed once per route; flights with an unknown airport are left out.
+    """
+    flights = read_table("flights", ["origin", "dest", "distance"], db_path=db_path)
+    if limit is not None:
+        flights = flights.head(limit)
+    routes = get_routes(db_path)
+    geo_distances = routes.gather(routes.ids(flights["origin"], flights["dest"]),
+                                  ["distance_km"])["distance_km"].to_numpy(dtype=float)
+    known = ~np.isnan(geo_distances)
+    db_distances = flights["distance"].to_numpy(dtype=float)[known] * MI_TO_KM  # convert miles to kilometers
+    return geo_distances[known], db_distances
+
+
+def plot_distance_comparison(geo_distances, db_distances):
+    # plot the computed and database distances of the flights
+    indices = range(len(geo_distances))
+    plt.figure(figsize=(12, 6))
+    plt.plot(indices, geo_distances, label="Calculated Distance (km)", linestyle="-")
+    plt.plot(indices, db_distances, label="Database Distance (km)", linestyle="--")
+    plt.xlabel("Flight Index")
+    plt.ylabel("Distance (km)")
+    plt.title(f"Comparison of Computed vs. Database Flight Distances ({len(indices)} Flights)")
+    plt.legend()
+
+
+# extract NYC airports
+def nyc_origin_airports(db_path=DB_PATH):
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT origin FROM flights;
+        """)
+        unique_origins = [row[0] for row in cursor.fetchall()]
+
+        query = f"""
+            SELECT * FROM airports
+            WHERE faa IN ({', '.join(['?'] * len(unique_origins))});
+            """
+        df_unique_origins = pd.read_sql_query(query, conn, params=unique_origins)
+    conn.close()
+    return df_unique_origins
+
+
+# analyse flights per day
+# retrieve the number of flights per day for a specific NYC airport
+def plot_flight_destinations(month, day, airport, db_path=DB_PATH):
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+
+        # query the number of flights to each destination from the specified airport
+        cursor.execute("""
+            SELECT dest, COUNT(*) AS flight_count
+            FROM flights
+            WHERE month = ? AND day = ? AND origin = ?
+            GROUP BY dest
+            ORDER BY flight_count DESC;
+        """, (month, day, airport))
+
+        results = cursor.fetchall()
+    conn.close()
+
+    destinations = [row[0] for row in results]
+    flight_counts = [row[1] for row in results]
+
+    plt.figure(figsize=(12, 6))
+    plt.bar(destinations, flight_counts, color="skyblue")
+    plt.xlabel("Destination Airport")
+    plt.ylabel("Number of Flights")
+    plt.title(f"Flights from {airport} on {month}/{day}")
+    plt.xticks(rotation=90)
+    plt.show()
+
+
+# plot_flight_destinations(1, 1, "JFK")  # plot the flight destinations for JFK on January 1st
+
+
+# retrieve flight statistics
+def get_flight_statistics(month, day, airport, db_path=DB_PATH):
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+
+        # statistics for total flights
+        cursor.execute("""
+            SELECT COUNT(*) FROM flights
+            WHERE month = ? AND day = ? AND origin = ?;
+        """, (month, day, airport))
+        total_flights = cursor.fetchone()[0]
+
+        # statistics for unique destinations
+        cursor.execute("""
+            SELECT COUNT(DISTINCT dest) FROM flights
+            WHERE month = ? AND day = ? AND origin = ?;
+        """, (month, day, airport))
+        unique_destinations = cursor.fetchone()[0]
+
+        # find the most visited destination
+        cursor.execute("""
+            SELECT dest, COUNT(*) AS flight_count
+            FROM flights
+            WHERE month = ? AND day = ? AND origin = ?
+            GROUP BY dest
+            ORDER BY flight_count DESC
+            LIMIT 1;
+        """, (month, day, airport))
+        most_visited = cursor.fetchone()
+
+        statistics = {
+            "total_flights": total_flights,
+            "unique_destinations": unique_destinations,
+            "most_visited": most_visited[0] if most_visited else None,
+            "most_visited_count": most_visited[1] if most_visited else 0
+        }
+    conn.close()
+
+    return statistics
+
+
+def average_delay_per_carrier_plot(db_path=DB_PATH):
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+
+        # query the number of flights to each destination from the specified airport
+        cursor.execute("""SELECT AVG(f.dep_delay), f.carrier, al.name
+            FROM flights f
+            JOIN airlines al ON f.carrier = al.carrier
+            GROUP BY f.carrier""")
+
+        results = cursor.fetchall()
+    conn.close()
+
+    plt.figure(figsize=(12, 6))
+    plt.bar([x[2] for x in results], [x[0] for x in results], color="skyblue")
+    plt.xlabel("Airlines")
+    plt.ylabel("Average delay")
+    plt.title("Average delay for each airline")
+    plt.xticks(rotation=45)
+    plt.grid(True)
+    plt.show()
+
+# average_delay_per_carrier_plot()
+
+
+def delays_month_destination(months, destination, db_path=DB_PATH):
+    with sqlite3.connect(db_path) as conn:
+        query = f"""
+        SELECT COUNT(*)
+        FROM flights
+        WHERE dest = ? AND month IN ({', '.join(['?'] * len(months))}) AND arr_delay > 0
+        """
+        results = conn.execute(query, (destination, *months)).fetchone()[0]
+    conn.close()
+    return results
+
+# print(delays_month_destination((1,2,3), 'ORD'))
+
+
+def bins_distance_delay(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    # Define the bins
+    bins = range(0, 3001, 200)
+
+    # Query the database
+    query = """
+    SELECT distance, arr_delay
+    FROM flights
+    """
+    df = pd.read_sql_query(query, conn)
+
+    # Bin the distances
+    df['distance_bins'] = pd.cut(df['distance'], bins)
+
+    # Group by the bins and calculate the mean arrival delay
+    grouped = df.groupby('distance_bins', observed=False)['arr_delay'].mean().reset_index()
+
+    # Extract the midpoint of each bin for plotting
+    grouped['bin_midpoint'] = grouped['distance_bins'].apply(lambda x: x.mid)
+
+    # Plot the scatter plot
+    plt.scatter(grouped['bin_midpoint'], grouped['arr_delay'])
+    plt.xlabel('Distance Bin Midpoint')
+    plt.ylabel('Average Arrival Delay')
+    plt.title('Average Arrival Delay by Distance Bin')
+    plt.grid(True)
+    plt.show()
+    conn.close()
+
+# bins_distance_delay()
+
+
+def bins_distance_delay_per_carrier(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    # Define the bins
+    bins = range(0, 3001, 200)
+
+    # Query the database
+    query = """
+    SELECT distance, arr_delay, carrier
+    FROM flights
+    """
+    df = pd.read_sql_query(query, conn)
+
+    # Bin the distances
+    df['distance_bins'] = pd.cut(df['distance'], bins)
+
+    # Group by both distance_bins and carrier, and calculate the mean arrival delay
+    grouped = df.groupby(['distance_bins', 'carrier'], observed=False)[
+        'arr_delay'].mean().reset_index()
+
+    # Extract the midpoint of each bin for plotting
+    grouped['bin_midpoint'] = grouped['distance_bins'].apply(lambda x: x.mid)
+
+    # Filter carriers with at least 10 bins with data
+    non_missing_counts = grouped.groupby('carrier')['arr_delay'].apply(
+        lambda x: x.notna().sum()).reset_index(name='n_non_missing')
+    filtered_carriers = non_missing_counts[non_missing_counts['n_non_missing'] >= 10]['carrier']
+
+    # Filter the original DataFrame to include only the selected carriers
+    grouped_filtered = grouped[grouped['carrier'].isin(filtered_carriers)]
+
+    # Get the list of filtered carriers
+    carriers = grouped_filtered['carrier'].unique()
+
+    # Determine the grid size for subplots
+    n_carriers = len(carriers)
+    n_cols = 3  # Number of columns in the grid
+    n_rows = (n_carriers // n_cols) + (1 if n_carriers % n_cols != 0 else 0)
+
+    # Create a grid of subplots
+    fig, axes = plt.subplots(n_rows, n_cols, figsize=(15, n_rows * 3))
+    axes = axes.flatten()  # Flatten the 2D array of axes for easy iteration
+
+    # Plot a line plot for each filtered carrier in its own subplot
+    for i, carrier in enumerate(carriers):
+        ax = axes[i]
+        carrier_data = grouped_filtered[grouped_filtered['carrier'] == carrier]
+        ax.plot(carrier_data['bin_midpoint'],
+                carrier_data['arr_delay'], marker='o', label=carrier)
+        ax.set_title(f'Carrier: {carrier}')
+        ax.set_xlabel('Distance Bin Midpoint')
+        ax.set_ylabel('Average Arrival Delay')
+        ax.grid(True)
+        ax.legend()
+
+    # Hide any unused subplots
+    for j in range(i + 1, len(axes)):
+        axes[j].axis('off')
+
+    plt.tight_layout()  # Adjust layout to prevent overlap
+    plt.show()
+    conn.close()
+
+# bins_distance_delay_per_carrier()
+
+
+def top_manufacturers_to_destiantion(destination, db_path=DB_PATH):
+    with sqlite3.connect(db_path) as conn:
+        query = """
+            SELECT manufacturer, COUNT(*) AS num_flights
+            FROM (
+                SELECT tailnum
+                FROM flights
+                WHERE dest = ?
+            ) f
+            JOIN (
+                SELECT manufacturer, tailnum
+                FROM planes
+            ) p
+            ON f.tailnum = p.tailnum
+            GROUP BY manufacturer
+            ORDER BY COUNT(*) DESC
+            LIMIT 5
+        """
+        df = pd.read_sql(query, conn, params=(destination,)).set_index("manufacturer")
+    conn.close()
+
+    plt.figure(figsize=(12, 6))
+    plt.bar(df.index, df["num_flights"], color="skyblue")
+    plt.xlabel("Manufacturer")
+    plt.ylabel("Number of Flights")
+    plt.title(f"Top 5 Manufacturers for Destination {destination}")
+    plt.show()
+
+# top_manufacturers_to_destiantion("ATL")
+
+
+# returns a dict describing how many times each plane type was used for flight trajectory between origin and destination flight
+def flights_between_cities(origin, destination, db_path=DB_PATH):
+    ny_airports = {"JFK", "LGA", "EWR"}
+    if origin not in ny_airports:
+        raise ValueError("Origin airport must be from a New York.")
+
+    with sqlite3.connect(db_path) as conn:
+        query = """
+            SELECT COUNT(*) AS count
+            FROM airports
+            WHERE faa = ?
+        """
+        if pd.read_sql(query, conn, params=(destination,)).iloc[0, 0] == 0:
+            conn.close()
+            raise ValueError("Destination airport is not the database.")
+
+        query = """
+            SELECT type, COUNT(*) AS num_flights
+            FROM (
+                SELECT tailnum
+                FROM flights
+                WHERE dest = ?
+                AND origin = ?
+            ) f
+            JOIN (
+                SELECT type, tailnum
+                FROM planes
+            ) p
+            ON f.tailnum = p.tailnum
+            GROUP BY type
+        """
+        result = pd.read_sql(query, conn, params=(destination, origin)).set_index("type")
+    conn.close()
+    return result
+
+# print(flights_between_cities("JFK", "ATL").to_dict()["num_flights"])
+
+
+# GROUP BY `tailnum` the flights and compute for each of them the average speed.
+# Add the avg. speed to the `planes`
+def compute_avg_speed_and_update_db(db_path=DB_PATH, only_dirty=False):
+    """Write the average speed of every plane into planes.speed.
+
+    See flightlib.speeds; with ``only_dirty`` only the planes with new or
+    changed flights are recomputed.
+    """
+    migrate(db_path)  # adds planes.speed and the tracking triggers
+    refreshed = refresh_speeds(db_path, only_dirty)
+    print(f"Updated the speed of {refreshed} planes.")
+    return refreshed
+
+
+# compute_avg_speed_and_update_db()
+
+
+def add_route_bearings(df_flights, df_airports):
+    """Add origin/destination coordinates and the bearing of every flight.
+
+    The bearing is computed once per origin/destination pair in a route
+    table and gathered into the flights by route id.
+    """
+    routes = RouteTable(df_flights[["origin", "dest"]], df_airports)
+    return routes.attach(df_flights, ["origin_lat", "origin_lon", "dest_lat", "dest_lon", "bearing"],
+                         names={"origin_lat": "lat_origin", "origin_lon": "lon_origin",
+                                "dest_lat": "lat_dest", "dest_lon": "lon_dest"})
+
+
+def add_wind_alignment(df_flights):
+    """Add the wind/bearing inner product and the headwind and tailwind components."""
+    wind_speed = df_flights["wind_speed"] if "wind_speed" in df_flights else 1.0
+    inner, headwind, tailwind = wind_alignment(
+        df_flights["wind_dir"], df_flights["bearing"], wind_speed)
+    df_flights["inner_product"] = inner
+    df_flights["headwind"] = headwind
+    df_flights["tailwind"] = tailwind
+    # a missing wind direction or bearing counts as negative, as before
+    df_flights["innerProd"] = np.where(inner >= 0, "positive", "negative")
+    return df_flights
+
+
+def generate_bearing_df(db_path=DB_PATH):
+    with sqlite3.connect(db_path) as conn:
+        query_flights = "SELECT flight, origin, dest, time_hour, year, month, day, hour FROM flights"
+        query_airports = "SELECT faa, lat, lon FROM airports"
+
+        df_flights = pd.read_sql_query(query_flights, conn)
+        df_airports = pd.read_sql_query(query_airports, conn)
+    conn.close()
+
+    # gather the wind of the departure hour from the weather cube; flights of
+    # origins or hours without any observation nearby are left out
+    df_flights = get_weather_cube(db_path).attach(
+        df_flights, ["wind_dir", "wind_speed"], how="inner")
+    df_flights = df_flights.drop(columns=["year", "month", "day", "hour"])
+
+    df_flights = add_route_bearings(df_flights, df_airports)
+    return add_wind_alignment(df_flights)
+
+
+def bearing_polar_figures(df_flights_bearing, n=5):
+    """Polar plots of wind direction and bearing for the first complete rows.
+
+    Shows whether the inner product is affected by the direction of the plane
+    (in air) and the direction of the wind.
+    """
+    figures = []
+    for idx, row in df_flights_bearing.dropna().head(n).iterrows():
+        # Create 1x2 subplot layout
+        fig = make_subplots(
+            rows=1, cols=2,
+            specs=[[{"type": "polar"}, {"type": "polar"}]],
+            # these become annotations
+            subplot_titles=("Wind Direction", "Bearing")
+        )
+
+        # First polar histogram (Wind Direction)
+        fig.add_trace(
+            go.Barpolar(
+                r=[1],
+                theta=[row["wind_dir"]],
+                name="Wind Dir"
+            ),
+            row=1, col=1
+        )
+
+        # Second polar histogram (Bearing)
+        fig.add_trace(
+            go.Barpolar(
+                r=[1],
+                theta=[row["bearing"]],
+                name="Bearing"
+            ),
+            row=1, col=2
+        )
+
+        # Adjust layout (including the main figure title if you want)
+        fig.update_layout(
+            polar=dict(
+                radialaxis=dict(range=[0, 1.2], showticklabels=False, ticks="")
+            ),
+            polar2=dict(
+                radialaxis=dict(range=[0, 1.2], showticklabels=False, ticks="")
+            ),
+            showlegend=False,
+            title={
+                "text": f"From {row['origin']} to {row['dest']}. I.P. {row['innerProd']}",
+                "x": 0.5,
+                "y": 0.95
+            },
+            margin=dict(t=100)
+        )
+
+        # Move each subplot title (annotation) higher
+        # Increase the y-value as needed (e.g., +0.04, +0.05, etc.)
+        for annotation in fig.layout.annotations:
+            annotation.y += 0.05
+
+        figures.append(fig)
+    return figures
+
+
+# find duplicate_flights
+def find_duplicate_flights(db_path=DB_PATH):
+    with sqlite3.connect(db_path) as conn:
+        query = """
+            SELECT year, month, day, origin, dest, sched_dep_time,carrier,tailnum , COUNT(*) AS duplicate_count
+            FROM flights
+            GROUP BY year, month, day, origin, dest, sched_dep_time, carrier,tailnum
+            HAVING duplicate_count > 1;
+        """
+        duplicates = pd.read_sql_query(query, conn)
+    conn.close()
+    return duplicates
+
+# prin duplicate flights 2023-1-10 JFK BOS 840 YX N725MQ
+# print(df_flights[(df_flights['year'] == 2023) & (df_flights['month'] == 1) & (df_flights['day'] == 10) & (df_flights['origin'] == 'JFK') & (df_flights['dest'] == 'BOS')& (df_flights['sched_dep_time'] == 840) & (df_flights['carrier'] == 'YX')])
@@ -0,0 +1,291 @@
+"""Missing values and consistency checks of the flights table (Part 4)."""
+import datetime
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from flightlib.config import DB_PATH
+from flightlib.timezones import fill_missing_tzones
+
+
+def compute_air_time(sched_dep, sched_arr):
+    # Convert scheduled times to 4-digit strings (e.g., 530 -> "0530")
+    dep_str = f"{int(sched_dep):04d}"
+    arr_str = f"{int(sched_arr):04d}"
+
+    # Parse the time strings into datetime objects (using an arbitrary common date)
+    dep_time = datetime.datetime.strptime(dep_str, "%H%M")
+    arr_time = datetime.datetime.strptime(arr_str, "%H%M")
+
+    # If arrival time is earlier than departure time, assume the flight crossed midnight
+    if arr_time < dep_time:
+        arr_time += datetime.timedelta(days=1)
+
+    # Calculate the difference in minutes
+    return (arr_time - dep_time).seconds / 60
+
+
+def fill_missing_values(df_flights):
+    """Fill the missing values of the flights table."""
+    # Fill missing values in 'dep_time' and 'arr_time' with 'sched_dep_time' and 'sched_arr_time'
+    df_flights['dep_time'] = df_flights['dep_time'].fillna(
+        df_flights['sched_dep_time'])
+    df_flights['arr_time'] = df_flights['arr_time'].fillna(
+        df_flights['sched_arr_time'])
+
+    # Fill missing values in 'dep_delay' and 'arr_delay' with 0 (assuming missing indicates no delay)
+    df_flights['dep_delay'] = df_flights['dep_delay'].fillna(0)
+    df_flights['arr_delay'] = df_flights['arr_delay'].fillna(0)
+
+    # Fill missing values in 'tailnum' with "Unknown" (a new category in compact frames)
+    tailnum = df_flights['tailnum']
+    if isinstance(tailnum.dtype, pd.CategoricalDtype) and "Unknown" not in tailnum.cat.categories:
+        tailnum = tailnum.cat.add_categories("Unknown")
+    df_flights['tailnum'] = tailnum.fillna("Unknown")
+
+    # Fill missing values in 'air_time' with the scheduled duration, which
+    # crosses midnight when the arrival is earlier than the departure
+    scheduled = (hhmm_column_to_minutes(df_flights['sched_arr_time'])
+                 - hhmm_column_to_minutes(df_flights['sched_dep_time'])) % 1440
+    df_flights['air_time'] = df_flights['air_time'].fillna(scheduled)
+    return df_flights
+
+
+#####################################################################
+# Checking whether the dat in flights is in order (Part 4)
+#####################################################################
+def new_fix_count():
+    """Counters of the values fixed by fix_times_if_else and fix_air_time."""
+    return {
+        'dep_time': 0, 'dep_delay': 0, 'arr_time': 0, 'arr_delay': 0, 'air_time': 0
+    }
+
+
+def hhmm_to_minutes(hhmm):
+    """Convert HHMM time format to total minutes since midnight."""
+    if pd.isna(hhmm) or hhmm < 0:
+        return None
+    hh = hhmm // 100
+    mm = hhmm % 100
+    return hh * 60 + mm
+
+
+def minutes_to_hhmm(minutes):
+    """Convert total minutes since midnight back to HHMM format, handling midnight wrap."""
+    if pd.isna(minutes) or minutes < 0:
+        return None
+    minutes = minutes % 1440  # Ensure time does not exceed 23:59
+    hh = minutes // 60
+    mm = minutes % 60
+    return hh * 100 + mm if hh > 0 else mm
+
+
+def hhmm_column_to_minutes(hhmm):
+    """hhmm_to_minutes for a whole column; missing and negative values become NaN."""
+    hhmm = pd.to_numeric(hhmm, errors="coerce").astype("float64")
+    hhmm = hhmm.where(hhmm >= 0)
+    return (hhmm // 100) * 60 + hhmm % 100
+
+
+def minutes_column_to_hhmm(minutes):
+    """minutes_to_hhmm for a whole column; missing and negative values become NaN."""
+    minutes = pd.to_numeric(minutes, errors="coerce").astype("float64")
+    minutes = minutes.where(minutes >= 0) % 1440
+    return (minutes // 60) * 100 + minutes % 60
+
+
+# the repair rules of fix_times_if_else and fix_air_time, in the order they are applied
+FIX_RULES = {
+    "time_from_delay": "time missing: scheduled time + delay",
+    "delay_from_time": "delay missing: time - scheduled time",
+    "scheduled_only": "time and delay missing: scheduled time without delay",
+    "air_time": "air_time missing or inconsistent: arrival - departure time",
+}
+
+
+def _set_values(df, col, mask, values):
+    # the fixed values can be missing or fractional, so store them as floats
+    if df[col].dtype != "float64":
+        df[col] = df[col].astype("float64")
+    df.loc[mask, col] = values[mask]
+
+
+def fix_times_if_else(df, time_col, sched_col, delay_col, fix_count):
+    """Fix missing or incorrect departure and arrival times.
+
+    Works on whole columns and returns the number of rows fixed per rule.
+    """
+    time = hhmm_column_to_minutes(df[time_col])
+    sched_time = hhmm_column_to_minutes(df[sched_col])
+    delay = np.trunc(pd.to_numeric(df[delay_col], errors="coerce").astype("float64"))
+
+    has_time, has_sched, has_delay = time.notna(), sched_time.notna(), delay.notna()
+
+    # 1. If all three values exist, the row is left alone
+    # 2. If time is missing but sched_time and delay exist
+    time_from_delay = ~has_time & has_sched & has_delay
+    # 3. If delay is missing but sched_time and time exist
+    delay_from_time = ~has_delay & has_sched & has_time
+    # 4. If both time and delay are missing, use sched_time
+    scheduled_only = ~has_time & ~has_delay & has_sched
+
+    if time_from_delay.any():
+        _set_values(df, time_col, time_from_delay, minutes_column_to_hhmm(sched_time + delay))
+    if delay_from_time.any():
+        _set_values(df, delay_col, delay_from_time, (time - sched_time) % 1440)
+    if scheduled_only.any():
+        _set_values(df, time_col, scheduled_only, minutes_column_to_hhmm(sched_time))
+        _set_values(df, delay_col, scheduled_only, pd.Series(0.0, index=df.index))
+
+    counts = {
+        "time_from_delay": int(time_from_delay.sum()),
+        "delay_from_time": int(delay_from_time.sum()),
+        "scheduled_only": int(scheduled_only.sum()),
+    }
+    fix_count[time_col] += counts["time_from_delay"] + counts["scheduled_only"]
+    fix_count[delay_col] += counts["delay_from_time"] + counts["scheduled_only"]
+    return counts
+
+
+def fix_air_time(df, fix_count):
+    """Fix incorrect or missing air_time values and return the number fixed."""
+    dep_time = hhmm_column_to_minutes(df['dep_time'])
+    arr_time = hhmm_column_to_minutes(df['arr_time'])
+    expected = (arr_time - dep_time) % 1440
+    air_time = np.trunc(pd.to_numeric(df['air_time'], errors="coerce").astype("float64"))
+
+    # rows with both times are fixed unless the air_time already matches them
+    fix = dep_time.notna() & arr_time.notna() & ~(air_time == expected)
+    if fix.any():
+        _set_values(df, 'air_time', fix, expected)
+    fixed = int(fix.sum())
+    fix_count['air_time'] += fixed
+    return fixed
+
+
+def repair_flights(df):
+    """Apply all repair rules to a copy of the flights.
+
+    Returns the repaired flights and a report with the number of rows fixed
+    per step and rule.
+    """
+    df = df.copy()
+    fix_count = new_fix_count()
+    rows = []
+    for step, cols in [("departure", ('dep_time', 'sched_dep_time', 'dep_delay')),
+                       ("arrival", ('arr_time', 'sched_arr_time', 'arr_delay'))]:
+        counts = fix_times_if_else(df, *cols, fix_count)
+        rows += [(step, rule, FIX_RULES[rule], fixed) for rule, fixed in counts.items()]
+    rows.append(("air_time", "air_time", FIX_RULES["air_time"], fix_air_time(df, fix_count)))
+    report = pd.DataFrame(rows, columns=["step", "rule", "description", "fixed"])
+    return df, report
+
+
+def fix_counts_from_report(report):
+    """The per-column fix counts of new_fix_count from a repair_flights report."""
+    fix_count = new_fix_count()
+    for step, rule, _, fixed in report.itertuples(index=False):
+        if step == "air_time":
+            fix_count['air_time'] += fixed
+            continue
+        prefix = "dep" if step == "departure" else "arr"
+        if rule in ("time_from_delay", "scheduled_only"):
+            fix_count[f"{prefix}_time"] += fixed
+        if rule in ("delay_from_time", "scheduled_only"):
+            fix_count[f"{prefix}_delay"] += fixed
+    return fix_count
+
+
+def fix_flight_times(df):
+    """Apply all fixes to a copy of the flights and return it with the fix counts."""
+    df, report = repair_flights(df)
+    return df, fix_counts_from_report(report)
+
+
+# # ADDITIONAL PART : ADD THE UPDATED TIMES TO THE FLIGHTS DATABASE
+TIME_COLUMNS = ['dep_time', 'sched_dep_time', 'dep_delay', 'arr_time',
+                'sched_arr_time', 'arr_delay', 'air_time']
+# a flight number is reused by other carriers and airports in the same hour;
+# year, month, day and hour make up time_hour, whatever type that has in the frame
+KEY_COLUMNS = ['year', 'month', 'day', 'hour', 'carrier', 'flight', 'origin']
+
+
+def _chunk_rows(df, columns, chunk_size):
+    # rows as tuples of Python values with NULL for missing values, one chunk at a time
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size][columns].astype(object)
+        yield list(chunk.where(chunk.notna(), None).itertuples(index=False, name=None))
+
+
+def add_updated_times_to_db(df, db_path=DB_PATH, chunk_size=50_000, only_incomplete=True):
+    """Write the repaired time columns of the flights back to the database.
+
+    The rows are staged in a temporary table with executemany and applied
+    with one set-based UPDATE ... FROM per chunk of ``chunk_size`` rows, each
+    chunk in its own short transaction, so memory use and the time the write
+    lock is held stay bounded. With ``only_incomplete`` only flights that
+    still have a missing time value are updated. Flights are matched on
+    KEY_COLUMNS; flights sharing a key all get the values of one staged row.
+    Returns the number of rows staged and updated, and the throughput.
+    """
+    columns = KEY_COLUMNS + TIME_COLUMNS
+    # "+" keeps the planner off the date index (thousands of flights per day) and
+    # on an automatic index over the staged rows, probed once per flight
+    key_match = " AND ".join(f"+flights.{c} = staged.{c}" for c in KEY_COLUMNS)
+    incomplete = " OR ".join(f"flights.{c} IS NULL OR flights.{c} = ''" for c in TIME_COLUMNS)
+    update_query = f"""
+        UPDATE flights
+        SET {', '.join(f'{c} = staged.{c}' for c in TIME_COLUMNS)}
+        FROM staged_times AS staged
+        WHERE {key_match}{f' AND ({incomplete})' if only_incomplete else ''}
+    """
+    insert_query = f"INSERT INTO staged_times VALUES ({', '.join('?' * len(columns))})"
+
+    report = {'rows_staged': 0, 'rows_updated': 0, 'chunks': 0}
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        # same column types as flights, so the join can use an automatic index
+        conn.execute(f"CREATE TEMP TABLE staged_times AS SELECT {', '.join(columns)} FROM flights WHERE 0")
+        for rows in _chunk_rows(df, columns, chunk_size):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM staged_times")
+                conn.executemany(insert_query, rows)
+                updated = conn.execute(update_query).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            report['rows_staged'] += len(rows)
+            report['rows_updated'] += updated
+            report['chunks'] += 1
+    finally:
+        conn.close()
+
+    report['seconds'] = time.perf_counter() - start
+    report['rows_per_second'] = report['rows_staged'] / report['seconds'] if report['seconds'] else 0.0
+    return report
+
+# add_updated_times_to_db(df)
+
+
+def find_tzone_from_coords(db_path=DB_PATH):
+    '''The function takes the rows with empty tzones and uses the coordinates to find the tzone and insert back to the table'''
+    con = sqlite3.connect(db_path)
+
+    airports_df = pd.read_sql("SELECT * FROM airports", con)
+
+    print(airports_df.isna().sum())
+
+    # one batched lookup through the shared, cached time zone resolver
+    airports_df['tzone'] = fill_missing_tzones(airports_df)
+
+    airports_df.to_sql('airports', con, if_exists='replace', index=False)
+
+    con.close()
+
+# find_tzone_from_coords()
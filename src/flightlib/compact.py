@@ -0,0 +1,119 @@
+"""Compact typed in-memory flights table.
+
+``pd.read_sql_query("SELECT * FROM flights")`` gives float64 columns for
+every number that can be NULL and Python string objects for the codes and
+``time_hour``. The compact loader stores the same values in the smallest
+fitting types instead:
+
+- integral numbers (calendar fields, HHMM times, delays, flight numbers,
+  distances) in the smallest integer type, nullable where values are
+  missing; other numbers in float32
+- carrier, origin, dest and tailnum as categoricals
+- time_hour as datetime64 local time, from text or from epoch seconds (REAL)
+
+Print a memory report comparing both frames with::
+
+    python -m flightlib.compact
+"""
+import numpy as np
+import pandas as pd
+
+from flightlib.config import DB_PATH
+from flightlib.db import connect
+from flightlib.snapshot import read_table
+from flightlib.times import SOURCE_TZ
+
+CATEGORY_COLUMNS = ["carrier", "origin", "dest", "tailnum"]
+DATETIME_COLUMNS = ["time_hour"]
+INT_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def smallest_int_type(values):
+    """The smallest integer dtype holding the values, nullable if any is missing.
+
+    Returns None when the values are not all integral.
+    """
+    values = pd.to_numeric(values, errors="coerce")
+    present = values.dropna()
+    if present.empty or (present % 1 != 0).any():
+        return None
+    lo, hi = present.min(), present.max()
+    for int_type in INT_TYPES:
+        info = np.iinfo(int_type)
+        if info.min <= lo and hi <= info.max:
+            dtype = np.dtype(int_type)
+            return pd.api.types.pandas_dtype(dtype.name.capitalize()) if present.size < values.size else dtype
+    return None
+
+
+def compact_numeric(values):
+    """Numeric column in the smallest integer type, or float32 if not integral."""
+    values = pd.to_numeric(values, errors="coerce")
+    dtype = smallest_int_type(values)
+    return values.astype(dtype) if dtype is not None else values.astype(np.float32)
+
+
+def to_datetime64(values, tz=SOURCE_TZ):
+    """datetime64 local times of text timestamps or of epoch seconds.
+
+    Text is taken as local time as it is; epoch seconds (as stored for R
+    POSIXct values) are UTC and converted to the local time of ``tz``.
+    """
+    numeric = pd.to_numeric(values, errors="coerce")
+    if numeric.notna().sum() == values.notna().sum():
+        utc = pd.to_datetime(numeric, unit="s", utc=True)
+        return utc.dt.tz_convert(tz).dt.tz_localize(None)
+    return pd.to_datetime(values, format="ISO8601", errors="coerce")
+
+
+def compact_flights(flights):
+    """Compact copy of a flights frame with the same columns and values."""
+    columns = {}
+    for name, values in flights.items():
+        if name in CATEGORY_COLUMNS:
+            columns[name] = values.astype("category")
+        elif name in DATETIME_COLUMNS:
+            columns[name] = to_datetime64(values)
+        elif pd.api.types.is_numeric_dtype(values):
+            columns[name] = compact_numeric(values)
+        else:
+            columns[name] = values
+    return pd.DataFrame(columns, index=flights.index)
+
+
+def load_compact_flights(db_path=DB_PATH, columns=None, filters=None):
+    """Load (part of) the flights table as a compact frame.
+
+    The table is read through the Parquet snapshot, so only the requested
+    columns and rows are read.
+    """
+    return compact_flights(read_table("flights", columns, filters, db_path))
+
+
+def load_sql_flights(db_path=DB_PATH):
+    """The flights frame as read_sql_query returns it, for comparison."""
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query("SELECT * FROM flights", conn)
+    finally:
+        conn.close()
+
+
+def memory_report(before, after):
+    """Memory per column of two frames of the same table, in MB."""
+    report = pd.DataFrame({
+        "before_dtype": before.dtypes.astype(str),
+        "before_mb": before.memory_usage(deep=True, index=False) / 2**20,
+        "after_dtype": after.dtypes.astype(str).reindex(before.columns),
+        "after_mb": after.memory_usage(deep=True, index=False).reindex(before.columns) / 2**20,
+    })
+    report.loc["total"] = ["", report["before_mb"].sum(), "", report["after_mb"].sum()]
+    report["ratio"] = report["before_mb"] / report["after_mb"]
+    return report.round({"before_mb": 2, "after_mb": 2, "ratio": 1})
+
+
+if __name__ == "__main__":
+    before = load_sql_flights()
+    after = load_compact_flights()
+    print(f"{len(before)} flights")
+    print(memory_report(before, after).to_string())
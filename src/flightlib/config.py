@@ -0,0 +1,9 @@
+import os
+
+# paths are resolved relative to the repository root, so the package works
+# no matter which directory the scripts are started from
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+DB_PATH = os.path.join(BASE_DIR, "flights_database.db")
+# derived files (snapshots, indexes, ...) that can always be rebuilt
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
@@ -0,0 +1,333 @@
+"""Process-wide shared flights dataset.
+
+Loading the flights table and joining it with airlines, planes, airports and
+weather is by far the most expensive part of a dashboard rerun. The joined
+dataset is therefore built once per process and shared between all sessions;
+each session only receives a cheap, date-filtered slice of it.
+
+Flights appended by the background writer (flightlib.writer) are read,
+joined and merged into the shared dataset on their own, and changed planes
+are gathered again, so new rows do not reload the whole dataset.
+"""
+import datetime
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from flightlib.config import DB_PATH
+from flightlib.db import connect, table_version
+from flightlib.routes import RouteTable, get_routes
+from flightlib.snapshot import match_dtypes, read_rows, read_table
+from flightlib.speeds import MI_PER_MIN_TO_KMH
+from flightlib.weather import WeatherCube, get_weather_cube
+from flightlib.writer import appended_rowids
+
+# tables joined into the dataset; a change to any of them reloads it
+DATASET_TABLES = ("flights", "airlines", "planes", "airports", "weather")
+DIMENSION_TABLES = ("airlines", "planes", "airports")
+
+_shared = {}
+_lock = threading.Lock()
+
+
+def process_rss_bytes():
+    """Return the resident memory of the current process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # not on Linux, fall back to the peak resident size
+        import resource
+        import sys
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+# columns used by the dashboard pages; everything else stays in the database
+FLIGHT_COLUMNS = [
+    'year', 'month', 'day', 'hour', 'dep_delay', 'carrier', 'tailnum',
+    'origin', 'dest', 'air_time', 'distance',
+]
+PLANE_COLUMNS = ['tailnum', 'year', 'type', 'manufacturer', 'model', 'speed']
+WEATHER_COLUMNS = ['origin', 'year', 'month', 'day', 'hour', 'wind_dir', 'wind_speed']
+WEATHER_VARIABLES = ['wind_dir', 'wind_speed']
+ROUTE_COLUMNS = ['origin_name', 'origin_lat', 'origin_lon', 'dest_name', 'dest_lat', 'dest_lon']
+
+
+def date_range_clause(start_date, end_date, alias=None):
+    """Return a WHERE clause and its parameters for an inclusive date range.
+
+    The row-value comparison lets SQLite answer it from an index on
+    (year, month, day) instead of scanning the whole table. ``alias``
+    qualifies the columns when the query joins several tables.
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    prefix = f"{alias}." if alias else ""
+    clause = f"({prefix}year, {prefix}month, {prefix}day) BETWEEN (?, ?, ?) AND (?, ?, ?)"
+    params = (start_date.year, start_date.month, start_date.day,
+              end_date.year, end_date.month, end_date.day)
+    return clause, params
+
+
+def read_flights(conn, start_date, end_date, columns=FLIGHT_COLUMNS):
+    """Read only the requested columns of the flights in a date range."""
+    clause, params = date_range_clause(start_date, end_date)
+    query = f"SELECT {', '.join(columns)} FROM flights WHERE {clause}"
+    return pd.read_sql_query(query, conn, params=params)
+
+
+def read_weather(conn, start_date, end_date, origins, columns=WEATHER_COLUMNS):
+    """Read only the requested columns of the weather in a date range.
+
+    Restricting the origins lets SQLite seek into the (origin, year, month,
+    day, hour) index once per origin.
+    """
+    origins = list(origins)
+    clause, params = date_range_clause(start_date, end_date)
+    query = f"""
+        SELECT {', '.join(columns)} FROM weather
+        WHERE origin IN ({', '.join(['?'] * len(origins))}) AND {clause}
+    """
+    return pd.read_sql_query(query, conn, params=origins + list(params))
+
+
+def read_dimensions(conn):
+    """Read the small lookup tables the flights are joined with."""
+    return {
+        "airlines": pd.read_sql_query("SELECT carrier, name FROM airlines", conn),
+        "planes": pd.read_sql_query(f"SELECT {', '.join(PLANE_COLUMNS)} FROM planes", conn),
+        "airports": pd.read_sql_query("SELECT faa, name, lat, lon FROM airports", conn),
+    }
+
+
+def join_flights(flights_df, dimensions, weather):
+    """Join flights with airlines, planes, airports and weather.
+
+    The airports come from the route table in ``dimensions["routes"]`` (one
+    is built for the flights if it is missing or lacks some of their routes).
+    ``weather`` is a WeatherCube; the weather of every flight is gathered
+    from it by origin and hour instead of merged.
+    """
+    airlines_df = dimensions["airlines"]
+    planes_df = dimensions["planes"]
+
+    flights_df = flights_df.merge(airlines_df, on='carrier', how='left', suffixes=('', '_airline'))
+    flights_df = flights_df.rename(columns={"name": "name_airline"})
+    flights_df = flights_df.merge(planes_df, on='tailnum', how='left', suffixes=('', '_plane'))
+    # the airports of both ends are gathered per route instead of merged twice
+    routes = dimensions.get("routes")
+    if routes is None or not routes.covers(flights_df['origin'], flights_df['dest']):
+        routes = RouteTable(flights_df[['origin', 'dest']], dimensions["airports"])
+    flights_df = routes.attach(flights_df, ROUTE_COLUMNS)
+    flights_df = weather.attach(flights_df, WEATHER_VARIABLES)
+
+    # columns that only depend on the row itself are computed once here
+    flights_df['flight_date'] = pd.to_datetime(flights_df[['year', 'month', 'day']])
+    flights_df['distance_km'] = flights_df['distance'] * 1.60934
+    # average speed of the plane, stored in planes.speed in miles per minute
+    flights_df['speed'] = flights_df['speed'] * MI_PER_MIN_TO_KMH
+
+    # sorting by date turns every date-range filter into a contiguous slice
+    flights_df = flights_df.sort_values('flight_date', kind='stable').reset_index(drop=True)
+    return flights_df
+
+
+def attach_planes(flights_df, planes_df):
+    """Copy of joined flights with the plane columns gathered again from planes_df."""
+    planes = planes_df.drop_duplicates('tailnum')
+    # factorize first, so only the distinct tailnums are looked up
+    codes, uniques = pd.factorize(flights_df['tailnum'])
+    positions = np.append(pd.Index(planes['tailnum']).get_indexer(uniques), -1)[codes]
+    columns = {}
+    for column in PLANE_COLUMNS[1:]:
+        # the same names the merge in join_flights gives them
+        name = f"{column}_plane" if column in FLIGHT_COLUMNS else column
+        columns[name] = planes[column].array.take(positions, allow_fill=True)
+    columns['speed'] = columns['speed'] * MI_PER_MIN_TO_KMH
+    return match_dtypes(flights_df.assign(**columns), flights_df)
+
+
+def load_joined_flights(conn, start_date, end_date, dimensions=None, weather=None):
+    """Load the flights in a date range joined with all dimension tables.
+
+    Without a WeatherCube only the weather of the range is read into one.
+    """
+    if dimensions is None:
+        dimensions = read_dimensions(conn)
+    flights_df = read_flights(conn, start_date, end_date)
+    if weather is None:
+        weather = WeatherCube(read_weather(conn, start_date, end_date, flights_df['origin'].dropna().unique()),
+                              WEATHER_VARIABLES)
+    return join_flights(flights_df, dimensions, weather)
+
+
+class FlightDataset:
+    """Joined flights of one year, shared read-only between sessions."""
+
+    def __init__(self, flights, version=None):
+        self.flights = flights
+        self.version = version
+        self.loaded_at = datetime.datetime.now()
+        self._dates = flights['flight_date'].to_numpy()
+
+    def between(self, start_date, end_date):
+        """Return the flights between two dates (inclusive).
+
+        The result is a slice of the shared frame and must be treated as
+        read-only; copy it before modifying it in place.
+        """
+        lo = np.searchsorted(self._dates, np.datetime64(pd.Timestamp(start_date)), side='left')
+        hi = np.searchsorted(self._dates, np.datetime64(pd.Timestamp(end_date)), side='right')
+        return self.flights.iloc[lo:hi]
+
+    def memory_report(self):
+        """Describe the memory held by the dataset and by the process."""
+        frame_bytes = int(self.flights.memory_usage(deep=True).sum())
+        return {
+            "rows": len(self.flights),
+            "columns": self.flights.shape[1],
+            "dataset_mb": round(frame_bytes / 2**20, 1),
+            "process_rss_mb": round(process_rss_bytes() / 2**20, 1),
+            "loaded_at": self.loaded_at.isoformat(timespec="seconds"),
+        }
+
+
+def load_dataset(db_path=DB_PATH, year=2023):
+    """Build a new FlightDataset from the columnar snapshot of the database."""
+    version = table_version(db_path, *DATASET_TABLES)
+    year_filter = [("year", "==", year)]
+    flights_df = read_table("flights", FLIGHT_COLUMNS, year_filter, db_path)
+    flights = join_flights(flights_df, get_shared_dimensions(db_path), get_weather_cube(db_path))
+    return FlightDataset(flights, version)
+
+
+def _merge_sorted(flights, added):
+    # the added rows go after the flights of the same date, like a stable sort of
+    # both, but the frame is only copied once instead of sorted again
+    added = added.sort_values('flight_date', kind='stable')
+    positions = np.searchsorted(flights['flight_date'].to_numpy(), added['flight_date'].to_numpy(),
+                                side='right')
+    pieces, previous = [], 0
+    for run in np.split(np.arange(len(added)), np.flatnonzero(np.diff(positions)) + 1):
+        position = positions[run[0]]
+        pieces += [flights.iloc[previous:position], added.iloc[run]]
+        previous = position
+    pieces.append(flights.iloc[previous:])
+    return pd.concat(pieces, ignore_index=True)
+
+
+def update_dataset(dataset, version, db_path=DB_PATH, year=2023):
+    """A FlightDataset with the changes since ``dataset`` was loaded, or None.
+
+    Only flights appended by the background writer and changed planes can
+    be applied; any other change needs a full reload.
+    """
+    before = dict(zip(DATASET_TABLES, dataset.version))
+    after = dict(zip(DATASET_TABLES, version))
+    changed = {table for table in DATASET_TABLES if before[table] != after[table]}
+    if not changed <= {"flights", "planes"}:
+        return None
+    ranges = appended_rowids(db_path, "flights", before["flights"], after["flights"])
+    if ranges is None:
+        return None
+    flights = dataset.flights
+    dimensions = get_shared_dimensions(db_path)
+    if "planes" in changed:
+        flights = attach_planes(flights, dimensions["planes"])
+    if ranges:
+        added = read_rows("flights", ranges, FLIGHT_COLUMNS, db_path)
+        added = added[added["year"] == year]
+        if len(added):
+            added = join_flights(match_dtypes(added, flights), dimensions, get_weather_cube(db_path))
+            flights = _merge_sorted(flights, match_dtypes(added, flights))
+            # a new route renumbers the routes after it
+            flights = flights.assign(route_id=dimensions["routes"].ids(flights['origin'], flights['dest']))
+    return FlightDataset(flights, version)
+
+
+def get_shared_dataset(db_path=DB_PATH, year=2023):
+    """Return the process-wide dataset, loading it on first use.
+
+    The dataset is updated (see update_dataset) or reloaded when one of its
+    tables changes. Concurrent callers wait for a single load instead of
+    each loading their own copy.
+    """
+    key = (os.path.abspath(db_path), year)
+    version = table_version(db_path, *DATASET_TABLES)
+    dataset = _shared.get(key)
+    if dataset is not None and dataset.version == version:
+        return dataset
+    with _lock:
+        dataset = _shared.get(key)
+        if dataset is None or dataset.version != version:
+            updated = None if dataset is None else update_dataset(dataset, version, db_path, year)
+            dataset = updated or load_dataset(db_path, year)
+            _shared[key] = dataset
+    return dataset
+
+
+def get_shared_dimensions(db_path=DB_PATH):
+    """Return the process-wide airlines, planes and airports tables.
+
+    The route table is added on every call, since it also changes with the
+    flights and is cached by flightlib.routes itself.
+    """
+    key = (os.path.abspath(db_path), "dimensions")
+    version = table_version(db_path, *DIMENSION_TABLES)
+    cached = _shared.get(key)
+    if cached is None or cached[0] != version:
+        cached = (version, {
+            "airlines": read_table("airlines", ["carrier", "name"], db_path=db_path),
+            "planes": read_table("planes", PLANE_COLUMNS, db_path=db_path),
+            "airports": read_table("airports", ["faa", "name", "lat", "lon"], db_path=db_path),
+        })
+        _shared[key] = cached
+    return dict(cached[1], routes=get_routes(db_path))
+
+
+def join_pending_flights(pending, start_date, end_date, db_path=DB_PATH):
+    """Join the flights that are not written to the database yet, like the dataset.
+
+    ``pending`` holds raw flights rows (see flightlib.writer); only the ones
+    in the date range are returned, None if there are none.
+    """
+    if pending.empty:
+        return None
+    pending = pending[FLIGHT_COLUMNS].copy()
+    numeric = [c for c in FLIGHT_COLUMNS if c not in ('carrier', 'tailnum', 'origin', 'dest')]
+    pending[numeric] = pending[numeric].apply(pd.to_numeric, errors='coerce')
+    dates = pd.to_datetime(pending[['year', 'month', 'day']], errors='coerce')
+    in_range = dates.between(pd.Timestamp(start_date), pd.Timestamp(end_date))
+    pending = pending[in_range]
+    if pending.empty:
+        return None
+    return join_flights(pending, get_shared_dimensions(db_path), get_weather_cube(db_path))
+
+
+def add_pending_flights(flights, pending, start_date, end_date, db_path=DB_PATH):
+    """Append flights that are not written to the database yet to a slice.
+
+    The pending flights in the date range are joined like the dataset and
+    appended, so the shared dataset itself does not have to be reloaded to
+    show them.
+    """
+    joined = join_pending_flights(pending, start_date, end_date, db_path)
+    if joined is None:
+        return flights
+    return pd.concat([flights, joined], ignore_index=True)
+
+
+def load_window(start_date, end_date, db_path=DB_PATH):
+    """Load the joined flights of a short date range straight from SQLite.
+
+    Only the rows and columns of the range are read; the dimension tables
+    and the weather cube come from the process-wide caches.
+    """
+    dimensions = get_shared_dimensions(db_path)
+    conn = connect(db_path)
+    try:
+        return load_joined_flights(conn, start_date, end_date, dimensions, get_weather_cube(db_path))
+    finally:
+        conn.close()
@@ -0,0 +1,110 @@
+import os
+import pathlib
+import sqlite3
+
+from flightlib.config import DB_PATH
+
+# tables whose changes are counted in table_versions
+VERSIONED_TABLES = ["flights", "airlines", "airports", "planes", "weather"]
+
+# last table versions per database, reused while the file is unchanged
+_versions = {}
+
+
+def connect(db_path=DB_PATH):
+    """Open a connection to the flights database."""
+    return sqlite3.connect(db_path)
+
+
+def database_version(db_path=DB_PATH):
+    """Return a value that changes whenever the database file changes.
+
+    The modification time and size of the database file (and of its WAL file,
+    if there is one) are used, so no query has to be run to detect changes.
+    """
+    version = []
+    # SQLite keeps the WAL file next to the real file when db_path is a symlink
+    db_path = os.path.realpath(db_path)
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        version.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+def _version_triggers(table):
+    return [f"{table}_version_{event.lower()}" for event in ("INSERT", "UPDATE", "DELETE")]
+
+
+def create_table_versions(conn):
+    """Count the changes of every versioned table in table_versions.
+
+    One counter per table is increased by triggers on every inserted,
+    updated or deleted row. The ``_database`` row holds a random id, so two
+    databases with the same counters still have different versions.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO table_versions VALUES ('_database', random())")
+    script = []
+    for table in VERSIONED_TABLES:
+        conn.execute("INSERT OR IGNORE INTO table_versions (name) VALUES (?)", (table,))
+        for trigger, event in zip(_version_triggers(table), ("INSERT", "UPDATE", "DELETE")):
+            script.append(f"""
+                DROP TRIGGER IF EXISTS {trigger};
+                CREATE TRIGGER {trigger} AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END;""")
+    conn.executescript("".join(script))
+
+
+def table_versions(db_path=DB_PATH, tables=VERSIONED_TABLES):
+    """Return a value per table that changes whenever that table changes.
+
+    Unlike database_version, a write to one table leaves the versions of the
+    others alone, so caches of the weather or the airports survive new
+    flights. Tables without their version triggers (a database that was not
+    migrated, or a table that was dropped and created again) fall back to
+    the version of the whole file. Any schema change changes every version.
+    """
+    file_version = ("file",) + database_version(db_path)
+    key = (os.path.abspath(db_path), tuple(tables))
+    cached = _versions.get(key)
+    if cached is not None and cached[0] == file_version:
+        return cached[1]
+    try:
+        uri = pathlib.Path(os.path.abspath(db_path)).as_uri()
+        conn = sqlite3.connect(uri + "?mode=ro", uri=True)
+    except sqlite3.Error:
+        return {table: file_version for table in tables}
+    try:
+        counters = dict(conn.execute("SELECT name, version FROM table_versions"))
+        triggers = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+        schema = conn.execute("PRAGMA schema_version").fetchone()[0]
+    except sqlite3.Error:
+        return {table: file_version for table in tables}
+    finally:
+        conn.close()
+    versions = {}
+    for table in tables:
+        counted = table in counters and triggers.issuperset(_version_triggers(table))
+        if counted and "_database" in counters:
+            versions[table] = ("table", counters["_database"], schema, counters[table])
+        else:
+            versions[table] = file_version
+    _versions[key] = (file_version, versions)
+    return versions
+
+
+def table_version(db_path, *tables):
+    """The combined version of one or more tables (see table_versions)."""
+    versions = table_versions(db_path, tables)
+    return tuple(versions[table] for table in tables)
@@ -0,0 +1,147 @@
+"""Process-wide cache of built figures and computed aggregates.
+
+Most dashboard reruns only change what is written on the page (the language
+selectbox) or how it is shown (the US/World map radio), not the data. The
+figures and aggregates are therefore cached under keys made of the inputs
+that affect the data (page, date range, filters, route and database
+version); titles, labels and map positions are applied to a fresh copy
+after the lookup, which is cheap.
+
+Figures are stored as their JSON spec, so every hit returns a new Figure
+that can be relabeled without touching the cached one. Entries are evicted
+least recently used first once the cache holds more than ``max_bytes``.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+DEFAULT_MAX_BYTES = 64 * 2**20
+
+
+class _FigureSpec(str):
+    """JSON spec of a cached figure."""
+
+
+def estimate_bytes(value):
+    """Approximate memory held by a cached value."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_bytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def frame_key(df):
+    """Cache key part that changes whenever the rows of a frame change."""
+    if df.empty:
+        return 0, 0
+    return len(df), int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+class FigureCache:
+    """LRU cache with a memory cap and hit, miss and eviction counters."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _store(self, key, value):
+        size = estimate_bytes(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return  # larger than the whole cache; built again next time
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def get(self, key, build):
+        """The cached value of key, built with ``build()`` on a miss.
+
+        Figures come back as a new Figure on every call; other values
+        (frames, dicts of aggregates) are shared and must not be modified.
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            value = build()
+            if isinstance(value, go.Figure):
+                spec = _FigureSpec(value.to_json())
+                self._store(key, spec)
+                return value
+            self._store(key, value)
+            return value
+        value = entry[0]
+        if isinstance(value, _FigureSpec):
+            return pio.from_json(str(value))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Entries, memory use and the hit, miss and eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "mb": round(self._bytes / 2**20, 2),
+                "max_mb": round(self.max_bytes / 2**20, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_figure_cache(max_bytes=None):
+    """The cache shared by all sessions of this process.
+
+    ``max_bytes`` sets the memory cap (DEFAULT_MAX_BYTES if it was never
+    given); a new cap applies from the next insert on.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = FigureCache(max_bytes or DEFAULT_MAX_BYTES)
+        elif max_bytes is not None:
+            _shared.max_bytes = max_bytes
+        return _shared
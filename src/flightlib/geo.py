@@ -0,0 +1,201 @@
+"""Distances, bearings and angles on the earth's surface.
+
+The distance functions take scalars or arrays (NumPy arrays, pandas Series)
+of coordinates in decimal degrees, broadcast them against each other and
+return distances in km as float arrays, so whole columns are processed at
+once.
+"""
+import math
+
+import numpy as np
+
+R = 6378.1370  # in kilometeres
+
+# WGS-84 ellipsoid, used by ellipsoidal_km
+WGS84_A = 6378.137  # semi-major axis in km
+WGS84_F = 1 / 298.257223563  # flattening
+WGS84_B = WGS84_A * (1 - WGS84_F)  # semi-minor axis in km
+
+
+def _as_radians(*values):
+    return [np.radians(np.asarray(v, dtype=float)) for v in values]
+
+
+def haversine_km(lat1, lon1, lat2, lon2, radius=R):
+    """Great-circle distance on a sphere."""
+    lat1, lon1, lat2, lon2 = _as_radians(lat1, lon1, lat2, lon2)
+    h = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * radius * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+def euclidean_km(lat1, lon1, lat2, lon2):
+    """Flat-earth distance, scaling longitude by the mean latitude."""
+    lat1, lon1, lat2, lon2 = (np.asarray(v, dtype=float) for v in (lat1, lon1, lat2, lon2))
+    lat_scale = 111.32  # 1 degree of latitude ≈ 111.32 km
+    lon_scale = 111.32 * np.cos(np.radians((lat1 + lat2) / 2))  # Adjust for longitude
+    lat_diff_km = np.abs(lat2 - lat1) * lat_scale
+    lon_diff_km = np.abs(lon2 - lon1) * lon_scale
+    return np.sqrt(lat_diff_km**2 + lon_diff_km**2)
+
+
+def ellipsoidal_km(lat1, lon1, lat2, lon2, max_iter=200, tol=1e-12):
+    """Distance on the WGS-84 ellipsoid (Vincenty's inverse formula).
+
+    Agrees with geopy's geodesic to well below a metre. The few nearly
+    antipodal pairs for which the iteration does not converge fall back to
+    the haversine distance.
+    """
+    a, b, f = WGS84_A, WGS84_B, WGS84_F
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*_as_radians(lat1, lon1, lat2, lon2))
+    u1 = np.arctan((1 - f) * np.tan(lat1))
+    u2 = np.arctan((1 - f) * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+    big_l = lon2 - lon1
+
+    def terms(lam):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.sqrt((cos_u2 * sin_lam) ** 2
+                            + (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam) ** 2)
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # equatorial lines have cos2_alpha == 0
+            cos_2sm = np.where(cos2_alpha == 0, 0.0,
+                               cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+        return sin_sigma, cos_sigma, sigma, sin_alpha, cos2_alpha, cos_2sm
+
+    lam = big_l.copy()
+    converged = np.zeros(lam.shape, dtype=bool)
+    for _ in range(max_iter):
+        sin_sigma, cos_sigma, sigma, sin_alpha, cos2_alpha, cos_2sm = terms(lam)
+        c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        lam_new = big_l + (1 - c) * f * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sm + c * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+        with np.errstate(invalid="ignore"):
+            converged = converged | (np.abs(lam_new - lam) < tol)
+        lam = np.where(converged, lam, lam_new)
+        if converged.all():
+            break
+
+    sin_sigma, cos_sigma, sigma, sin_alpha, cos2_alpha, cos_2sm = terms(lam)
+    u_sq = cos2_alpha * (a ** 2 - b ** 2) / b ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (cos_2sm + big_b / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sm ** 2)
+        - big_b / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)))
+    distance = b * big_a * (sigma - delta_sigma)
+
+    diverged = ~converged & ~np.isnan(lam)
+    if diverged.any():
+        fallback = haversine_km(np.degrees(lat1), np.degrees(lon1),
+                                np.degrees(lat2), np.degrees(lon2), radius=6371.0088)
+        distance = np.where(diverged, fallback, distance)
+    return distance
+
+
+DISTANCE_METHODS = {
+    "haversine": haversine_km,
+    "euclidean": euclidean_km,
+    "ellipsoid": ellipsoidal_km,
+}
+
+
+def distance_km(lat1, lon1, lat2, lon2, method="haversine"):
+    """Distance in km with one of the methods in DISTANCE_METHODS."""
+    try:
+        kernel = DISTANCE_METHODS[method]
+    except KeyError:
+        raise ValueError(f"Unknown distance method '{method}', "
+                         f"expected one of {sorted(DISTANCE_METHODS)}.") from None
+    return kernel(lat1, lon1, lat2, lon2)
+
+
+def compute_geo_distance(lat1, lon1, lat2, lon2):
+    """Scalar haversine distance in km, kept for the old callers."""
+    return float(haversine_km(lat1, lon1, lat2, lon2))
+
+
+# Computation of the flying direction (bearing) from New York to destination
+# airport. Then compute the inner product between flight direction and wind direction.
+def inner_product_angle(angle1, angle2):
+    """
+    Returns a scalar value between -1 and 1.
+    """
+    # Convert degrees to radians
+    rad1 = math.radians(angle1)
+    rad2 = math.radians(angle2)
+
+    # Dot product of two unit vectors in 2D:
+    #   (sin(rad1), cos(rad1)) dot (sin(rad2), cos(rad2))
+    # = sin(rad1)*sin(rad2) + cos(rad1)*cos(rad2)
+    # = cos(rad1 - rad2)
+    return math.cos(rad1 - rad2)
+
+
+def calculate_compass_bearing(pointA, pointB):
+    """
+    Calculates the bearing between two points.
+
+    Parameters:
+        pointA: tuple of (latitude, longitude) in decimal degrees for the start point.
+        pointB: tuple of (latitude, longitude) in decimal degrees for the destination.
+
+    Returns:
+        The bearing in degrees (from north being 0°).
+    """
+    lat1, lon1 = pointA
+    lat2, lon2 = pointB
+
+    lat1 = math.radians(lat1)
+    lat2 = math.radians(lat2)
+    diff_long = math.radians(lon2 - lon1)
+
+    x = math.sin(diff_long) * math.cos(lat2)
+    y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * \
+        math.cos(lat2) * math.cos(diff_long)
+
+    initial_bearing = math.atan2(x, y)
+
+    initial_bearing = math.degrees(initial_bearing)
+
+    compass_bearing = (initial_bearing + 360) % 360
+
+    return compass_bearing
+
+
+def compass_bearing(lat1, lon1, lat2, lon2):
+    """Vectorized calculate_compass_bearing: initial bearing in degrees from north."""
+    lat1, lon1, lat2, lon2 = _as_radians(lat1, lon1, lat2, lon2)
+    diff_long = lon2 - lon1
+    x = np.sin(diff_long) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(diff_long)
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+
+def wind_alignment(wind_dir, bearing, wind_speed=1.0):
+    """Inner product, headwind and tailwind of the wind along the flight direction.
+
+    wind_dir is the direction the wind blows from, as in the weather table, so
+    a positive inner product means the plane flies into the wind. The headwind
+    and tailwind are the non-negative wind components (in the units of
+    wind_speed) against and with the flight direction.
+    """
+    inner = np.cos(np.radians(np.asarray(wind_dir, dtype=float) - np.asarray(bearing, dtype=float)))
+    along = np.asarray(wind_speed, dtype=float) * inner
+    return inner, np.clip(along, 0, None), np.clip(-along, 0, None)
+
+
+# Example case: Compute bearing angle between Amsterdam and Berlin.
+# Amsterdam Schiphol Airport: (52.3105, 4.7683)
+# Berlin Brandenburg Airport: (52.366667, 13.503333)
+# schiphol = (52.3105, 4.7683)
+# berlin = (52.366667, 13.503333)
+
+# bearing = calculate_compass_bearing(schiphol, berlin)
+# print(
+#     f"The initial bearing from Schiphol Airport to Berlin Brandenburg Airport is {bearing:.1f}°")
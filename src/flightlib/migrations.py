@@ -0,0 +1,65 @@
+"""Schema migrations for flights_database.db.
+
+Every migration is applied once, in order. The number of applied migrations
+is kept in SQLite's ``user_version`` pragma, so running ``migrate`` again is
+cheap and does nothing when the database is up to date.
+
+Run all pending migrations with::
+
+    python -m flightlib.migrations
+"""
+import sqlite3
+
+from flightlib.config import DB_PATH
+from flightlib.db import connect, create_table_versions
+from flightlib.speeds import add_plane_speeds
+from flightlib.summary import create_summary_tables
+
+
+def create_date_indexes(conn):
+    """Indexes used by the date-range queries of the dashboard."""
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_flights_date
+        ON flights (year, month, day)
+    """)
+    # the wind columns make this a covering index for the dashboard query,
+    # so the weather table itself is never read
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_weather_origin_hour
+        ON weather (origin, year, month, day, hour, wind_dir, wind_speed)
+    """)
+
+
+MIGRATIONS = [
+    create_date_indexes,
+    create_summary_tables,
+    add_plane_speeds,
+    create_table_versions,
+]
+
+
+def migrate(db_path=DB_PATH):
+    """Apply all pending migrations and return the number applied.
+
+    Read-only databases are left untouched.
+    """
+    conn = connect(db_path)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        pending = MIGRATIONS[version:]
+        for number, migration in enumerate(pending, start=version + 1):
+            with conn:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+        return len(pending)
+    except sqlite3.OperationalError as e:
+        if "readonly" in str(e):
+            return 0
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    applied = migrate()
+    print(f"Applied {applied} migration(s) to {DB_PATH}")
@@ -0,0 +1,173 @@
+"""Precomputed distances and bearings between all pairs of airports.
+
+The distance and the initial bearing between every two airports are stored
+in one float32 array of shape ``(2, n, n)`` (distance in km, bearing in
+degrees), saved as ``.npy`` in the cache directory and memory-mapped when
+it is loaded, so an airport-to-airport lookup is an index into the array.
+About 1,250 airports take 12 MB.
+
+The file name holds a hash of the airport codes and coordinates, so the
+matrix is only rebuilt when the airports change. Build the matrix of the
+database airports ahead of time with::
+
+    python -m flightlib.pairs
+"""
+import glob
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from flightlib.config import CACHE_DIR, DB_PATH
+from flightlib.geo import compass_bearing, distance_km
+from flightlib.spatial import airports_key
+
+MATRIX_FORMAT = 1
+# rows computed at once, bounding the float64 temporaries of the distance kernels
+BLOCK_ROWS = 128
+# matrices of other airport sets kept on disk per distance method
+MAX_STORED = 4
+MAX_SHARED = 4
+
+_shared = OrderedDict()
+_lock = threading.Lock()
+
+
+class AirportMatrix:
+    """Distances (km) and bearings (degrees) between all pairs of airports."""
+
+    def __init__(self, codes, values):
+        self.codes = pd.Index(codes)
+        self.values = values
+        self._positions = {code: i for i, code in enumerate(self.codes)}
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def distance_km(self):
+        return self.values[0]
+
+    @property
+    def bearing_deg(self):
+        return self.values[1]
+
+    def positions(self, codes):
+        """Positions of airport codes in the matrix, -1 for unknown codes."""
+        if np.ndim(codes) == 0:
+            return self._positions.get(codes, -1)
+        codes, uniques = pd.factorize(pd.Series(codes))
+        return np.append(self.codes.get_indexer(uniques), -1)[codes]
+
+    def _lookup(self, layer, origin, dest):
+        o, d = self.positions(origin), self.positions(dest)
+        if np.ndim(o) == 0:
+            return float(self.values[layer, o, d]) if o >= 0 and d >= 0 else float("nan")
+        found = (o >= 0) & (d >= 0)
+        values = self.values[layer, np.maximum(o, 0), np.maximum(d, 0)]
+        return np.where(found, values, np.float32(np.nan))
+
+    def distance(self, origin, dest):
+        """Distance in km between airports (NaN for unknown codes)."""
+        return self._lookup(0, origin, dest)
+
+    def bearing(self, origin, dest):
+        """Initial bearing in degrees from origin to dest (NaN for unknown codes)."""
+        return self._lookup(1, origin, dest)
+
+
+def compute_matrix(lat, lon, method="haversine"):
+    """The (2, n, n) float32 distance and bearing array of the coordinates."""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    values = np.empty((2, len(lat), len(lat)), dtype=np.float32)
+    for start in range(0, len(lat), BLOCK_ROWS):
+        rows = slice(start, start + BLOCK_ROWS)
+        lat1, lon1 = lat[rows, None], lon[rows, None]
+        values[0, rows] = distance_km(lat1, lon1, lat[None, :], lon[None, :], method)
+        values[1, rows] = compass_bearing(lat1, lon1, lat[None, :], lon[None, :])
+    return values
+
+
+def _matrix_path(key, method):
+    n, digest = key
+    return os.path.join(CACHE_DIR, "pairs", f"{method}-{n}-{digest & (2**64 - 1):016x}.npy")
+
+
+def _read_matrix(path, codes):
+    try:
+        with open(path + ".json") as f:
+            stamp = json.load(f)
+        if stamp != {"format": MATRIX_FORMAT, "codes": codes}:
+            return None
+        return np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+
+def _write_matrix(path, codes, values):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, values)
+        os.replace(path + ".tmp", path)
+        with open(path + ".json.tmp", "w") as f:
+            json.dump({"format": MATRIX_FORMAT, "codes": codes}, f)
+        os.replace(path + ".json.tmp", path + ".json")
+    except OSError:
+        return values  # a read-only cache only costs a rebuild next time
+    _prune(path)
+    return np.load(path, mmap_mode="r")
+
+
+def _prune(path):
+    # drop the oldest matrices of other airport sets
+    method = os.path.basename(path).split("-")[0]
+    stored = sorted(glob.glob(os.path.join(os.path.dirname(path), f"{method}-*.npy")),
+                    key=os.path.getmtime, reverse=True)
+    for old in stored[MAX_STORED:]:
+        for name in (old, old + ".json"):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+
+def load_matrix(airports, method="haversine"):
+    """The matrix of these airports, from disk or freshly built and stored."""
+    airports = airports.drop_duplicates("faa")
+    codes = airports["faa"].astype(str).tolist()
+    path = _matrix_path(airports_key(airports, ["faa", "lat", "lon"]), method)
+    values = _read_matrix(path, codes)
+    if values is None:
+        values = _write_matrix(path, codes, compute_matrix(airports["lat"], airports["lon"], method))
+    return AirportMatrix(codes, values)
+
+
+def get_airport_matrix(airports, method="haversine"):
+    """Return the shared matrix of these airports, loading or building it if needed.
+
+    ``method`` is one of the distance methods of flightlib.geo; the bearing
+    is the same for all of them.
+    """
+    key = (airports_key(airports, ["faa", "lat", "lon"]), method)
+    with _lock:
+        matrix = _shared.get(key)
+        if matrix is None:
+            matrix = load_matrix(airports, method)
+            _shared[key] = matrix
+            while len(_shared) > MAX_SHARED:
+                _shared.popitem(last=False)
+        else:
+            _shared.move_to_end(key)
+    return matrix
+
+
+if __name__ == "__main__":
+    from flightlib.airports import load_clean_airports_db
+    matrix = load_matrix(load_clean_airports_db(DB_PATH), method="ellipsoid")
+    print(f"{len(matrix)} airports, {matrix.values.nbytes / 2**20:.1f} MB in "
+          f"{getattr(matrix.values, 'filename', 'memory')}")
@@ -0,0 +1,75 @@
+"""The analysis pipelines of flights.py, run only when called.
+
+Each pipeline returns its results instead of storing them in module
+globals, so they can be reused from the dashboard and from batch jobs.
+"""
+from flightlib.airports import (add_jfk_distances, airport_maps,
+                                load_clean_airports, plot_airport_overview,
+                                plot_jfk_distances)
+from flightlib.analysis import (bearing_polar_figures, compare_distances,
+                                find_duplicate_flights, generate_bearing_df,
+                                get_flight_statistics,
+                                nyc_origin_airports, plot_distance_comparison)
+from flightlib.cleaning import (fill_missing_values, fix_counts_from_report,
+                                repair_flights)
+from flightlib.compact import load_compact_flights
+from flightlib.config import DB_PATH
+from flightlib.routes import audit_distances
+from flightlib.times import flights_with_dtime_objects, local_flight_times
+
+
+def airports_pipeline(plots=True):
+    """Part 1, 2: clean airports.csv and explore it."""
+    df = load_clean_airports()
+    df = add_jfk_distances(df)
+    results = {"airports": df}
+    if plots:
+        plot_airport_overview(df)
+        plot_jfk_distances(df)
+        results["fig_global"], results["fig_us"] = airport_maps(df)
+    return results
+
+
+def database_pipeline(db_path=DB_PATH, plots=True):
+    """Part 3: distance check, NYC airports, statistics and bearings.
+
+    The distance check covers every flight; ``distance_audit`` has the
+    result per route.
+    """
+    geo_distances, db_distances = compare_distances(db_path)
+    df_flights_bearing = generate_bearing_df(db_path)
+    results = {
+        "geo_distances": geo_distances,
+        "db_distances": db_distances,
+        "distance_audit": audit_distances(db_path),
+        "nyc_airports": nyc_origin_airports(db_path),
+        # get flight statistics for JFK on January 1st
+        "stats": get_flight_statistics(1, 1, "JFK", db_path),
+        "bearing": df_flights_bearing,
+    }
+    if plots:
+        plot_distance_comparison(geo_distances, db_distances)
+        results["bearing_figures"] = bearing_polar_figures(df_flights_bearing)
+    return results
+
+
+def cleaning_pipeline(flights=None, db_path=DB_PATH):
+    """Part 4: missing values, duplicates, datetimes, fixes and local times.
+
+    The flights table is loaded once, as a compact typed frame, and shared
+    by all steps.
+    """
+    if flights is None:
+        flights = load_compact_flights(db_path)
+    fixed, fix_report = repair_flights(flights)
+    local_times, local_time_errors = local_flight_times(flights, db_path)
+    return {
+        "filled": fill_missing_values(flights.copy()),
+        "duplicates": find_duplicate_flights(db_path),
+        "dtime": flights_with_dtime_objects(flights),
+        "fixed": fixed,
+        "fix_count": fix_counts_from_report(fix_report),
+        "fix_report": fix_report,
+        "local_times": local_times,
+        "local_time_errors": local_time_errors,
+    }
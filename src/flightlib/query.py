@@ -0,0 +1,334 @@
+"""Paginated, read-only query runner for the Developer Tool page.
+
+Queries that only read run on a read-only connection and are fetched one
+page at a time with ``fetchmany``, so a ``SELECT * FROM flights`` never
+materializes the whole table. SELECT queries (also behind a WITH) are
+wrapped in ``LIMIT ... OFFSET`` so SQLite skips the earlier pages itself;
+other reading statements (PRAGMA, EXPLAIN, ...) and queries that cannot be
+wrapped skip them with ``fetchmany``. Pages, row counts and query plans are
+cached by SQL text and database version, so paging back and forth does not
+run the query again.
+
+QueryJob runs a query on a worker thread with a time and a row budget and
+can be cancelled, so one slow query does not block the dashboard.
+"""
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from flightlib.config import DB_PATH
+from flightlib.db import database_version
+
+PAGE_SIZE = 1000
+READ_KEYWORDS = ("select", "explain", "pragma", "values")
+WRAPPABLE_KEYWORDS = ("select", "values")
+# statements that can follow the common table expressions of a WITH
+MAIN_KEYWORDS = ("select", "values", "insert", "replace", "update", "delete")
+# comments, quoted strings and identifiers are skipped when looking for keywords
+_TOKENS = re.compile(r"""--[^\n]*|/\*.*?(?:\*/|$)|'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]"""
+                     r"|[()]|[A-Za-z_][A-Za-z_0-9]*", re.S)
+MAX_CACHED_RESULTS = 64
+MAX_FINISHED_JOBS = 32
+# SQLite virtual machine steps between two calls of the progress handler
+PROGRESS_STEPS = 10_000
+
+_shared = OrderedDict()
+_lock = threading.Lock()
+
+
+def clean_sql(sql):
+    """The SQL text without surrounding whitespace and trailing semicolons."""
+    return sql.strip().rstrip(";").strip()
+
+
+def statement_keyword(sql):
+    """The keyword of the main statement, lowercase ('' if there is none).
+
+    For a WITH statement this is the statement after the common table
+    expressions, e.g. 'delete' for ``WITH x AS (...) DELETE FROM ...``.
+    """
+    depth = 0
+    first = None
+    for match in _TOKENS.finditer(sql):
+        token = match.group()
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif token[0].isalpha() or token[0] == "_":
+            word = token.lower()
+            if first is None:
+                first = word
+                if word != "with":
+                    return word
+            elif depth == 0 and word in MAIN_KEYWORDS:
+                return word
+    return first or ""
+
+
+def is_read_query(sql):
+    """Whether the statement only reads (and can run read-only)."""
+    return statement_keyword(sql) in READ_KEYWORDS
+
+
+def _wrappable(sql):
+    return statement_keyword(sql) in WRAPPABLE_KEYWORDS
+
+
+def _execute_wrapped(conn, sql, wrapped, params=()):
+    # the query wrapped in an outer SELECT, or None when it cannot be wrapped
+    # (e.g. a trailing statement after a semicolon); the newline ends a trailing comment
+    if not _wrappable(sql):
+        return None
+    try:
+        return conn.execute(wrapped.format(sql=f"{sql}\n"), params)
+    except sqlite3.OperationalError as e:
+        if "interrupt" in str(e):
+            raise
+        return None
+
+
+def read_only_connection(db_path=DB_PATH):
+    """Open a connection that cannot write to the database."""
+    uri = f"file:{os.path.abspath(db_path)}?mode=ro"
+    return sqlite3.connect(uri, uri=True)
+
+
+def _cached(key, compute):
+    with _lock:
+        if key in _shared:
+            _shared.move_to_end(key)
+            return _shared[key]
+    value = compute()
+    with _lock:
+        _shared[key] = value
+        while len(_shared) > MAX_CACHED_RESULTS:
+            _shared.popitem(last=False)
+    return value
+
+
+def _fetch_page(conn, sql, page, page_size):
+    cursor = _execute_wrapped(conn, sql, "SELECT * FROM ({sql}) LIMIT ? OFFSET ?",
+                              (page_size, page * page_size))
+    if cursor is None:
+        cursor = conn.execute(sql)
+        skipped = 0
+        while skipped < page * page_size:
+            rows = cursor.fetchmany(min(page_size, page * page_size - skipped))
+            if not rows:
+                break
+            skipped += len(rows)
+    rows = cursor.fetchmany(page_size) if cursor.description else []
+    columns = [c[0] for c in cursor.description or []]
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def _count_rows(conn, sql, limit=None):
+    # rows of a read query, counting at most limit + 1 of them
+    limited = f"SELECT 1 FROM ({{sql}}) LIMIT {int(limit) + 1}" if limit is not None else "{sql}"
+    cursor = _execute_wrapped(conn, sql, f"SELECT COUNT(*) FROM ({limited}\n)")
+    if cursor is not None:
+        return cursor.fetchone()[0]
+    cursor = conn.execute(sql)
+    total = 0
+    while limit is None or total <= limit:
+        rows = cursor.fetchmany(PAGE_SIZE)
+        if not rows:
+            break
+        total += len(rows)
+    return total if limit is None else min(total, limit + 1)
+
+
+def _query_plan(conn, sql):
+    steps = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in steps:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return "\n".join(lines)
+
+
+def _with_read_only(db_path, func, *args):
+    conn = read_only_connection(db_path)
+    try:
+        return func(conn, *args)
+    finally:
+        conn.close()
+
+
+def _key(db_path, sql, *parts):
+    return (os.path.abspath(db_path), sql, database_version(db_path)) + parts
+
+
+def fetch_page(sql, page=0, page_size=PAGE_SIZE, db_path=DB_PATH):
+    """Rows ``page * page_size`` up to the next ``page_size`` of a read query."""
+    sql = clean_sql(sql)
+    return _cached(_key(db_path, sql, "page", page, page_size),
+                   lambda: _with_read_only(db_path, _fetch_page, sql, page, page_size))
+
+
+def count_rows(sql, db_path=DB_PATH, limit=None):
+    """Total number of rows of a read query (at most ``limit + 1``)."""
+    sql = clean_sql(sql)
+    return _cached(_key(db_path, sql, "count", limit),
+                   lambda: _with_read_only(db_path, _count_rows, sql, limit))
+
+
+def query_plan(sql, db_path=DB_PATH):
+    """The EXPLAIN QUERY PLAN of a query as indented text."""
+    sql = clean_sql(sql)
+    return _cached(_key(db_path, sql, "plan"),
+                   lambda: _with_read_only(db_path, _query_plan, sql))
+
+
+class BudgetExceeded(Exception):
+    """A query ran longer or touched more rows than its budget allows."""
+
+
+class QueryJob:
+    """One query run on a worker thread with its own connection.
+
+    A SQLite progress handler counts the virtual machine steps and aborts
+    the query once ``time_budget`` seconds have passed or the job is
+    cancelled; ``cancel`` also calls ``interrupt()`` so a query waiting
+    inside SQLite stops right away. Read queries run read-only and return
+    the row count (up to ``row_budget``), one page and the plan, through
+    the same cache as fetch_page. Other statements run in one transaction
+    that is rolled back when they change more than ``row_budget`` rows.
+    """
+
+    def __init__(self, sql, db_path=DB_PATH, time_budget=30.0, row_budget=100_000,
+                 page=0, page_size=PAGE_SIZE):
+        self.sql = clean_sql(sql)
+        self.db_path = db_path
+        self.time_budget = time_budget
+        self.row_budget = row_budget
+        self.page = page
+        self.page_size = page_size
+        self.read = is_read_query(sql)
+        self.state = "running"
+        self.result = None
+        self.error = None
+        self.steps = 0
+        self.started = time.monotonic()
+        self.finished = None
+        self._cancelled = threading.Event()
+        self._conn = None
+        self._thread = threading.Thread(target=self._run, name="flightlib-query", daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self.state == "running"
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def cancel(self):
+        """Stop the query; a write is rolled back."""
+        self._cancelled.set()
+        conn = self._conn
+        if conn is not None:
+            conn.interrupt()
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return not self.running
+
+    def _progress(self):
+        self.steps += PROGRESS_STEPS
+        if self._cancelled.is_set():
+            return 1
+        if time.monotonic() - self.started > self.time_budget:
+            self.error = f"time budget of {self.time_budget:g} s exceeded"
+            return 1
+        return 0
+
+    def _read(self, conn):
+        total = _cached(_key(self.db_path, self.sql, "count", self.row_budget),
+                        lambda: _count_rows(conn, self.sql, self.row_budget))
+        if self.page * self.page_size >= self.row_budget:
+            raise BudgetExceeded(f"pages after the first {self.row_budget} rows are not fetched")
+        page = _cached(_key(self.db_path, self.sql, "page", self.page, self.page_size),
+                       lambda: _fetch_page(conn, self.sql, self.page, self.page_size))
+        try:
+            plan = _cached(_key(self.db_path, self.sql, "plan"), lambda: _query_plan(conn, self.sql))
+        except sqlite3.Error:
+            plan = ""
+        return {"rows": min(total, self.row_budget), "capped": total > self.row_budget,
+                "page": page, "plan": plan}
+
+    def _write(self, conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(self.sql)
+            # changes() leaves out the rows written by triggers (summaries,
+            # versions); unlike rowcount it also counts WITH ... DELETE
+            changed = conn.execute("SELECT changes()").fetchone()[0]
+            if changed > self.row_budget:
+                raise BudgetExceeded(f"{changed} rows changed, more than the budget of {self.row_budget}")
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return {"changed": changed}
+
+    def _run(self):
+        try:
+            if self.read:
+                conn = read_only_connection(self.db_path)
+            else:
+                conn = sqlite3.connect(self.db_path, timeout=min(self.time_budget, 30),
+                                       isolation_level=None)
+            self._conn = conn
+            try:
+                conn.set_progress_handler(self._progress, PROGRESS_STEPS)
+                self.result = self._read(conn) if self.read else self._write(conn)
+            finally:
+                self._conn = None
+                conn.close()
+            self.state = "done"
+        except Exception as e:
+            # any error (sqlite3.Warning for several statements on older Pythons,
+            # bad parameters, ...) has to end the job, or its pollers wait forever
+            if self._cancelled.is_set():
+                self.state = "cancelled"
+            else:
+                self.state = "failed"
+                if self.error is None:
+                    self.error = str(e) or type(e).__name__
+        finally:
+            if self.state == "running":
+                self.state = "failed"
+            self.finished = time.monotonic()
+
+
+_jobs = OrderedDict()
+_job_ids = itertools.count(1)
+
+
+def start_job(sql, db_path=DB_PATH, **budgets):
+    """Start a QueryJob and register it so later reruns can find it by id."""
+    job = QueryJob(sql, db_path, **budgets)
+    with _lock:
+        job.id = next(_job_ids)
+        _jobs[job.id] = job
+        # forget the oldest finished jobs
+        for job_id in [k for k, j in _jobs.items() if not j.running][:-MAX_FINISHED_JOBS]:
+            del _jobs[job_id]
+    return job
+
+
+def get_job(job_id):
+    """The registered job with this id, or None."""
+    with _lock:
+        return _jobs.get(job_id)
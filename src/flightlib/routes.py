@@ -0,0 +1,196 @@
+"""Route dimension table: per (origin, dest) geometry, computed once.
+
+Everything derived from the origin and destination of a flight (the
+coordinates and names of both airports, the great-circle distance, the
+initial bearing and the time zones) is the same for every flight of a
+route. The flights table has a few hundred distinct routes for hundreds of
+thousands of flights, so these values are computed once per route and
+gathered into the flights by an integer route id.
+
+The route table built from the whole flights table also keeps the flight
+count and the range of the database distances of every route, so the
+distance audit covers every flight. Flights appended by the background
+writer are added to those statistics instead of rebuilding the table::
+
+    python -m flightlib.routes
+"""
+import copy
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from flightlib.config import DB_PATH
+from flightlib.db import table_version
+from flightlib.geo import compass_bearing, haversine_km
+from flightlib.snapshot import read_rows, read_table
+from flightlib.writer import appended_rowids
+
+MI_TO_KM = 1.60934
+AIRPORT_COLUMNS = ["faa", "name", "lat", "lon", "tz", "tzone"]
+# computed and database distances further apart than this are reported
+AUDIT_TOLERANCE = 0.02
+# the columns of a route table that come from its flights
+STAT_COLUMNS = ["origin", "dest", "n_flights", "db_distance_min_mi", "db_distance_max_mi",
+                "db_distance_mean_mi", "db_distance_count"]
+
+_shared = {}
+_lock = threading.Lock()
+
+
+def route_stats(flights):
+    """Flight count and database distances of every (origin, dest) pair, sorted."""
+    flights = flights.dropna(subset=["origin", "dest"])
+    stats = {"n_flights": ("origin", "size")}
+    if "distance" in flights:
+        stats.update(db_distance_min_mi=("distance", "min"), db_distance_max_mi=("distance", "max"),
+                     db_distance_mean_mi=("distance", "mean"), db_distance_count=("distance", "count"))
+    return (flights.groupby(["origin", "dest"], sort=True, observed=True)
+            .agg(**stats).reset_index())
+
+
+def combine_route_stats(a, b):
+    """Route statistics of two sets of flights taken together."""
+    both = pd.concat([a, b], ignore_index=True)
+    if "db_distance_count" not in both:
+        return both.groupby(["origin", "dest"], sort=True)[["n_flights"]].sum().reset_index()
+    both["db_distance_sum"] = (both["db_distance_mean_mi"] * both["db_distance_count"]).fillna(0)
+    stats = (both.groupby(["origin", "dest"], sort=True)
+             .agg(n_flights=("n_flights", "sum"), db_distance_min_mi=("db_distance_min_mi", "min"),
+                  db_distance_max_mi=("db_distance_max_mi", "max"),
+                  db_distance_sum=("db_distance_sum", "sum"), db_distance_count=("db_distance_count", "sum"))
+             .reset_index())
+    mean = stats["db_distance_sum"] / stats["db_distance_count"].where(stats["db_distance_count"] > 0)
+    return stats.assign(db_distance_mean_mi=mean)[STAT_COLUMNS]
+
+
+class RouteTable:
+    """One row of geometry per (origin, dest) pair, looked up by route id."""
+
+    def __init__(self, flights, airports):
+        self._airports = airports.drop_duplicates("faa").set_index("faa")
+        self._set_routes(route_stats(flights))
+
+    def extended(self, flights):
+        """Copy of the table with more flights added to the routes and their statistics."""
+        stats = self.routes[[c for c in self.routes.columns if c in STAT_COLUMNS]]
+        table = copy.copy(self)
+        table._set_routes(combine_route_stats(stats, route_stats(flights)))
+        return table
+
+    def _set_routes(self, routes):
+        airports = self._airports
+        routes = routes.copy()
+        for end in ("origin", "dest"):
+            for column in AIRPORT_COLUMNS[1:]:
+                if column in airports:
+                    routes[f"{end}_{column}"] = routes[end].map(airports[column]).to_numpy()
+        routes["distance_km"] = haversine_km(routes["origin_lat"], routes["origin_lon"],
+                                             routes["dest_lat"], routes["dest_lon"])
+        routes["bearing"] = compass_bearing(routes["origin_lat"], routes["origin_lon"],
+                                            routes["dest_lat"], routes["dest_lon"])
+        if "origin_tz" in routes:
+            routes["tz_offset_hours"] = routes["dest_tz"] - routes["origin_tz"]
+        routes.index.name = "route_id"
+        self.routes = routes
+
+        # dense [origin, dest] lookup of the route ids; there are only a few origins
+        self.origins = pd.Index(routes["origin"].unique())
+        self.dests = pd.Index(routes["dest"].unique())
+        self._ids = np.full((len(self.origins), len(self.dests)), -1, dtype=np.int32)
+        self._ids[self.origins.get_indexer(routes["origin"]),
+                  self.dests.get_indexer(routes["dest"])] = np.arange(len(routes), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.routes)
+
+    def ids(self, origin, dest):
+        """Route id of every flight, -1 for routes not in the table."""
+        def positions(values, index):
+            # factorize first, so only the distinct codes are looked up
+            codes, uniques = pd.factorize(pd.Series(values))
+            return np.append(index.get_indexer(uniques), -1)[codes]
+        o, d = positions(origin, self.origins), positions(dest, self.dests)
+        found = (o >= 0) & (d >= 0)
+        return np.where(found, self._ids[np.maximum(o, 0), np.maximum(d, 0)], -1)
+
+    def covers(self, origin, dest):
+        """Whether every flight with an origin and a destination has a route."""
+        known = pd.Series(origin).notna().to_numpy() & pd.Series(dest).notna().to_numpy()
+        return bool((self.ids(origin, dest)[known] >= 0).all())
+
+    def gather(self, ids, columns):
+        """Route columns of every route id (missing for -1)."""
+        ids = np.asarray(ids)
+        if len(self.routes) == 0:
+            return pd.DataFrame(np.nan, index=range(len(ids)), columns=columns)
+        rows = self.routes[columns].iloc[np.maximum(ids, 0)].reset_index(drop=True)
+        if (ids < 0).any():
+            rows.loc[ids < 0] = np.nan
+        return rows
+
+    def attach(self, flights, columns, names=None):
+        """Copy of the flights with route_id and the route columns added.
+
+        ``names`` renames the added columns, e.g. ``{"dest_lat": "lat_dest"}``.
+        """
+        ids = self.ids(flights["origin"], flights["dest"])
+        values = self.gather(ids, columns).rename(columns=names or {})
+        return flights.assign(route_id=ids, **{c: values[c].to_numpy() for c in values.columns})
+
+
+def build_routes(db_path=DB_PATH):
+    """Route table of all flights of a database, from its columnar snapshot."""
+    flights = read_table("flights", ["origin", "dest", "distance"], db_path=db_path)
+    airports = read_table("airports", AIRPORT_COLUMNS, db_path=db_path)
+    return RouteTable(flights, airports)
+
+
+def get_routes(db_path=DB_PATH):
+    """The shared route table of a database, rebuilt when the flights or airports change.
+
+    Flights appended by the background writer are added to the table instead.
+    """
+    key = os.path.abspath(db_path)
+    version = table_version(db_path, "flights", "airports")
+    with _lock:
+        cached = _shared.get(key)
+        if cached is None or cached[0] != version:
+            routes = None
+            if cached is not None and cached[0][1] == version[1]:
+                ranges = appended_rowids(db_path, "flights", cached[0][0], version[0])
+                if ranges is not None:
+                    routes = cached[1].extended(read_rows("flights", ranges, ["origin", "dest", "distance"],
+                                                          db_path))
+            cached = (version, build_routes(db_path) if routes is None else routes)
+            _shared[key] = cached
+    return cached[1]
+
+
+def audit_distances(db_path=DB_PATH, tolerance=AUDIT_TOLERANCE):
+    """Compare the computed and database distances of every route.
+
+    Returns one row per route with the number of flights, the computed
+    distance and the database distances in km, the largest relative
+    difference and whether it exceeds ``tolerance``, worst routes first.
+    Routes with an unknown airport have no computed distance and are left out.
+    """
+    routes = get_routes(db_path).routes.dropna(subset=["distance_km"])
+    audit = routes[["origin", "dest", "n_flights", "distance_km"]].copy()
+    audit["db_distance_min_km"] = routes["db_distance_min_mi"] * MI_TO_KM
+    audit["db_distance_max_km"] = routes["db_distance_max_mi"] * MI_TO_KM
+    furthest = np.maximum(np.abs(audit["db_distance_min_km"] - audit["distance_km"]),
+                          np.abs(audit["db_distance_max_km"] - audit["distance_km"]))
+    audit["relative_difference"] = furthest / audit["distance_km"].where(audit["distance_km"] > 0)
+    audit["flagged"] = audit["relative_difference"] > tolerance
+    return audit.sort_values("relative_difference", ascending=False)
+
+
+if __name__ == "__main__":
+    audit = audit_distances()
+    flagged = audit[audit["flagged"]]
+    print(f"{len(audit)} routes, {audit['n_flights'].sum()} flights; "
+          f"{len(flagged)} routes ({flagged['n_flights'].sum()} flights) differ by more than "
+          f"{AUDIT_TOLERANCE:.0%} from the computed distance")
+    print(flagged.head(20).to_string())
@@ -0,0 +1,253 @@
+"""Location search over the world cities and the airports.
+
+Every searchable name is normalized (lower case, accents and punctuation
+removed) and stored in a sorted array, together with the rest of the name
+from every later word on, so exact, prefix and word matches are two binary
+searches. Fuzzy matches (typos) use difflib on the names that start
+with the same letter. Results are ranked by match type and then by size:
+population for cities and number of flights for airports.
+
+The city index is built from worldcities.csv once and pickled in the cache
+directory, so the dashboard does not reread the CSV. It can be rebuilt by
+hand with::
+
+    python -m flightlib.search
+"""
+import difflib
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from flightlib.config import CACHE_DIR, DATA_DIR, DB_PATH
+from flightlib.db import connect, table_version
+from flightlib.spatial import airports_key
+
+CITIES_CSV = os.path.join(DATA_DIR, "worldcities.csv")
+INDEX_FORMAT = 1
+MATCH_TYPES = ["exact", "prefix", "word", "fuzzy"]
+
+_shared = {}
+_lock = threading.Lock()
+
+
+def normalize(text):
+    """Lower case text without accents, punctuation and repeated spaces."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+def name_keys(names):
+    """Search keys of every name: the whole name and every word onwards.
+
+    Returns a frame with the position of the name, its key and whether the
+    key is the whole name, so "kennedy" finds "John F Kennedy Intl".
+    """
+    keys = pd.Series(names, dtype=object).map(normalize, na_action="ignore").fillna("")
+    parts = keys.str.split(" ").map(lambda words: [" ".join(words[i:]) for i in range(len(words))])
+    exploded = parts.explode()
+    return pd.DataFrame({
+        "position": exploded.index.to_numpy(),
+        "key": exploded.to_numpy(dtype=object),
+        "whole": exploded.groupby(level=0).cumcount().to_numpy() == 0,
+    })
+
+
+class SearchIndex:
+    """Exact, prefix, word and fuzzy search over normalized names.
+
+    ``places`` has one row per place with a weight column (the ranking size)
+    plus any columns to return; ``names`` is a list of name arrays aligned
+    with ``places`` (a place can have several names, e.g. a code and a name).
+    """
+
+    def __init__(self, places, names):
+        self.places = places.reset_index(drop=True)
+        keys = pd.concat([name_keys(n) for n in names])
+        keys = keys[keys["key"] != ""].drop_duplicates()
+        keys = keys.sort_values("key", kind="stable")
+        self._keys = keys["key"].to_numpy(dtype=str)
+        self._positions = keys["position"].to_numpy(dtype=np.int64)
+        self._whole = keys["whole"].to_numpy()
+        self._weights = self.places["weight"].to_numpy(dtype=float)
+        self._unique_keys = np.unique(self._keys)
+
+    def __len__(self):
+        return len(self.places)
+
+    def _prefix_range(self, keys, key):
+        return (np.searchsorted(keys, key, "left"),
+                np.searchsorted(keys, key + "\U0010ffff", "left"))
+
+    def _matches(self, query):
+        # (positions, match type) of the exact, prefix and word matches
+        key = normalize(query)
+        if not key:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        start, stop = self._prefix_range(self._keys, key)
+        whole = self._whole[start:stop]
+        exact = self._keys[start:stop] == key
+        kind = np.where(~whole, 2, np.where(exact, 0, 1))
+        return self._positions[start:stop], kind
+
+    def fuzzy_positions(self, query, n=10, cutoff=0.75):
+        """Positions of places with a name similar to the query (e.g. with a typo)."""
+        key = normalize(query)
+        if not key:
+            return np.empty(0, dtype=np.int64)
+        start, stop = self._prefix_range(self._unique_keys, key[0])
+        close = difflib.get_close_matches(key, self._unique_keys[start:stop], n=n, cutoff=cutoff)
+        return np.unique(self._positions[np.isin(self._keys, close)])
+
+    def search(self, query, limit=10, fuzzy=True):
+        """Best matches of the query, best match type first and largest first.
+
+        The match types are exact, prefix (the name starts with the query),
+        word (a later word starts with it) and fuzzy; fuzzy matches are only
+        looked for when there are fewer than ``limit`` other matches.
+        """
+        positions, kind = self._matches(query)
+        if fuzzy and len(np.unique(positions)) < limit:
+            close = self.fuzzy_positions(query)
+            positions = np.concatenate([positions, close])
+            kind = np.concatenate([kind, np.full(len(close), 3)])
+        # best match type first, then the largest place; keep one row per place
+        order = np.lexsort((-self._weights[positions], kind))
+        positions, kind = positions[order], kind[order]
+        _, first = np.unique(positions, return_index=True)
+        first = np.sort(first)[:limit]
+        results = self.places.iloc[positions[first]].copy()
+        results["match"] = [MATCH_TYPES[k] for k in kind[first]]
+        return results
+
+
+def city_index(cities):
+    """Search index of the cities of worldcities.csv, ranked by population."""
+    places = pd.DataFrame({
+        "kind": "city",
+        "name": cities["city"].astype(str) + ", " + cities["country"].astype(str),
+        "lat": cities["lat"].to_numpy(dtype=float),
+        "lon": cities["lng"].to_numpy(dtype=float),
+        "weight": pd.to_numeric(cities["population"], errors="coerce").fillna(0).to_numpy(),
+    })
+    return SearchIndex(places, [cities["city_ascii"].to_numpy(), cities["city"].to_numpy()])
+
+
+def airport_index(airports, flight_counts=None):
+    """Search index of the FAA codes and names of the airports.
+
+    ``flight_counts`` maps FAA codes to the number of flights, used to rank
+    the airports; the label column refers back to the rows of ``airports``.
+    """
+    weight = airports["faa"].map(flight_counts) if flight_counts is not None else None
+    places = pd.DataFrame({
+        "label": airports.index,
+        "kind": "airport",
+        "faa": airports["faa"].to_numpy(),
+        "name": airports["name"].to_numpy(),
+        "lat": airports["lat"].to_numpy(dtype=float),
+        "lon": airports["lon"].to_numpy(dtype=float),
+        "weight": 0.0 if weight is None else weight.fillna(0).to_numpy(dtype=float),
+    })
+    return SearchIndex(places, [airports["faa"].to_numpy(), airports["name"].to_numpy()])
+
+
+def flight_counts(db_path=DB_PATH):
+    """Number of departing plus arriving flights per airport."""
+    conn = connect(db_path)
+    try:
+        try:
+            query = """
+                SELECT origin AS faa, SUM(n_flights) AS n FROM flights_daily_summary GROUP BY origin
+                UNION ALL
+                SELECT dest AS faa, SUM(n_flights) AS n FROM flights_daily_summary GROUP BY dest
+            """
+            counts = pd.read_sql_query(query, conn)
+        except (sqlite3.OperationalError, pd.errors.DatabaseError):
+            # the summary tables are created by the migrations
+            query = """
+                SELECT origin AS faa, COUNT(*) AS n FROM flights GROUP BY origin
+                UNION ALL
+                SELECT dest AS faa, COUNT(*) AS n FROM flights GROUP BY dest
+            """
+            counts = pd.read_sql_query(query, conn)
+    finally:
+        conn.close()
+    return counts.groupby("faa")["n"].sum()
+
+
+def _index_path(csv_path):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(CACHE_DIR, "search", f"{name}-index.pkl")
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    # the pickled index holds pandas and numpy objects, which only load in the same versions
+    return (INDEX_FORMAT, pd.__version__, np.__version__,
+            os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def build_city_index(csv_path=CITIES_CSV):
+    """Build the city index from the CSV and store it in the cache directory."""
+    stamp = _file_stamp(csv_path)
+    index = city_index(pd.read_csv(csv_path))
+    path = _index_path(csv_path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump({"stamp": stamp, "index": index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass  # a read-only cache only costs a rebuild next time
+    return index
+
+
+def _read_city_index(csv_path):
+    try:
+        with open(_index_path(csv_path), "rb") as f:
+            stored = pickle.load(f)
+        return stored["index"] if stored.get("stamp") == _file_stamp(csv_path) else None
+    except Exception:
+        # unreadable, truncated or written by other library versions: rebuilt
+        return None
+
+
+def load_city_index(csv_path=CITIES_CSV):
+    """Return the shared city index, from memory, from disk or freshly built."""
+    stamp = _file_stamp(csv_path)
+    with _lock:
+        cached = _shared.get(("cities", stamp))
+        if cached is None:
+            cached = _read_city_index(csv_path) or build_city_index(csv_path)
+            _shared[("cities", stamp)] = cached
+    return cached
+
+
+def get_airport_index(airports, db_path=DB_PATH):
+    """Return the shared index of these airports, ranked by their flights.
+
+    The index is only rebuilt when the airports change; new flights hardly
+    move the ranking, so the flight counts of the first build are kept.
+    """
+    key = ("airports", airports_key(airports, ["faa", "name", "lat", "lon"]),
+           table_version(db_path, "airports"))
+    with _lock:
+        cached = _shared.get(key)
+        if cached is None:
+            # drop the indexes of older airport sets and database versions
+            for old in [k for k in _shared if k[0] == "airports"]:
+                del _shared[old]
+            cached = airport_index(airports, flight_counts(db_path))
+            _shared[key] = cached
+    return cached
+
+
+if __name__ == "__main__":
+    print(f"{len(build_city_index())} cities indexed in {_index_path(CITIES_CSV)}")
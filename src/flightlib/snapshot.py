@@ -0,0 +1,280 @@
+"""Columnar (Parquet) snapshot of the flights database.
+
+``pd.read_sql_query`` materializes SQLite rows one value at a time, which
+makes loading the large tables slow. The snapshot stores every table as a
+typed Parquet file, so a load only reads the requested columns, at close to
+disk speed.
+
+The snapshot remembers the version of every table it was made from (see
+flightlib.db.table_versions), and ``read_table`` re-exports a table when it
+has changed, so new flights do not re-export the weather. Rows appended by
+the background writer (flightlib.writer) are exported on their own as
+extra parts of the table instead. It can also be (re)built by hand with::
+
+    python -m flightlib.snapshot
+"""
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+from flightlib.config import CACHE_DIR, DB_PATH
+from flightlib.db import connect, table_versions
+from flightlib.writer import appended_rowids
+
+TABLES = ["flights", "airlines", "airports", "planes", "weather"]
+SNAPSHOT_FORMAT = 4
+# parts of appended rows per table before the table is exported again as a whole
+MAX_PARTS = 32
+
+_lock = threading.Lock()
+
+
+def snapshot_dir(db_path=DB_PATH):
+    """Directory holding the snapshot of one database file."""
+    db_path = os.path.abspath(db_path)
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    digest = hashlib.sha1(db_path.encode()).hexdigest()[:8]
+    return os.path.join(CACHE_DIR, "snapshot", f"{name}-{digest}")
+
+
+def _manifest_path(db_path):
+    return os.path.join(snapshot_dir(db_path), "manifest.json")
+
+
+def read_manifest(db_path=DB_PATH):
+    """Return the snapshot manifest, or None if there is no snapshot."""
+    try:
+        with open(_manifest_path(db_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _stored(version):
+    # the version as it reads back from the manifest
+    return json.loads(json.dumps(version))
+
+
+def stale_tables(db_path=DB_PATH, tables=TABLES):
+    """The tables whose snapshot is missing or older than the database table."""
+    manifest = read_manifest(db_path)
+    if manifest is None or manifest.get("format") != SNAPSHOT_FORMAT:
+        return list(tables)
+    versions = table_versions(db_path, tables)
+    stored = manifest["tables"]
+    return [table for table in tables
+            if table not in stored or stored[table]["version"] != _stored(versions[table])]
+
+
+def is_fresh(db_path=DB_PATH, tables=TABLES):
+    """Check whether the snapshot of these tables matches the database."""
+    return not stale_tables(db_path, tables)
+
+
+def rowid_clause(ranges):
+    """A WHERE clause and its parameters for inclusive rowid ranges."""
+    return (" OR ".join(["rowid BETWEEN ? AND ?"] * len(ranges)),
+            [rowid for first_last in ranges for rowid in first_last])
+
+
+def typed_table(conn, table, ranges=None):
+    """Read a whole table (or its rows in rowid ``ranges``) with one fixed dtype per column.
+
+    SQLite stores a type per value, so the declared column types are used:
+    INTEGER columns become int64 (float64 if they contain NULLs or
+    fractions, which SQLite keeps as REAL values), REAL columns float64 and
+    everything else (nullable) strings.
+    """
+    query, params = f"SELECT * FROM {table}", []
+    if ranges is not None:
+        clause, params = rowid_clause(ranges)
+        query += f" WHERE {clause}"
+    df = pd.read_sql_query(query, conn, params=params)
+    for _, name, declared, *_ in conn.execute(f"PRAGMA table_info({table})"):
+        declared = (declared or "").upper()
+        if "INT" in declared:
+            column = pd.to_numeric(df[name], errors="coerce")
+            integral = column.notna().all() and (column % 1 == 0).all()
+            df[name] = column.astype("int64") if integral else column.astype("float64")
+        elif any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+            df[name] = pd.to_numeric(df[name], errors="coerce").astype("float64")
+        else:
+            df[name] = df[name].where(df[name].isna(), df[name].astype(str))
+    return df
+
+
+def match_dtypes(df, like):
+    """Cast the columns of df to the dtypes of the same columns of like where possible.
+
+    A few appended rows can come back with other dtypes than the whole table
+    (e.g. an all-NULL text column); without the cast concatenating them
+    would change the dtype of the whole column.
+    """
+    for column in df.columns.intersection(like.columns):
+        if df[column].dtype != like[column].dtype:
+            try:
+                df[column] = df[column].astype(like[column].dtype)
+            except (TypeError, ValueError):
+                pass  # e.g. missing values in an int64 column: concat makes it float64
+    return df
+
+
+def _table_paths(db_path, table, info):
+    directory = snapshot_dir(db_path)
+    return ([os.path.join(directory, f"{table}.parquet")]
+            + [os.path.join(directory, part) for part in info.get("parts", [])])
+
+
+def _write_manifest(db_path, manifest):
+    tmp_path = _manifest_path(db_path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, _manifest_path(db_path))
+
+
+def export_snapshot(db_path=DB_PATH, tables=TABLES):
+    """Write tables of the database to Parquet and return the manifest.
+
+    The other tables of an existing snapshot are kept as they are.
+    """
+    directory = snapshot_dir(db_path)
+    os.makedirs(directory, exist_ok=True)
+    # taken before reading, so changes made during the export make it stale
+    versions = table_versions(db_path, tables)
+    manifest = read_manifest(db_path)
+    if manifest is None or manifest.get("format") != SNAPSHOT_FORMAT:
+        manifest = {"format": SNAPSHOT_FORMAT, "db_path": os.path.abspath(db_path), "tables": {}}
+
+    conn = connect(db_path)
+    try:
+        for table in tables:
+            df = typed_table(conn, table)
+            path = os.path.join(directory, f"{table}.parquet")
+            tmp_path = path + ".tmp"
+            df.to_parquet(tmp_path, index=False, engine="pyarrow")
+            os.replace(tmp_path, path)
+            # the appended parts are part of the new export
+            for old in _table_paths(db_path, table, manifest["tables"].get(table, {}))[1:]:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+            manifest["tables"][table] = {"rows": len(df), "columns": list(df.columns),
+                                         "version": _stored(versions[table]), "parts": []}
+    finally:
+        conn.close()
+
+    _write_manifest(db_path, manifest)
+    return manifest
+
+
+def append_snapshot(db_path, table, ranges, version, manifest):
+    """Export the rows in rowid ranges as a new part of a table's snapshot.
+
+    ``version`` is the table version the snapshot is at with the new part.
+    """
+    info = manifest["tables"][table]
+    df = read_rows(table, ranges, db_path=db_path)
+    if len(df):
+        name = f"{table}.part{len(info['parts']) + 1}.parquet"
+        path = os.path.join(snapshot_dir(db_path), name)
+        df.to_parquet(path + ".tmp", index=False, engine="pyarrow")
+        os.replace(path + ".tmp", path)
+        info["parts"].append(name)
+        info["rows"] += len(df)
+    info["version"] = _stored(version)
+    _write_manifest(db_path, manifest)
+
+
+def refresh_snapshot(db_path=DB_PATH, tables=TABLES):
+    """Bring the missing or stale tables up to date; return True if any was.
+
+    A table whose only changes are rows appended by the background writer
+    gets those rows as a new part; the others are exported again.
+    """
+    with _lock:
+        stale = stale_tables(db_path, tables)
+        if not stale:
+            return False
+        manifest = read_manifest(db_path)
+        versions = table_versions(db_path, stale)
+        export = []
+        for table in stale:
+            info = None
+            if manifest is not None and manifest.get("format") == SNAPSHOT_FORMAT:
+                info = manifest["tables"].get(table)
+            ranges = None
+            if info is not None and len(info["parts"]) < MAX_PARTS:
+                ranges = appended_rowids(db_path, table, info["version"], versions[table])
+            if ranges is None:
+                export.append(table)
+            else:
+                append_snapshot(db_path, table, ranges, versions[table], manifest)
+        if export:
+            export_snapshot(db_path, export)
+        return True
+
+
+def read_table(table, columns=None, filters=None, db_path=DB_PATH):
+    """Read (part of) a table through the snapshot.
+
+    ``columns`` limits the columns that are read and ``filters`` takes
+    pyarrow filters such as ``[("year", "==", 2023)]``. A stale table is
+    brought up to date first; if that is not possible (e.g. the cache directory is not
+    writable) the table is read from SQLite instead.
+    """
+    try:
+        refresh_snapshot(db_path, [table])
+    except OSError:
+        return _read_table_sql(table, columns, filters, db_path)
+    info = (read_manifest(db_path) or {"tables": {}})["tables"].get(table, {})
+    df, *parts = [pd.read_parquet(path, columns=columns, filters=filters, engine="pyarrow")
+                  for path in _table_paths(db_path, table, info)]
+    if not parts:
+        return df
+    return pd.concat([df] + [match_dtypes(part, df) for part in parts], ignore_index=True)
+
+
+def read_rows(table, ranges, columns=None, db_path=DB_PATH):
+    """Read the rows of a table in rowid ranges straight from SQLite.
+
+    The rows are typed like the snapshot (see typed_table), for merging the
+    rows appended by the background writer into frames read before.
+    """
+    conn = connect(db_path)
+    try:
+        df = typed_table(conn, table, ranges)
+    finally:
+        conn.close()
+    return df if columns is None else df[columns]
+
+
+def _read_table_sql(table, columns, filters, db_path):
+    """Fallback for read_table that queries SQLite directly."""
+    ops = {"==": "=", "=": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+    where, params = [], []
+    for column, op, value in filters or []:
+        if op == "in":
+            where.append(f"{column} IN ({', '.join(['?'] * len(value))})")
+            params.extend(value)
+        else:
+            where.append(f"{column} {ops[op]} ?")
+            params.append(value)
+    query = f"SELECT {', '.join(columns) if columns else '*'} FROM {table}"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    manifest = export_snapshot()
+    for table, info in manifest["tables"].items():
+        print(f"{table}: {info['rows']} rows")
+    print(f"Snapshot written to {snapshot_dir()}")
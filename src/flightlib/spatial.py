@@ -0,0 +1,79 @@
+"""Spatial index over the airports for nearest-airport lookups.
+
+The airports are stored in a ball tree with the haversine metric, so a
+k-nearest or within-radius query only visits a few tree nodes instead of
+computing the distance to every airport. Indexes are shared across dashboard
+sessions and keyed by the airport coordinates, so an index over the airports
+plus the ones added in a session is built once and then reused.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from flightlib.geo import R, ellipsoidal_km
+
+_shared = OrderedDict()
+_lock = threading.Lock()
+MAX_SHARED_INDEXES = 8
+
+
+class AirportIndex:
+    """Ball tree over the airports with valid coordinates.
+
+    The queries rank airports by great-circle distance and return copies of
+    the airport rows with a distance_km column (on the WGS-84 ellipsoid), so
+    the airports frame itself is never modified.
+    """
+
+    def __init__(self, airports):
+        airports = airports.dropna(subset=["lat", "lon"])
+        self.airports = airports.reset_index(drop=True)
+        points = np.radians(self.airports[["lat", "lon"]].to_numpy(dtype=float))
+        self._tree = BallTree(points, metric="haversine")
+
+    def __len__(self):
+        return len(self.airports)
+
+    def _rows(self, lat, lon, positions):
+        rows = self.airports.iloc[positions].copy()
+        rows["distance_km"] = ellipsoidal_km(lat, lon, rows["lat"], rows["lon"])
+        return rows.sort_values("distance_km", kind="stable")
+
+    def nearest(self, lat, lon, k=1):
+        """The k airports nearest to (lat, lon), nearest first."""
+        k = min(k, len(self))
+        if k == 0:
+            return self.airports.assign(distance_km=pd.Series(dtype=float))
+        point = np.radians([[lat, lon]])
+        _, positions = self._tree.query(point, k=k)
+        return self._rows(lat, lon, positions[0])
+
+    def within(self, lat, lon, radius_km):
+        """All airports within radius_km of (lat, lon), nearest first."""
+        point = np.radians([[lat, lon]])
+        positions = self._tree.query_radius(point, r=radius_km / R)[0]
+        return self._rows(lat, lon, positions)
+
+
+def airports_key(airports, columns=("faa", "lat", "lon")):
+    """Key of the airport codes and coordinates an index is built from."""
+    hashes = pd.util.hash_pandas_object(airports[list(columns)], index=False)
+    return len(airports), int(hashes.sum())
+
+
+def get_shared_index(airports):
+    """Return the shared AirportIndex of these airports, building it if needed."""
+    key = airports_key(airports)
+    with _lock:
+        index = _shared.get(key)
+        if index is None:
+            index = AirportIndex(airports)
+            _shared[key] = index
+            while len(_shared) > MAX_SHARED_INDEXES:
+                _shared.popitem(last=False)
+        else:
+            _shared.move_to_end(key)
+    return index
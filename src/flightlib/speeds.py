@@ -0,0 +1,120 @@
+"""Average speed of every aircraft, stored in ``planes.speed``.
+
+The speed of a plane is the average of distance / air_time (miles per
+minute) over its flights. It is written for all planes in one set-based
+UPDATE. Triggers on ``flights`` record the tailnums whose flights were
+inserted, changed or deleted in ``planes_speed_dirty``, so later refreshes
+only recompute those planes.
+
+Refresh the speeds of the changed planes (or all with ``--all``) with::
+
+    python -m flightlib.speeds [--all]
+"""
+import sqlite3
+import sys
+
+from flightlib.config import DB_PATH
+from flightlib.db import connect
+
+# miles per minute to km/h
+MI_PER_MIN_TO_KMH = 60 * 1.60934
+
+# the columns a change of which changes the speed of a plane
+TRACKED_COLUMNS = ["tailnum", "distance", "air_time"]
+
+
+def create_speed_tracking(conn):
+    """Add planes.speed if missing and create the dirty-tailnum triggers."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(planes)")]
+    if "speed" not in columns:
+        conn.execute("ALTER TABLE planes ADD COLUMN speed REAL")
+    conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS planes_speed_dirty (
+            tailnum TEXT PRIMARY KEY
+        );
+        DROP TRIGGER IF EXISTS planes_speed_insert;
+        DROP TRIGGER IF EXISTS planes_speed_delete;
+        DROP TRIGGER IF EXISTS planes_speed_update;
+        CREATE TRIGGER planes_speed_insert AFTER INSERT ON flights
+        WHEN NEW.tailnum IS NOT NULL
+        BEGIN
+            INSERT OR IGNORE INTO planes_speed_dirty VALUES (NEW.tailnum);
+        END;
+        CREATE TRIGGER planes_speed_delete AFTER DELETE ON flights
+        WHEN OLD.tailnum IS NOT NULL
+        BEGIN
+            INSERT OR IGNORE INTO planes_speed_dirty VALUES (OLD.tailnum);
+        END;
+        CREATE TRIGGER planes_speed_update
+        AFTER UPDATE OF {", ".join(TRACKED_COLUMNS)} ON flights
+        BEGIN
+            INSERT OR IGNORE INTO planes_speed_dirty
+            SELECT tailnum FROM (SELECT OLD.tailnum AS tailnum UNION SELECT NEW.tailnum)
+            WHERE tailnum IS NOT NULL;
+        END;
+    """)
+
+
+def refresh_plane_speeds(conn, only_dirty=True):
+    """Recompute planes.speed and return the number of planes refreshed.
+
+    With ``only_dirty`` only the planes recorded in planes_speed_dirty are
+    recomputed; planes without any flight with an air time left get NULL.
+    Run it inside a transaction (``with conn:``) so the write is atomic.
+    """
+    if only_dirty:
+        n_dirty = conn.execute("SELECT COUNT(*) FROM planes_speed_dirty").fetchone()[0]
+        if n_dirty == 0:
+            return 0
+    dirty_filter = "AND tailnum IN (SELECT tailnum FROM planes_speed_dirty)" if only_dirty else ""
+    conn.execute("DROP TABLE IF EXISTS temp.plane_speeds")
+    conn.execute(f"""
+        CREATE TEMP TABLE plane_speeds AS
+        SELECT tailnum, ROUND(AVG(distance * 1.0 / air_time), 2) AS speed
+        FROM flights
+        WHERE air_time > 0 AND tailnum IS NOT NULL {dirty_filter}
+        GROUP BY tailnum
+    """)
+    refreshed = conn.execute("""
+        UPDATE planes SET speed = plane_speeds.speed
+        FROM plane_speeds
+        WHERE planes.tailnum = plane_speeds.tailnum
+    """).rowcount
+    if only_dirty:
+        refreshed += conn.execute("""
+            UPDATE planes SET speed = NULL
+            WHERE tailnum IN (SELECT tailnum FROM planes_speed_dirty)
+              AND tailnum NOT IN (SELECT tailnum FROM plane_speeds)
+        """).rowcount
+    conn.execute("DELETE FROM planes_speed_dirty")
+    conn.execute("DROP TABLE temp.plane_speeds")
+    return refreshed
+
+
+def refresh_speeds(db_path=DB_PATH, only_dirty=True):
+    """Refresh the plane speeds of a database file in one transaction.
+
+    Returns the number of planes refreshed; read-only databases are left
+    untouched.
+    """
+    conn = connect(db_path)
+    try:
+        with conn:
+            return refresh_plane_speeds(conn, only_dirty)
+    except sqlite3.OperationalError as e:
+        if "readonly" in str(e):
+            return 0
+        raise
+    finally:
+        conn.close()
+
+
+def add_plane_speeds(conn):
+    """Migration: store the speed of every plane and keep it refreshable."""
+    create_speed_tracking(conn)
+    refresh_plane_speeds(conn, only_dirty=False)
+
+
+if __name__ == "__main__":
+    refreshed = refresh_speeds(only_dirty="--all" not in sys.argv[1:])
+    print(f"Refreshed the speed of {refreshed} plane(s) in {DB_PATH}")
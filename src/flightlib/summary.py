@@ -0,0 +1,219 @@
+"""Daily summary tables for the dashboard metrics.
+
+``flights_daily_summary`` holds one row per day, origin, destination and
+carrier with the number of flights and the sums and counts of the delays.
+``flights_daily_plane_summary`` holds the number of flights per day, aircraft
+type and manufacturer. Both are kept current by triggers on ``flights``, so a
+date-range metric only has to aggregate a few rows per day instead of
+scanning the flights table.
+
+Changes to ``planes`` are not tracked by the triggers; rebuild the tables
+after editing planes with::
+
+    python -m flightlib.summary
+"""
+import pandas as pd
+
+from flightlib.config import DB_PATH
+from flightlib.dataset import date_range_clause
+from flightlib.db import connect
+
+SUMMARY_TABLES = """
+    CREATE TABLE IF NOT EXISTS flights_daily_summary (
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        origin TEXT NOT NULL,
+        dest TEXT NOT NULL,
+        carrier TEXT NOT NULL,
+        n_flights INTEGER NOT NULL DEFAULT 0,
+        dep_delay_sum REAL NOT NULL DEFAULT 0,
+        dep_delay_count INTEGER NOT NULL DEFAULT 0,
+        arr_delay_sum REAL NOT NULL DEFAULT 0,
+        arr_delay_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (year, month, day, origin, dest, carrier)
+    );
+    CREATE TABLE IF NOT EXISTS flights_daily_plane_summary (
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        manufacturer TEXT NOT NULL,
+        n_flights INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (year, month, day, type, manufacturer)
+    );
+    CREATE INDEX IF NOT EXISTS idx_planes_tailnum ON planes (tailnum);
+"""
+
+# the columns a change of which has to be reflected in the summaries
+TRACKED_COLUMNS = ["year", "month", "day", "origin", "dest", "carrier",
+                   "tailnum", "dep_delay", "arr_delay"]
+
+
+def _summary_upserts(row, sign):
+    """SQL adding (sign=1) or removing (sign=-1) one flight row to the summaries.
+
+    ``row`` is the trigger row alias, NEW or OLD. Missing text keys are
+    stored as '' because NULLs never conflict in a primary key.
+    """
+    return f"""
+        INSERT INTO flights_daily_summary VALUES (
+            {row}.year, {row}.month, {row}.day,
+            IFNULL({row}.origin, ''), IFNULL({row}.dest, ''), IFNULL({row}.carrier, ''),
+            {sign},
+            {sign} * IFNULL({row}.dep_delay, 0), {sign} * ({row}.dep_delay IS NOT NULL),
+            {sign} * IFNULL({row}.arr_delay, 0), {sign} * ({row}.arr_delay IS NOT NULL)
+        )
+        ON CONFLICT (year, month, day, origin, dest, carrier) DO UPDATE SET
+            n_flights = n_flights + excluded.n_flights,
+            dep_delay_sum = dep_delay_sum + excluded.dep_delay_sum,
+            dep_delay_count = dep_delay_count + excluded.dep_delay_count,
+            arr_delay_sum = arr_delay_sum + excluded.arr_delay_sum,
+            arr_delay_count = arr_delay_count + excluded.arr_delay_count;
+        INSERT INTO flights_daily_plane_summary
+        SELECT {row}.year, {row}.month, {row}.day,
+               IFNULL(type, ''), IFNULL(manufacturer, ''), {sign}
+        FROM planes
+        WHERE tailnum = {row}.tailnum
+        ON CONFLICT (year, month, day, type, manufacturer) DO UPDATE SET
+            n_flights = n_flights + excluded.n_flights;
+    """
+
+
+def create_summary_triggers(conn):
+    """Create the triggers that keep the summary tables current."""
+    conn.executescript(f"""
+        DROP TRIGGER IF EXISTS flights_summary_insert;
+        DROP TRIGGER IF EXISTS flights_summary_delete;
+        DROP TRIGGER IF EXISTS flights_summary_update;
+        CREATE TRIGGER flights_summary_insert AFTER INSERT ON flights
+        BEGIN
+            {_summary_upserts("NEW", 1)}
+        END;
+        CREATE TRIGGER flights_summary_delete AFTER DELETE ON flights
+        BEGIN
+            {_summary_upserts("OLD", -1)}
+        END;
+        CREATE TRIGGER flights_summary_update
+        AFTER UPDATE OF {", ".join(TRACKED_COLUMNS)} ON flights
+        BEGIN
+            {_summary_upserts("OLD", -1)}
+            {_summary_upserts("NEW", 1)}
+        END;
+    """)
+
+
+def refresh_summaries(conn):
+    """Rebuild both summary tables from the flights table."""
+    conn.execute("DELETE FROM flights_daily_summary")
+    conn.execute("""
+        INSERT INTO flights_daily_summary
+        SELECT year, month, day,
+               IFNULL(origin, ''), IFNULL(dest, ''), IFNULL(carrier, ''),
+               COUNT(*),
+               IFNULL(SUM(dep_delay), 0), COUNT(dep_delay),
+               IFNULL(SUM(arr_delay), 0), COUNT(arr_delay)
+        FROM flights
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """)
+    conn.execute("DELETE FROM flights_daily_plane_summary")
+    conn.execute("""
+        INSERT INTO flights_daily_plane_summary
+        SELECT f.year, f.month, f.day,
+               IFNULL(p.type, ''), IFNULL(p.manufacturer, ''), COUNT(*)
+        FROM flights AS f
+        JOIN planes AS p ON f.tailnum = p.tailnum
+        GROUP BY 1, 2, 3, 4, 5
+    """)
+
+
+def create_summary_tables(conn):
+    """Create, fill and start maintaining the summary tables."""
+    conn.executescript(SUMMARY_TABLES)
+    create_summary_triggers(conn)
+    refresh_summaries(conn)
+
+
+def range_metrics(conn, start_date, end_date, extra=None):
+    """Return the dashboard metrics for a date range from the summaries.
+
+    ``extra`` takes joined flights that are not in the database yet (see
+    flightlib.dataset.join_pending_flights), which are counted in as well.
+    """
+    clause, params = date_range_clause(start_date, end_date)
+    joined_clause, _ = date_range_clause(start_date, end_date, alias="s")
+
+    total_flights = conn.execute(f"""
+        SELECT IFNULL(SUM(n_flights), 0) FROM flights_daily_summary
+        WHERE {clause}
+    """, params).fetchone()[0]
+
+    airline_delays = pd.read_sql_query(f"""
+        SELECT al.name AS name_airline, SUM(s.n_flights) AS n_flights,
+               SUM(s.dep_delay_sum) AS dep_delay_sum, SUM(s.dep_delay_count) AS dep_delay_count
+        FROM flights_daily_summary AS s
+        JOIN airlines AS al ON s.carrier = al.carrier
+        WHERE {joined_clause}
+        GROUP BY al.name
+    """, conn, params=params)
+
+    # flights without a destination are summarized under '' and only count in the total
+    dest_counts = pd.read_sql_query(f"""
+        SELECT dest, SUM(n_flights) AS count FROM flights_daily_summary
+        WHERE {clause} AND dest != ''
+        GROUP BY dest
+    """, conn, params=params)
+
+    plane_counts = pd.read_sql_query(f"""
+        SELECT type, manufacturer, SUM(n_flights) AS count
+        FROM flights_daily_plane_summary
+        WHERE {clause}
+        GROUP BY type, manufacturer
+    """, conn, params=params)
+
+    if extra is not None and len(extra):
+        total_flights += len(extra)
+        extra_delays = (extra.groupby("name_airline")["dep_delay"]
+                        .agg(n_flights="size", dep_delay_sum="sum", dep_delay_count="count").reset_index())
+        airline_delays = (pd.concat([airline_delays, extra_delays])
+                          .groupby("name_airline", as_index=False).sum())
+        extra_dests = extra["dest"].dropna().value_counts().rename_axis("dest").reset_index()
+        dest_counts = pd.concat([dest_counts, extra_dests]).groupby("dest", as_index=False)["count"].sum()
+        # flights without a plane land in ('', ''), which counts_by leaves out like the summary does
+        extra_planes = (extra.fillna({"type": "", "manufacturer": ""})
+                        .groupby(["type", "manufacturer"]).size().reset_index(name="count"))
+        plane_counts = (pd.concat([plane_counts, extra_planes])
+                        .groupby(["type", "manufacturer"], as_index=False)["count"].sum())
+
+    airline_delays = airline_delays[airline_delays["n_flights"] > 0].sort_values("name_airline")
+    avg_delay_by_airline = pd.DataFrame({
+        "name_airline": airline_delays["name_airline"].to_numpy(),
+        "dep_delay": (airline_delays["dep_delay_sum"]
+                      / airline_delays["dep_delay_count"].where(airline_delays["dep_delay_count"] > 0)).to_numpy(),
+    })
+    dest_counts = (dest_counts[dest_counts["count"] > 0]
+                   .sort_values(["count", "dest"], ascending=[False, True]).reset_index(drop=True))
+    plane_counts = plane_counts[plane_counts["count"] > 0]
+
+    def counts_by(column):
+        counts = plane_counts[plane_counts[column] != ""]
+        counts = counts.groupby(column)["count"].sum()
+        return counts.sort_values(ascending=False).reset_index()
+
+    return {
+        "total_flights": int(total_flights),
+        "avg_delay_by_airline": avg_delay_by_airline,
+        "unique_destinations": len(dest_counts),
+        "most_visited": dest_counts["dest"].iloc[0] if len(dest_counts) else None,
+        "most_visited_count": int(dest_counts["count"].iloc[0]) if len(dest_counts) else 0,
+        "type_counts": counts_by("type"),
+        "manufacturer_counts": counts_by("manufacturer"),
+    }
+
+
+if __name__ == "__main__":
+    conn = connect(DB_PATH)
+    with conn:
+        refresh_summaries(conn)
+    conn.close()
+    print(f"Rebuilt the summary tables in {DB_PATH}")
@@ -0,0 +1,178 @@
+"""Date and time conversions of the flights table."""
+import datetime
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from flightlib.config import DB_PATH
+
+
+def flight_dates(flights):
+    """The year/month/day columns of the flights as one datetime64 column."""
+    return pd.to_datetime(flights[["year", "month", "day"]])
+
+
+def hhmm_to_timedelta(hhmm):
+    """Convert HHMM values to the timedelta64 since midnight, all at once.
+
+    2400 is the midnight at the end of the day (one day); other hours wrap
+    around 24. Missing values become NaT.
+    """
+    hhmm = pd.to_numeric(pd.Series(hhmm), errors="coerce").astype("float64")
+    hours, minutes = np.divmod(hhmm.to_numpy(), 100)
+    minutes_of_day = (hours % 24) * 60 + np.trunc(minutes)
+    minutes_of_day = np.where(hhmm.to_numpy() == 2400, 1440, minutes_of_day)
+    return pd.Series(pd.to_timedelta(minutes_of_day, unit="m"), index=hhmm.index)
+
+
+def hhmm_to_datetime(dates, hhmm):
+    """Combine datetime64 dates with HHMM times, rolling 2400 over to the next day."""
+    dates = pd.Series(dates)
+    return dates + hhmm_to_timedelta(hhmm).set_axis(dates.index)
+
+
+# covert to datetime objects
+def flights_with_dtime_objects(flights=None, db_path=DB_PATH):
+    """Return the flights with datetime64 times and timedelta64 delays and air time."""
+    # Connect to the database and load the flights table, unless it was passed in
+    if flights is None:
+        with sqlite3.connect(db_path) as conn:
+            query = "SELECT * FROM flights"
+            flights = pd.read_sql(query, conn)
+        conn.close()
+    else:
+        flights = flights.copy()
+
+    # Convert time columns to datetime64 columns in one pass per column
+    dates = flight_dates(flights)
+    for col in ["dep_time", "sched_dep_time", "arr_time", "sched_arr_time"]:
+        flights[col] = hhmm_to_datetime(dates, flights[col])
+
+    # Convert delay and air_time fields into timedelta64 columns
+    for col in ["dep_delay", "arr_delay", "air_time"]:
+        flights[col] = pd.to_timedelta(pd.to_numeric(flights[col], errors="coerce"), unit="m")
+
+    return flights
+
+
+############################################
+# GENERATE THE COLUMN local_arr_time that represents the arrival time of the plane at local time
+############################################
+def convert_to_local_time(row):
+    try:
+        if pd.isnull(row["arr_time"]) or pd.isnull(row["tzone"]):
+            return None
+
+        ny_tz = pytz.timezone("America/New_York")
+        dest_tz = pytz.timezone(row["tzone"])
+
+        ny_time_hhmm = int(row["arr_time"])
+        hour = ny_time_hhmm // 100
+        minute = ny_time_hhmm % 100
+
+        if hour >= 24:
+            hour -= 24
+            new_date = datetime.datetime(row["year"], row["month"],
+                                         row["day"]) + datetime.timedelta(days=1)
+        else:
+            new_date = datetime.datetime(row["year"], row["month"], row["day"])
+
+        ny_time = ny_tz.localize(
+            datetime.datetime(new_date.year, new_date.month, new_date.day, hour, minute))
+        local_time = ny_time.astimezone(dest_tz)
+
+        return local_time.hour * 100 + local_time.minute
+
+    except Exception as e:
+        print(f"Error processing row {row.name}: {e}")
+        return None
+
+
+# the flights table has the local times of the New York airports
+SOURCE_TZ = "America/New_York"
+
+
+def _hhmm_to_naive(dates, hhmm):
+    # HHMM to naive datetimes like convert_to_local_time does: hours 24-47
+    # are on the next day; missing, negative or malformed times become NaT
+    hhmm = np.trunc(pd.to_numeric(pd.Series(hhmm).set_axis(dates.index), errors="coerce")
+                    .astype("float64"))
+    hours, minutes = hhmm // 100, hhmm % 100
+    malformed = hhmm.notna() & ((hhmm < 0) | (minutes >= 60) | (hours >= 48))
+    offset = pd.to_timedelta(hours.where(~malformed) * 60 + minutes, unit="m")
+    return dates + offset, malformed
+
+
+def to_local_hhmm(dates, hhmm, tzones, source_tz=SOURCE_TZ):
+    """Convert HHMM times in source_tz to HHMM times in the time zone of every row.
+
+    The rows are converted per time zone with tz-aware datetime arithmetic.
+    Ambiguous times resolve to standard time and times in the spring-forward
+    gap move an hour ahead, as pytz's localize does. Returns the local times
+    (NaN where they cannot be computed) and a frame with the reason for every
+    bad row.
+    """
+    tzones = pd.Series(tzones).set_axis(dates.index)
+    naive, malformed = _hhmm_to_naive(dates, hhmm)
+    source = naive.dt.tz_localize(source_tz, ambiguous=np.zeros(len(naive), dtype=bool),
+                                  nonexistent=pd.Timedelta(hours=1))
+
+    local = pd.Series(np.nan, index=dates.index)
+    unknown_tz = pd.Series(False, index=dates.index)
+    valid = source.notna() & tzones.notna()
+    for tzone, rows in source[valid].groupby(tzones[valid]):
+        try:
+            converted = rows.dt.tz_convert(tzone)
+        except Exception:
+            unknown_tz[rows.index] = True
+            continue
+        local[rows.index] = converted.dt.hour * 100 + converted.dt.minute
+
+    bad_rows = pd.concat([
+        pd.DataFrame({"reason": "malformed time"}, index=malformed.index[malformed]),
+        pd.DataFrame({"reason": "unknown time zone"}, index=unknown_tz.index[unknown_tz]),
+    ])
+    return local, bad_rows
+
+
+def local_flight_times(flights=None, db_path=DB_PATH):
+    """Add local_arr_time and local_dep_time to the flights with a known destination.
+
+    local_arr_time is the arrival time in the time zone of the destination,
+    local_dep_time the departure time in the time zone of the origin. Returns
+    the flights and the bad rows (see to_local_hhmm) per column.
+    """
+    con = sqlite3.connect(db_path)
+
+    airports_df = pd.read_sql("SELECT faa, lat, lon, tzone FROM airports", con)
+    if flights is None:
+        flights = pd.read_sql(
+            "SELECT year, month, day, dep_time, arr_time, origin, dest FROM flights", con)
+    con.close()
+
+    flights_df = flights[["year", "month", "day", "arr_time", "dest"]
+                         + [c for c in ("dep_time", "origin") if c in flights]]
+    merged_df = flights_df.merge(
+        airports_df, left_on="dest", right_on="faa", how="left")
+
+    merged_df = merged_df.dropna(subset=["lat", "lon"])
+
+    merged_df = merged_df.reset_index(drop=True)
+
+    dates = pd.to_datetime(merged_df[["year", "month", "day"]])
+    merged_df["local_arr_time"], bad_arr = to_local_hhmm(
+        dates, merged_df["arr_time"], merged_df["tzone"])
+    bad_rows = [bad_arr.assign(column="arr_time")]
+    if "dep_time" in merged_df and "origin" in merged_df:
+        origin_tz = merged_df["origin"].map(airports_df.set_index("faa")["tzone"])
+        merged_df["local_dep_time"], bad_dep = to_local_hhmm(
+            dates, merged_df["dep_time"], origin_tz)
+        bad_rows.append(bad_dep.assign(column="dep_time"))
+    return merged_df, pd.concat(bad_rows)
+
+
+def local_arrival_times(flights=None, db_path=DB_PATH):
+    """Add local_arr_time to the flights with a known destination."""
+    return local_flight_times(flights, db_path)[0]
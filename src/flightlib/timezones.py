@@ -0,0 +1,117 @@
+"""Time zone names of coordinates, with a persistent cache.
+
+TimezoneFinder is slow to load and to query, so its results are cached by
+coordinates rounded to ``PRECISION`` decimals (about 10 m) in a JSON file
+in the cache directory. TimezoneFinder is only loaded when a coordinate is
+not in the cache yet, and all coordinates of a call are looked up in one
+batch, each distinct coordinate once.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from flightlib.config import CACHE_DIR
+
+CACHE_PATH = os.path.join(CACHE_DIR, "timezones.json")
+PRECISION = 4
+
+
+class TimezoneResolver:
+    """Batched, memoized TimezoneFinder lookups."""
+
+    def __init__(self, cache_path=CACHE_PATH, precision=PRECISION):
+        self.cache_path = cache_path
+        self.precision = precision
+        self._finder = None
+        self._cache = None
+        self._lock = threading.Lock()
+
+    def _version(self):
+        from importlib.metadata import PackageNotFoundError, version
+        try:
+            return version("timezonefinder")
+        except PackageNotFoundError:
+            return None
+
+    def _load(self):
+        try:
+            with open(self.cache_path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # results of another TimezoneFinder version or precision are not reused
+        if stored.get("finder") != self._version() or stored.get("precision") != self.precision:
+            return {}
+        return stored.get("zones", {})
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"finder": self._version(), "precision": self.precision,
+                       "zones": self._cache}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _finder_instance(self):
+        if self._finder is None:
+            from timezonefinder import TimezoneFinder
+            self._finder = TimezoneFinder()
+        return self._finder
+
+    def keys(self, lat, lon):
+        """Cache keys of the rounded coordinates (None where one is missing)."""
+        lat = np.round(np.asarray(lat, dtype=float), self.precision)
+        lon = np.round(np.asarray(lon, dtype=float), self.precision)
+        return [None if np.isnan(a) or np.isnan(o) else f"{a:.{self.precision}f},{o:.{self.precision}f}"
+                for a, o in zip(lat.ravel(), lon.ravel())]
+
+    def resolve(self, lat, lon):
+        """Time zone names of the coordinates, None where there is none."""
+        keys = self.keys(lat, lon)
+        with self._lock:
+            if self._cache is None:
+                self._cache = self._load()
+            missing = {k for k in keys if k is not None and k not in self._cache}
+            if missing:
+                finder = self._finder_instance()
+                for key in missing:
+                    k_lat, k_lon = map(float, key.split(","))
+                    self._cache[key] = finder.timezone_at(lng=k_lon, lat=k_lat)
+                try:
+                    self._save()
+                except OSError:
+                    pass  # a read-only cache only costs new lookups next time
+            return [None if k is None else self._cache[k] for k in keys]
+
+    def fill_missing(self, tzone, lat, lon):
+        """Fill the missing values of a tzone column from the coordinates."""
+        tzone = pd.Series(tzone)
+        missing = tzone.isna().to_numpy()
+        if missing.any():
+            lat = np.asarray(lat, dtype=float)[missing]
+            lon = np.asarray(lon, dtype=float)[missing]
+            tzone = tzone.astype(object)
+            tzone[missing] = self.resolve(lat, lon)
+            tzone = tzone.where(tzone.notna(), None)
+        return tzone
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_resolver():
+    """The resolver shared by all callers in this process."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = TimezoneResolver()
+        return _shared
+
+
+def fill_missing_tzones(df):
+    """Return the tzone column of airports with the missing zones resolved."""
+    return get_resolver().fill_missing(df["tzone"], df["lat"], df["lon"]).set_axis(df.index)
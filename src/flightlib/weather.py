@@ -0,0 +1,161 @@
+"""Dense in-memory weather cube for vectorized flight/weather joins.
+
+The weather table holds one observation per origin and hour: 3 origins
+times 8760 hours a year. Instead of hash-joining it with the flights on
+(origin, year, month, day, hour), the observations are stored in a float32
+array indexed by ``[origin, hour, variable]``, where the hour counts from
+the first hour of the first year. Attaching weather to any set of flights is
+then one gather with the origin and hour positions of the flights.
+
+Hours without an observation are marked in ``observed``. When a flight
+falls in such an hour, the nearest observed hour of the same origin (at most
+``max_gap`` hours away) is used instead; NULL values within an observation
+stay missing.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from flightlib.config import DB_PATH
+from flightlib.db import table_version
+from flightlib.snapshot import read_table
+
+KEY_COLUMNS = ["origin", "year", "month", "day", "hour"]
+VARIABLES = ["temp", "dewp", "humid", "wind_dir", "wind_speed", "wind_gust",
+             "precip", "pressure", "visib"]
+MAX_GAP_HOURS = 3
+
+_shared = {}
+_lock = threading.Lock()
+
+
+def _int_values(values):
+    # integer values and where they are present; integer columns need no NaN check
+    values = np.asarray(values)
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64, copy=False), None
+    values = values.astype(np.float64, copy=False)
+    valid = ~np.isnan(values)
+    return np.where(valid, values, 1).astype(np.int64), valid
+
+
+def hours_since(start_year, year, month, day, hour):
+    """Hours since the start of start_year (-1 where a component is missing)."""
+    parts = [_int_values(v) for v in (year, month, day, hour)]
+    (year, _), (month, _), (day, _), (hour, _) = parts
+    valid = (year >= start_year) & (month >= 1) & (month <= 12)
+    for _, present in parts:
+        if present is not None:
+            valid &= present
+    # days from the start to the first day of every month, looked up instead of computed
+    n_years = max(int(year.max(initial=start_year)) - start_year + 1, 1)
+    month_starts = np.arange(np.datetime64(f"{start_year}-01", "M"),
+                             np.datetime64(f"{start_year + n_years}-01", "M")).astype("datetime64[D]")
+    first_days = (month_starts - month_starts[0]).astype(np.int64)
+    months = np.clip((year - start_year) * 12 + month - 1, 0, len(first_days) - 1)
+    return np.where(valid, (first_days[months] + day - 1) * 24 + hour, -1)
+
+
+def nearest_observed(observed, max_gap=MAX_GAP_HOURS):
+    """Position of the nearest observed hour per (origin, hour), -1 if too far.
+
+    Ties go to the earlier hour.
+    """
+    n_hours = observed.shape[1]
+    hours = np.arange(n_hours)
+    nearest = np.full(observed.shape, -1, dtype=np.int64)
+    for o in range(observed.shape[0]):
+        positions = np.flatnonzero(observed[o])
+        if len(positions) == 0:
+            continue
+        after = np.clip(np.searchsorted(positions, hours), 0, len(positions) - 1)
+        before = np.clip(after - 1, 0, len(positions) - 1)
+        take_before = np.abs(hours - positions[before]) <= np.abs(positions[after] - hours)
+        best = np.where(take_before, positions[before], positions[after])
+        nearest[o] = np.where(np.abs(best - hours) <= max_gap, best, -1)
+    return nearest
+
+
+class WeatherCube:
+    """Weather observations as a dense ``[origin, hour, variable]`` array."""
+
+    def __init__(self, weather, variables=VARIABLES, max_gap=MAX_GAP_HOURS):
+        weather = weather.dropna(subset=KEY_COLUMNS)
+        self.variables = [v for v in variables if v in weather.columns]
+        self.origins = pd.Index(sorted(weather["origin"].unique()))
+        self.start_year = int(weather["year"].min()) if len(weather) else 1970
+        end_year = int(weather["year"].max()) if len(weather) else 1970
+        n_hours = int(hours_since(self.start_year, [end_year + 1], [1], [1], [0])[0])
+
+        origin_pos = self.origins.get_indexer(weather["origin"])
+        hour_pos = hours_since(self.start_year, weather["year"], weather["month"],
+                               weather["day"], weather["hour"])
+        # observations with an invalid date (-1) or past the end would land in another hour
+        valid = (hour_pos >= 0) & (hour_pos < n_hours)
+        self.values = np.full((len(self.origins), n_hours, len(self.variables)), np.nan, dtype=np.float32)
+        # duplicated observations of an hour: the first one is kept
+        keep = valid & ~pd.DataFrame({"o": origin_pos, "h": hour_pos}).duplicated().to_numpy()
+        self.values[origin_pos[keep], hour_pos[keep]] = weather[self.variables].to_numpy(
+            dtype=np.float32, na_value=np.nan)[keep]
+        self.observed = np.zeros((len(self.origins), n_hours), dtype=bool)
+        self.observed[origin_pos[valid], hour_pos[valid]] = True
+        self.nearest = nearest_observed(self.observed, max_gap)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.observed.nbytes + self.nearest.nbytes
+
+    def positions(self, origin, year, month, day, hour, nearest=True):
+        """Origin and hour positions of flights (-1 where there is no weather)."""
+        # factorize first, so only the few distinct origins are looked up
+        codes, uniques = pd.factorize(pd.Series(origin))
+        if len(self.origins) == 0 or self.values.shape[1] == 0:
+            missing = np.full(len(codes), -1)
+            return missing, missing.copy()
+        o = np.append(self.origins.get_indexer(uniques), -1)[codes]
+        h = hours_since(self.start_year, year, month, day, hour)
+        inside = (o >= 0) & (h >= 0) & (h < self.values.shape[1])
+        o, h = np.where(inside, o, 0), np.where(inside, h, 0)
+        h = self.nearest[o, h] if nearest else np.where(self.observed[o, h], h, -1)
+        found = inside & (h >= 0)
+        return np.where(found, o, -1), np.where(found, h, -1)
+
+    def gather(self, origin, year, month, day, hour, variables=None, nearest=True):
+        """Weather of every flight as a float32 frame (NaN where there is none)."""
+        variables = self.variables if variables is None else list(variables)
+        columns = [self.variables.index(v) for v in variables]
+        o, h = self.positions(origin, year, month, day, hour, nearest)
+        if not (o >= 0).any():
+            return pd.DataFrame(np.nan, index=range(len(o)), columns=variables, dtype=np.float32)
+        values = self.values[np.maximum(o, 0)[:, None], np.maximum(h, 0)[:, None], columns]
+        values[o < 0] = np.nan
+        return pd.DataFrame(values, columns=variables)
+
+    def attach(self, flights, variables=None, nearest=True, how="left"):
+        """Copy of the flights with the weather columns added.
+
+        With ``how="inner"`` the flights without an observation are left out,
+        like an inner join.
+        """
+        keys = [flights[c] for c in KEY_COLUMNS]
+        weather = self.gather(*keys, variables=variables, nearest=nearest)
+        flights = flights.assign(**{c: weather[c].to_numpy() for c in weather.columns})
+        if how == "inner":
+            o, _ = self.positions(*keys, nearest=nearest)
+            flights = flights[o >= 0]
+        return flights
+
+
+def get_weather_cube(db_path=DB_PATH, variables=VARIABLES):
+    """The shared weather cube of a database, rebuilt when the weather table changes."""
+    key = (os.path.abspath(db_path), tuple(variables))
+    version = table_version(db_path, "weather")
+    with _lock:
+        cached = _shared.get(key)
+        if cached is None or cached[0] != version:
+            weather = read_table("weather", KEY_COLUMNS + list(variables), db_path=db_path)
+            cached = (version, WeatherCube(weather, variables))
+            _shared[key] = cached
+    return cached[1]
@@ -0,0 +1,314 @@
+"""Durable, batched writes of new rows from the dashboard.
+
+Rows submitted on the New Data Entry page are put on a queue and written by
+one background thread. The thread collects the rows that arrive within
+``flush_interval`` seconds (up to ``batch_size`` rows) and inserts them with
+one ``executemany`` per table inside a single transaction, on a connection
+in WAL mode so the dashboard can keep reading while it writes.
+
+Until a row is committed it is kept as pending, so the pages can overlay
+the pending rows on the tables they already have in memory. Once a batch is
+committed the version of the tables it wrote changes (see
+flightlib.db.table_versions). The writer records the rowids and versions of
+every batch, so ``appended_rowids`` can tell a cache that the only changes
+since it was built are rows this writer appended; the cache then reads
+just those rows instead of reloading the table.
+
+No row is dropped when a write fails. While another connection holds the
+write lock, the batch stays pending and is retried with a growing delay.
+When a row breaks a constraint or cannot be bound, the batch is written row
+by row, so only the bad rows fail; they are kept with their error and can
+be listed with ``failed``.
+"""
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from flightlib.config import DB_PATH
+
+TABLES = ["airports", "flights", "airlines", "planes", "weather"]
+# delays between the attempts to write a batch while the database is locked
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 30.0
+# committed batches remembered per table for appended_rowids
+MAX_LOGGED_BATCHES = 1000
+
+_shared = {}
+_lock = threading.Lock()
+
+
+def table_columns(conn, table):
+    """Names of the columns of a table, in table order."""
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def is_locked_error(error):
+    """Whether a SQLite error only means another connection holds the lock."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+class BackgroundWriter:
+    """Queue of new rows written to SQLite in batches by a daemon thread."""
+
+    def __init__(self, db_path=DB_PATH, batch_size=500, flush_interval=1.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._pending = {table: {} for table in TABLES}
+        self._failed = {table: {} for table in TABLES}
+        self._appended = {table: [] for table in TABLES}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"written": 0, "batches": 0, "failed": 0, "retries": 0, "last_error": None}
+        conn = sqlite3.connect(db_path)
+        try:
+            self._columns = {table: table_columns(conn, table) for table in TABLES}
+        finally:
+            conn.close()
+        self._thread = threading.Thread(target=self._run, name="flightlib-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, table, row):
+        """Queue one row (a dict of column values) for the table.
+
+        Unknown tables and columns raise a ValueError right away instead of
+        failing later in the writer thread; empty strings are stored as NULL.
+        """
+        if table not in self._columns:
+            raise ValueError(f"unknown table: {table}")
+        unknown = set(row) - set(self._columns[table])
+        if unknown:
+            raise ValueError(f"unknown columns for {table}: {', '.join(sorted(unknown))}")
+        row = {k: (None if isinstance(v, str) and not v.strip() else v) for k, v in row.items()}
+        with self._lock:
+            row_id = self._next_id
+            self._next_id += 1
+            self._pending[table][row_id] = row
+        self._queue.put((table, row_id, row))
+        return row_id
+
+    def pending(self, table):
+        """The rows of the table that are queued but not written yet."""
+        with self._lock:
+            rows = list(self._pending[table].values())
+        return pd.DataFrame(rows, columns=self._columns[table])
+
+    def failed(self, table):
+        """The rows of the table that could not be written, with their error."""
+        with self._lock:
+            rows = list(self._failed[table].values())
+        return pd.DataFrame(rows, columns=self._columns[table] + ["error"])
+
+    def appended(self, table, since, until):
+        """Rowid ranges of the rows this writer appended between two table versions.
+
+        ``since`` and ``until`` are versions from flightlib.db.table_versions.
+        Returns a list of ``(first, last)`` rowid ranges, or None when the
+        batches of this writer do not account for every change in between.
+        """
+        if list(since) == list(until):
+            return []
+        if since[0] != "table" or until[0] != "table" or list(since[1:3]) != list(until[1:3]):
+            return None
+        with self._lock:
+            batches = list(self._appended[table])
+        ranges, version = [], since[3]
+        for database_id, schema, before, after, first, last in batches:
+            if [database_id, schema, before] == list(since[1:3]) + [version]:
+                if ranges and ranges[-1][1] + 1 == first:
+                    ranges[-1] = (ranges[-1][0], last)  # consecutive batches: one range
+                else:
+                    ranges.append((first, last))
+                version = after
+        return ranges if version == until[3] else None
+
+    def stats(self):
+        """Numbers of pending, written and failed rows, retries and the last error."""
+        with self._lock:
+            pending = sum(len(rows) for rows in self._pending.values())
+            return dict(self._stats, pending=pending)
+
+    def flush(self, timeout=None):
+        """Wait until every row submitted so far has been written (or failed)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _collect(self):
+        # block for the first row, then gather the rows arriving within the interval
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert_query(self, table):
+        columns = self._columns[table]
+        return (f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})")
+
+    def _values(self, table, row):
+        return tuple(row.get(c) for c in self._columns[table])
+
+    def _marks(self, conn, tables):
+        # version counter and last rowid of the tables, read inside the write transaction
+        try:
+            counters = dict(conn.execute("SELECT name, version FROM table_versions"))
+        except sqlite3.OperationalError:
+            return {}  # not migrated: the caches reload the whole tables
+        schema = conn.execute("PRAGMA schema_version").fetchone()[0]
+        return {table: (counters.get("_database"), schema, counters[table],
+                        conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0)
+                for table in tables if table in counters}
+
+    def _log(self, before, after):
+        # rows with a rowid above the old maximum were all inserted by this batch
+        with self._lock:
+            for table, (database_id, schema, version, last) in after.items():
+                if table not in before or last == before[table][3]:
+                    continue
+                log = self._appended[table]
+                log.append((database_id, schema, before[table][2], version, before[table][3] + 1, last))
+                del log[:-MAX_LOGGED_BATCHES]
+
+    def _write(self, conn, batch):
+        # the whole batch with one executemany per table, in one transaction
+        by_table = {}
+        for table, _, row in batch:
+            by_table.setdefault(table, []).append(self._values(table, row))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = self._marks(conn, by_table)
+            for table, rows in by_table.items():
+                conn.executemany(self._insert_query(table), rows)
+            after = self._marks(conn, by_table)
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        self._log(before, after)
+
+    def _write_rows(self, conn, batch):
+        # every row in its own savepoint of one transaction; returns the errors of the bad rows
+        errors = {}
+        tables = {table for table, _, _ in batch}
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = self._marks(conn, tables)
+            for table, row_id, row in batch:
+                conn.execute("SAVEPOINT batch_row")
+                try:
+                    conn.execute(self._insert_query(table), self._values(table, row))
+                except (sqlite3.IntegrityError, sqlite3.InterfaceError,
+                        sqlite3.ProgrammingError, sqlite3.DataError) as e:
+                    errors[row_id] = f"{type(e).__name__}: {e}"
+                    conn.execute("ROLLBACK TO batch_row")
+                conn.execute("RELEASE batch_row")
+            after = self._marks(conn, tables)
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        self._log(before, after)
+        return errors
+
+    def _write_with_retry(self, conn, batch):
+        """Write a batch; returns the errors of the rows that could not be written.
+
+        A locked database is waited for (the rows stay pending); after any
+        other error the batch is written row by row.
+        """
+        delay = RETRY_DELAY
+        row_by_row = False
+        while True:
+            try:
+                if row_by_row:
+                    return self._write_rows(conn, batch)
+                self._write(conn, batch)
+                return {}
+            except sqlite3.Error as e:
+                if is_locked_error(e):
+                    with self._lock:
+                        self._stats["retries"] += 1
+                        self._stats["last_error"] = f"{type(e).__name__}: {e} (retrying in {delay:g} s)"
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+                elif row_by_row:
+                    # not caused by a single row (e.g. a read-only database): every row fails
+                    return {row_id: f"{type(e).__name__}: {e}" for _, row_id, _ in batch}
+                else:
+                    row_by_row = True
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                               check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+        except sqlite3.OperationalError:
+            pass  # read-only databases stay in their journal mode; writes will fail below
+        while True:
+            batch = self._collect()
+            try:
+                errors = self._write_with_retry(conn, batch)
+            except Exception as e:
+                errors = {row_id: f"{type(e).__name__}: {e}" for _, row_id, _ in batch}
+            with self._lock:
+                for table, row_id, row in batch:
+                    self._pending[table].pop(row_id, None)
+                    if row_id in errors:
+                        self._failed[table][row_id] = dict(row, error=errors[row_id])
+                self._stats["written"] += len(batch) - len(errors)
+                self._stats["batches"] += 1
+                self._stats["failed"] += len(errors)
+                self._stats["last_error"] = next(iter(errors.values()), None)
+            for _ in batch:
+                self._queue.task_done()
+
+
+def get_writer(db_path=DB_PATH):
+    """The writer of a database file shared by all sessions of this process."""
+    key = os.path.abspath(db_path)
+    with _lock:
+        writer = _shared.get(key)
+        if writer is None:
+            writer = BackgroundWriter(db_path)
+            _shared[key] = writer
+    return writer
+
+
+def appended_rowids(db_path, table, since, until):
+    """Rowid ranges appended to a table by the writer of this process.
+
+    See BackgroundWriter.appended; None if this process has no writer for
+    the database.
+    """
+    if list(since) == list(until):
+        return []
+    with _lock:
+        writer = _shared.get(os.path.abspath(db_path))
+    return None if writer is None else writer.appended(table, since, until)
+
+
+@atexit.register
+def _flush_all():
+    # the writer threads are daemons; give them the chance to write what is queued
+    for writer in list(_shared.values()):
+        writer.flush(timeout=10)
@@ -2,50 +2,41 @@ import pandas as pd
 import sqlite3
 import plotly.express as px
 import plotly.graph_objects as go
-from geopy.distance import geodesic
 import matplotlib.pyplot as plt
-from timezonefinder import TimezoneFinder
 import streamlit as st
-import geopy.distance
 import base64
 import datetime
 import statistics
 import os  
+from flightlib.aggregates import density_figure, group_means, histogram_bins, histogram_figure
+from flightlib.airports import clean_airports, load_clean_airports_db
+from flightlib.dataset import (DATASET_TABLES, add_pending_flights, get_shared_dataset, join_pending_flights,
+                               load_window)
+from flightlib.db import table_version
+from flightlib.figcache import frame_key, get_figure_cache
+from flightlib.geo import ellipsoidal_km
+from flightlib.migrations import migrate
+from flightlib.pairs import get_airport_matrix
+from flightlib.query import clean_sql, get_job, start_job
+from flightlib.search import get_airport_index, load_city_index
+from flightlib.spatial import airports_key, get_shared_index
+from flightlib.speeds import refresh_speeds
+from flightlib.summary import range_metrics
+from flightlib.writer import get_writer
 
 # --------------------- Data Loading and Preprocessing ---------------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__)) 
 db_path  = os.path.join(BASE_DIR, "..", "flights_database.db") 
-conn = sqlite3.connect(db_path)
-df = pd.read_sql_query("SELECT * FROM airports", conn)
-conn.close()
-
-# use timezonefinder to fill in missing timezone data
-tf = TimezoneFinder()
-df["tzone"] = df.apply(
-    lambda row: tf.timezone_at(lng=row["lon"], lat=row["lat"]) if pd.isnull(row["tzone"]) else row["tzone"],
-    axis=1,
-)
-tz_mapping_dynamic = dict(df[["tzone", "tz"]].dropna().drop_duplicates().values)
-df["tz"] = df.apply(
-    lambda row: tz_mapping_dynamic.get(row["tzone"], row["tz"]) if pd.isnull(row["tz"]) else row["tz"],
-    axis=1,
-)
-def infer_dst_from_tzone(tzone):
-    if pd.isnull(tzone):
-        return 'U'
-    if "America/" in tzone:
-        return 'A'
-    elif "Europe/" in tzone:
-        return 'E'
-    else:
-        return 'N'
-df["dst"] = df.apply(
-    lambda row: row["dst"] if pd.notnull(row["dst"]) else infer_dst_from_tzone(row["tzone"]),
-    axis=1,
-)
-df.loc[df["tzone"] == "America/Boise", "tz"] = -7
-df.loc[df["tz"] == 8, "tz"] = -8
-df["tz"] = df["tz"].astype("Int64")
+migrate(db_path)  # creates the indexes used by the date-range queries
+refresh_speeds(db_path)  # planes.speed of the planes with new or changed flights
+# cleaned airports (tzone, tz and dst filled in), only cleaned again when the table changes
+df = load_clean_airports_db(db_path)
+# new rows are queued here and written to the database in batches in the background
+writer = get_writer(db_path)
+# figures and aggregates keyed by the inputs that change the data; labels are applied after the lookup
+figure_cache = get_figure_cache(max_bytes=128 * 2**20)
+# date ranges shorter than this are read from SQLite, longer ones are sliced from the shared dataset
+SQL_WINDOW_DAYS = 7
 
 # --------------------- Define Helper Functions ---------------------
 # if input is 3 letters, search for FAA code, if input contains "airport", search for airport name, else return None
@@ -53,32 +44,25 @@ def get_airport_from_input(input_str, df):
     input_str = input_str.strip()
     if not input_str:
         return None
+    airport_index = get_airport_index(df, db_path)
     if len(input_str) == 3:
-        result = df[df['faa'].str.lower() == input_str.lower()]
+        result = airport_index.search(input_str, limit=5, fuzzy=False)
+        result = result[result["faa"].str.lower() == input_str.lower()]
         if not result.empty:
-            return result.iloc[0]
+            return df.loc[result["label"].iloc[0]]
     if "airport" in input_str.lower():
-        result = df[df['name'].str.lower().str.contains(input_str.lower())]
+        result = airport_index.search(input_str, limit=1)
         if not result.empty:
-            return result.iloc[0]
-    return None
-
-# helper function to get city coordinates
-def get_city_coordinates(city_name):
-    city_name = city_name.lower()
-    matches = city_df[city_df["city_ascii"].str.lower().str.contains(city_name, na=False)]
-    if not matches.empty:
-        best_match = matches.iloc[0]
-        return best_match["lat"], best_match["lng"]
+            return df.loc[result["label"].iloc[0]]
     return None
 
-# helper function to calculate haversine distance
-def find_nearest_airport(city_name, df):
-    city_coords = get_city_coordinates(city_name)
-    if city_coords is None:
-        return None
-    df["distance_to_city"] = df.apply(lambda row: geopy.distance.geodesic(city_coords, (row["lat"], row["lon"])).km, axis=1)
-    return df.loc[df["distance_to_city"].idxmin()]
+def submit_new_row(table, row, message):
+    try:
+        writer.submit(table, row)
+    except ValueError as e:
+        st.error(str(e))
+    else:
+        st.success(message)
 
 # --------------------- Streamlit Page Configuration ---------------------
 st.set_page_config(layout="wide")
@@ -121,6 +105,13 @@ translations = {
         "Nederlands": "Voer de aankomststad, FAA-code of luchthavennaam in:",
         "Romania": "Introduceți orașul de sosire, codul FAA sau numele aeroportului:"
     },
+    "suggestions": {
+        "English": "Did you mean (for \"{query}\"):",
+        "中文": "您是否要找（\"{query}\"）：",
+        "Hrvatski": "Jeste li mislili (za \"{query}\"):",
+        "Nederlands": "Bedoelde u (voor \"{query}\"):",
+        "Romania": "Ați vrut să spuneți (pentru \"{query}\"):"
+    },
     "select_default_map_type": {
         "English": "Select Default Map Type:",
         "中文": "选择默认地图类型:",
@@ -142,6 +133,13 @@ translations = {
         "Nederlands": "Dichtstbijzijnde luchthaven 1:",
         "Romania": "Cel mai apropiat aeroport 1:"
     },
+    "nearby_airports": {
+        "English": "Airports near {city}",
+        "中文": "{city} 附近的机场",
+        "Hrvatski": "Zračne luke u blizini {city}",
+        "Nederlands": "Luchthavens bij {city}",
+        "Romania": "Aeroporturi în apropiere de {city}"
+    },
     "nearest_airport_2": {
         "English": "Nearest Airport 2:",
         "中文": "最近机场 2:",
@@ -213,46 +211,46 @@ translations = {
         "Romania": "Adaugă un aeroport nou"
     },
     "no_new_airports": {
-        "English": "No new airports have been added yet.",
-        "中文": "当前没有新增机场。",
-        "Hrvatski": "Nije dodana nijedna nova zračna luka.",
-        "Nederlands": "Er zijn nog geen nieuwe luchthavens toegevoegd.",
-        "Romania": "Nu au fost adăugate aeroporturi noi încă."
+        "English": "No new airports are waiting to be saved.",
+        "中文": "当前没有等待保存的新机场。",
+        "Hrvatski": "Nema novih zračnih luka koje čekaju spremanje.",
+        "Nederlands": "Er wachten geen nieuwe luchthavens om opgeslagen te worden.",
+        "Romania": "Nu există aeroporturi noi care așteaptă să fie salvate."
     },
     "no_new_flights": {
-        "English": "No new flights have been added yet.",
-        "中文": "当前没有新增航班。",
-        "Hrvatski": "Nije dodan nijedan novi let.",
-        "Nederlands": "Er zijn nog geen nieuwe vluchten toegevoegd.",
-        "Romania": "Nu au fost adăugate încă zboruri noi."
+        "English": "No new flights are waiting to be saved.",
+        "中文": "当前没有等待保存的新航班。",
+        "Hrvatski": "Nema novih letova koji čekaju spremanje.",
+        "Nederlands": "Er wachten geen nieuwe vluchten om opgeslagen te worden.",
+        "Romania": "Nu există zboruri noi care așteaptă să fie salvate."
     },
     "no_new_airlines": {
-        "English": "No new airlines have been added yet.",
-        "中文": "当前没有新增航空公司。",
-        "Hrvatski": "Nije dodana nijedna nova aviokompanija.",
-        "Nederlands": "Er zijn nog geen nieuwe luchtvaartmaatschappijen toegevoegd.",
-        "Romania": "Nu au fost adăugate încă companii aeriene noi."
+        "English": "No new airlines are waiting to be saved.",
+        "中文": "当前没有等待保存的新航空公司。",
+        "Hrvatski": "Nema novih aviokompanija koje čekaju spremanje.",
+        "Nederlands": "Er wachten geen nieuwe luchtvaartmaatschappijen om opgeslagen te worden.",
+        "Romania": "Nu există companii aeriene noi care așteaptă să fie salvate."
     },
     "no_new_planes": {
-        "English": "No new planes have been added yet.",
-        "中文": "当前没有新增飞机。",
-        "Hrvatski": "Nije dodan nijedan novi avion.",
-        "Nederlands": "Er zijn nog geen nieuwe vliegtuigen toegevoegd.",
-        "Romania": "Nu au fost adăugate încă avioane noi."
+        "English": "No new planes are waiting to be saved.",
+        "中文": "当前没有等待保存的新飞机。",
+        "Hrvatski": "Nema novih aviona koji čekaju spremanje.",
+        "Nederlands": "Er wachten geen nieuwe vliegtuigen om opgeslagen te worden.",
+        "Romania": "Nu există avioane noi care așteaptă să fie salvate."
     },
     "no_new_weather": {
-        "English": "No new weather data has been added yet.",
-        "中文": "当前没有新增天气数据。",
-        "Hrvatski": "Nisu dodani novi vremenski podaci.",
-        "Nederlands": "Er zijn nog geen nieuwe weersgegevens toegevoegd.",
-        "Romania": "Nu au fost adăugate încă date meteo noi."
+        "English": "No new weather data is waiting to be saved.",
+        "中文": "当前没有等待保存的新天气数据。",
+        "Hrvatski": "Nema novih vremenskih podataka koji čekaju spremanje.",
+        "Nederlands": "Er wachten geen nieuwe weersgegevens om opgeslagen te worden.",
+        "Romania": "Nu există date meteo noi care așteaptă să fie salvate."
     },
     "note_session": {
-        "English": "Note: New data is only stored in this session and will disappear if refreshed or restarted.",
-        "中文": "注意：新增数据仅在当前会话中保存，刷新后将消失。",
-        "Hrvatski": "Opomena: Novi podaci se spremaju samo tijekom sesije i nestat će nakon osvježenja.",
-        "Nederlands": "Opmerking: Nieuwe gegevens worden alleen in deze sessie opgeslagen en verdwijnen bij verversen.",
-        "Romania": "Notă: Datele noi sunt stocate doar în această sesiune și vor dispărea dacă pagina este reîncărcată sau repornită."
+        "English": "Note: New data is saved to the database in the background and is kept after a refresh or restart.",
+        "中文": "注意：新增数据会在后台保存到数据库，刷新或重启后仍然保留。",
+        "Hrvatski": "Opomena: Novi podaci se u pozadini spremaju u bazu podataka i ostaju nakon osvježenja ili ponovnog pokretanja.",
+        "Nederlands": "Opmerking: Nieuwe gegevens worden op de achtergrond in de database opgeslagen en blijven bewaard na verversen of herstarten.",
+        "Romania": "Notă: Datele noi sunt salvate în fundal în baza de date și se păstrează după reîncărcare sau repornire."
     },
     "dashboard": {
         "English": "Dashboard",
@@ -269,11 +267,11 @@ translations = {
         "Romania": "Introducere date noi"
     },
     "new_data_submitted": {
-        "English": "New Data Submitted (Session State)",
-        "中文": "新数据已提交（会话状态）",
-        "Hrvatski": "Novi podaci poslani (stanje sesije)",
-        "Nederlands": "Nieuwe gegevens ingediend (sessiestatus)",
-        "Romania": "Datele noi trimise (stare sesiune)"
+        "English": "New Data Waiting to Be Saved",
+        "中文": "等待保存的新数据",
+        "Hrvatski": "Novi podaci koji čekaju spremanje",
+        "Nederlands": "Nieuwe gegevens die wachten op opslag",
+        "Romania": "Date noi care așteaptă să fie salvate"
     },
     "query_flights_date_range": {
         "English": "Query Flights by Date Range (2023)",
@@ -357,32 +355,44 @@ with col_page:
     )
 
 # --------------------- Other Data Loading ---------------------
-def load_city_data():
-    city_file_path = os.path.join(BASE_DIR, "..", "data", "worldcities.csv") 
-    return pd.read_csv(city_file_path)
-
-city_df = load_city_data()
-
-def haversine_distance(coord1, coord2):
-    return geopy.distance.geodesic(coord1, coord2).km
+# prebuilt search index over worldcities.csv, stored in data/cache
+city_index = load_city_index(os.path.join(BASE_DIR, "..", "data", "worldcities.csv"))
 
 ny_coords = (40.7128, -74.0060)
-df["distance"] = df.apply(lambda row: haversine_distance(ny_coords, (row["lat"], row["lon"])), axis=1)
+df["distance"] = ellipsoidal_km(ny_coords[0], ny_coords[1], df["lat"], df["lon"])
 
 def get_city_coordinates(city_name):
-    city_name = city_name.lower()
-    matches = city_df[city_df["city_ascii"].str.lower().str.contains(city_name, na=False)]
+    matches = city_index.search(city_name, limit=1)
     if not matches.empty:
         best_match = matches.iloc[0]
-        return best_match["lat"], best_match["lng"]
+        return best_match["lat"], best_match["lon"]
     return None
 
-def find_nearest_airport(city_name, df):
+# airports and cities matching what has been typed so far, best first
+def location_suggestions(query, df, limit=5):
+    if not query.strip():
+        return []
+    airports = get_airport_index(df, db_path).search(query, limit=limit)
+    cities = city_index.search(query, limit=limit)
+    matches = pd.concat([airports.assign(label=airports["faa"] + " - " + airports["name"]),
+                         cities.assign(label=cities["name"])])
+    if matches.empty or (matches["match"] == "exact").any():
+        return []
+    order = matches["match"].map({"prefix": 0, "word": 1, "fuzzy": 2})
+    return matches.assign(order=order).sort_values("order", kind="stable")["label"].head(limit).tolist()
+
+# ranked airports nearest to a city, from the spatial index shared across sessions
+def find_nearest_airports(city_name, df, k=5):
     city_coords = get_city_coordinates(city_name)
     if city_coords is None:
         return None
-    df["distance_to_city"] = df.apply(lambda row: haversine_distance(city_coords, (row["lat"], row["lon"])), axis=1)
-    return df.loc[df["distance_to_city"].idxmin()]
+    return get_shared_index(df).nearest(city_coords[0], city_coords[1], k=k)
+
+def find_nearest_airport(city_name, df):
+    nearest = find_nearest_airports(city_name, df, k=1)
+    if nearest is None or nearest.empty:
+        return None
+    return nearest.iloc[0]
 
 df = df.copy()  # make a copy of the original dataframe
 
@@ -413,10 +423,7 @@ if selected_page == t("new_data_entry", selected_language):
                     "dst": dst_val.strip(),
                     "tzone": tzone_val.strip()
                 }
-                if "new_airports" not in st.session_state:
-                    st.session_state["new_airports"] = []
-                st.session_state["new_airports"].append(new_airport)
-                st.success("New Airport Data Added!")
+                submit_new_row("airports", new_airport, "New Airport Data Added!")
     
     elif table_choice == "Flights":
         with st.form("flights_form"):
@@ -463,10 +470,7 @@ if selected_page == t("new_data_entry", selected_language):
                     "minute": minute_val,
                     "time_hour": time_hour
                 }
-                if "new_flights" not in st.session_state:
-                    st.session_state["new_flights"] = []
-                st.session_state["new_flights"].append(new_flight)
-                st.success("New Flight Data Added!")
+                submit_new_row("flights", new_flight, "New Flight Data Added!")
     
     elif table_choice == "Airlines":
         with st.form("airlines_form"):
@@ -476,10 +480,7 @@ if selected_page == t("new_data_entry", selected_language):
             submitted = st.form_submit_button("Submit Airline")
             if submitted:
                 new_airline = {"carrier": carrier, "name": name}
-                if "new_airlines" not in st.session_state:
-                    st.session_state["new_airlines"] = []
-                st.session_state["new_airlines"].append(new_airline)
-                st.success("New Airline Data Added!")
+                submit_new_row("airlines", new_airline, "New Airline Data Added!")
     
     elif table_choice == "Planes":
         with st.form("planes_form"):
@@ -506,10 +507,7 @@ if selected_page == t("new_data_entry", selected_language):
                     "speed": speed,
                     "engine": engine
                 }
-                if "new_planes" not in st.session_state:
-                    st.session_state["new_planes"] = []
-                st.session_state["new_planes"].append(new_plane)
-                st.success("New Plane Data Added!")
+                submit_new_row("planes", new_plane, "New Plane Data Added!")
     
     elif table_choice == "Weather":
         with st.form("weather_form"):
@@ -548,109 +546,78 @@ if selected_page == t("new_data_entry", selected_language):
                     "visib": visib,
                     "time_hour": time_hour
                 }
-                if "new_weather" not in st.session_state:
-                    st.session_state["new_weather"] = []
-                st.session_state["new_weather"].append(new_weather)
-                st.success("New Weather Data Added!")
+                submit_new_row("weather", new_weather, "New Weather Data Added!")
     
     st.subheader(t("new_data_submitted", selected_language))
-    if "new_airports" in st.session_state and st.session_state["new_airports"]:
-        st.write("Airports:")
-        st.dataframe(pd.DataFrame(st.session_state["new_airports"]))
-    else:
-        st.info(t("no_new_airports", selected_language))
-        
-    if "new_flights" in st.session_state and st.session_state["new_flights"]:
-        st.write("Flights:")
-        st.dataframe(pd.DataFrame(st.session_state["new_flights"]))
-    else:
-        st.info(t("no_new_flights", selected_language))
-        
-    if "new_airlines" in st.session_state and st.session_state["new_airlines"]:
-        st.write("Airlines:")
-        st.dataframe(pd.DataFrame(st.session_state["new_airlines"]))
-    else:
-        st.info(t("no_new_airlines", selected_language))
-        
-    if "new_planes" in st.session_state and st.session_state["new_planes"]:
-        st.write("Planes:")
-        st.dataframe(pd.DataFrame(st.session_state["new_planes"]))
-    else:
-        st.info(t("no_new_planes", selected_language))
-        
-    if "new_weather" in st.session_state and st.session_state["new_weather"]:
-        st.write("Weather:")
-        st.dataframe(pd.DataFrame(st.session_state["new_weather"]))
-    else:
-        st.info(t("no_new_weather", selected_language))
-        
+    # rows stay pending until the background writer has committed them
+    for table in ["airports", "flights", "airlines", "planes", "weather"]:
+        pending = writer.pending(table)
+        if not pending.empty:
+            st.write(f"{table.capitalize()}:")
+            st.dataframe(pending)
+        else:
+            st.info(t(f"no_new_{table}", selected_language))
+        # rows that could not be written are kept with their error instead of being dropped
+        failed = writer.failed(table)
+        if not failed.empty:
+            st.warning(f"{table.capitalize()}: {len(failed)} rows could not be saved")
+            st.dataframe(failed)
+    writer_stats = writer.stats()
+    st.caption(f"Saved: {writer_stats['written']} rows in {writer_stats['batches']} batches, "
+               f"pending: {writer_stats['pending']}, failed: {writer_stats['failed']}")
+    if writer_stats["last_error"]:
+        st.error(writer_stats["last_error"])
     st.info(t("note_session", selected_language))
 
 # --------------------- General Results Page [Need Fixd!] ---------------------
 elif selected_page == "General Results":
-    # Load data from SQLite database
-    conn = sqlite3.connect(db_path)
-    query = "SELECT * FROM flights WHERE year = 2023"
-    flights_df = pd.read_sql_query(query, conn)
-    conn.close()
-    flights_df['flight_date'] = pd.to_datetime(flights_df[['year', 'month', 'day']])
+    # flights and their dimension tables are loaded and joined once per process
+    dataset = get_shared_dataset(db_path)
     # select flights in 2023, maybe need to change the date range in the future
     start_date = datetime.date(2023, 1, 1)
     end_date = datetime.date(2023, 12, 31)
-    mask = (flights_df['flight_date'] >= pd.to_datetime(start_date)) & (flights_df['flight_date'] <= pd.to_datetime(end_date))
-    flights_df = flights_df[mask]
+    pending_flights = writer.pending("flights")
+    flights_df = dataset.between(start_date, end_date)
+    flights_df = add_pending_flights(flights_df, pending_flights, start_date, end_date, db_path)
+    results_key = ("general_results", dataset.version, start_date, end_date, frame_key(pending_flights))
     
     if not flights_df.empty:
-        conn = sqlite3.connect(db_path)
-        airlines_df = pd.read_sql_query("SELECT * FROM airlines", conn)
-        planes_df = pd.read_sql_query("SELECT * FROM planes", conn)
-        airports_df = pd.read_sql_query("SELECT * FROM airports", conn)
-        weather_df = pd.read_sql_query("SELECT * FROM weather", conn)
-        conn.close()
-        
-        flights_df = flights_df.merge(airlines_df, on='carrier', how='left', suffixes=('', '_airline'))
-        flights_df = flights_df.rename(columns={"name": "name_airline"})
-        flights_df = flights_df.merge(planes_df, on='tailnum', how='left', suffixes=('', '_plane'))
-        flights_df = flights_df.merge(airports_df[['faa', 'name', 'lat', 'lon']], left_on='origin', right_on='faa', how='left', suffixes=('', '_origin'))
-        flights_df = flights_df.rename(columns={'name': 'origin_name', 'lat': 'origin_lat', 'lon': 'origin_lon'})
-        flights_df = flights_df.merge(airports_df[['faa', 'name', 'lat', 'lon']], left_on='dest', right_on='faa', how='left', suffixes=('', '_dest'))
-        flights_df = flights_df.rename(columns={'name': 'dest_name', 'lat': 'dest_lat', 'lon': 'dest_lon'})
-        flights_df = flights_df.merge(weather_df[['origin','year','month','day','hour','wind_dir','wind_speed']],
-                                      on=['origin','year','month','day','hour'], how='left')
-        
-        flights_df['distance_km'] = flights_df['distance'] * 1.60934
-        flights_df['speed'] = flights_df.apply(lambda row: (row['distance_km'] * 60 / row['air_time']) if row['air_time'] and row['air_time'] > 0 else None, axis=1)
-        
         # figure 1 - average flight speed by airplane model
-        avg_speed_by_model = flights_df.groupby("model")["speed"].mean().reset_index()
-        fig_speed_model = px.bar(avg_speed_by_model, x="model", y="speed", color="model",
-                                 title="Average Flight Speed by Airplane Model (km/h)",
-                                 labels={"speed": "Average Speed (km/h)", "model": "Airplane Model"})
+        def build_speed_model():
+            avg_speed_by_model = group_means(flights_df, "model", "speed")
+            return px.bar(avg_speed_by_model, x="model", y="speed", color="model",
+                          title="Average Flight Speed by Airplane Model (km/h)",
+                          labels={"speed": "Average Speed (km/h)", "model": "Airplane Model"})
+        fig_speed_model = figure_cache.get(results_key + ("speed_model",), build_speed_model)
         
         # figure 2 - average departure delay by origin airport
-        avg_dep_delay_by_airport = flights_df.groupby("origin")["dep_delay"].mean().reset_index()
-        fig_dep_delay = px.bar(avg_dep_delay_by_airport, x="origin", y="dep_delay", color="origin",
-                               title="Average Departure Delay by Origin Airport (min)",
-                               labels={"dep_delay": "Average Departure Delay (min)", "origin": "Origin Airport"})
+        def build_dep_delay():
+            avg_dep_delay_by_airport = group_means(flights_df, "origin", "dep_delay")
+            return px.bar(avg_dep_delay_by_airport, x="origin", y="dep_delay", color="origin",
+                          title="Average Departure Delay by Origin Airport (min)",
+                          labels={"dep_delay": "Average Departure Delay (min)", "origin": "Origin Airport"})
+        fig_dep_delay = figure_cache.get(results_key + ("dep_delay",), build_dep_delay)
         
         # figure 3 - top 10 most frequent routes from NYC airports
-        nyc_airports = ["EWR", "JFK", "LGA"]
-        nyc_flights = flights_df[flights_df["origin"].isin(nyc_airports)]
-        route_counts = nyc_flights.groupby(["origin", "dest"]).size().reset_index(name="count")
-        route_counts = route_counts.sort_values(by="count", ascending=False).head(10)
-        fig_routes = px.bar(route_counts, x="origin", y="count", color="dest",
-                            title="Top 10 Most Frequent Routes from NYC Airports",
-                            labels={"count": "Flight Count", "origin": "Origin", "dest": "Destination"})
+        def build_routes():
+            nyc_airports = ["EWR", "JFK", "LGA"]
+            nyc_flights = flights_df[flights_df["origin"].isin(nyc_airports)]
+            route_counts = nyc_flights.groupby(["origin", "dest"]).size().reset_index(name="count")
+            route_counts = route_counts.sort_values(by="count", ascending=False).head(10)
+            return px.bar(route_counts, x="origin", y="count", color="dest",
+                          title="Top 10 Most Frequent Routes from NYC Airports",
+                          labels={"count": "Flight Count", "origin": "Origin", "dest": "Destination"})
+        fig_routes = figure_cache.get(results_key + ("routes",), build_routes)
         
-        # figure 4 - wind speed vs departure delay
-        fig_wind_delay = px.scatter(flights_df, x="wind_speed", y="dep_delay", 
-                                    title="Wind Speed vs Departure Delay", color="origin",
-                                    labels={"wind_speed": "Wind Speed (mph)", "dep_delay": "Departure Delay (min)"})
+        # figure 4 - wind speed vs departure delay, binned on the server instead of one point per flight
+        fig_wind_delay = figure_cache.get(results_key + ("wind_delay",), lambda: density_figure(
+            flights_df["wind_speed"], flights_df["dep_delay"], "Wind Speed vs Departure Delay",
+            "Wind Speed (mph)", "Departure Delay (min)"))
         
-        # figure 5 - air time distribution
-        fig_air_time = px.histogram(flights_df, x="air_time", nbins=50, color="origin",
-                                    title="Flight Time Distribution (minutes)",
-                                    labels={"air_time": "Air Time (min)"})
+        # figure 5 - air time distribution, histogram bins counted on the server
+        fig_air_time = figure_cache.get(results_key + ("air_time",), lambda: histogram_figure(
+            histogram_bins(flights_df["air_time"], flights_df["origin"], bins=50),
+            "Flight Time Distribution (minutes)", "Air Time (min)", "origin"))
         
         st.subheader("General Results")
         col1, col2 = st.columns(2)
@@ -669,27 +636,62 @@ elif selected_page == "Developer Tool":
     st.subheader("Developer Tool")
     st.write("Enter SQL query to run on the 2023 database (supports SELECT, INSERT, UPDATE, DELETE, etc.):")
     sql_query = st.text_area("SQL Query", height=150)
+    budget_cols = st.columns(2)
+    time_budget = budget_cols[0].number_input("Time budget (s)", min_value=1, max_value=600, value=30, step=1)
+    row_budget = budget_cols[1].number_input("Row budget", min_value=1, value=100_000, step=1000)
+    budgets = {"time_budget": time_budget, "row_budget": row_budget}
     if st.button("Run Query"):
-        try:
-            conn = sqlite3.connect(db_path)
-            if sql_query.strip().lower().startswith("select"):
-                result_df = pd.read_sql_query(sql_query, conn)
-                st.write("Query Result:")
-                st.dataframe(result_df)
-            else:
-                cur = conn.cursor()
-                cur.execute(sql_query)
-                conn.commit()
-                st.success("Query executed successfully!")
-            conn.close()
-        except Exception as e:
-            st.error(f"Error executing query: {e}")
+        # queries run on a worker thread with their own connection
+        job = start_job(sql_query, db_path, **budgets)
+        st.session_state["developer_job"] = job.id
+        if job.read:
+            st.session_state["developer_query"] = sql_query
+            st.session_state["developer_page"] = 1
+        else:
+            st.session_state.pop("developer_query", None)
+    job = get_job(st.session_state.get("developer_job"))
+    read_query = st.session_state.get("developer_query")
+    if read_query:
+        page_size = st.selectbox("Rows per page", [100, 1000, 10000], index=1)
+        page = st.number_input("Page", min_value=1, step=1, key="developer_page")
+        if job is None or (job.sql, job.page, job.page_size) != (clean_sql(read_query), page - 1, page_size):
+            # another page; pages read before come from the cache
+            job = start_job(read_query, db_path, page=page - 1, page_size=page_size, **budgets)
+            st.session_state["developer_job"] = job.id
+    if job is not None:
+        if job.running and st.button("Cancel Query"):
+            job.cancel()
+        progress = st.empty()
+        while job.running:
+            progress.progress(min(job.elapsed / job.time_budget, 1.0),
+                              text=f"Running for {job.elapsed:.1f} s ({job.steps:,} steps)")
+            job.wait(0.2)
+        progress.empty()
+        if job.state == "cancelled":
+            st.warning(f"Query cancelled after {job.elapsed:.1f} s.")
+        elif job.state == "failed":
+            st.error(f"Error executing query: {job.error}")
+        elif job.read:
+            result = job.result
+            n_pages = max(1, -(-result["rows"] // job.page_size))
+            more = f"more than {result['rows']}" if result["capped"] else f"{result['rows']}"
+            st.write(f"Query Result: {more} rows, page {job.page + 1} of {n_pages} ({job.elapsed:.2f} s)")
+            st.dataframe(result["page"])
+            with st.expander("Query plan"):
+                st.code(result["plan"] or "(no plan)")
+        else:
+            st.success(f"Query executed successfully! {job.result['changed']} rows changed.")
+    st.write("Shared flights dataset:")
+    st.json(get_shared_dataset(db_path).memory_report())
+    st.write("Figure cache:")
+    st.json(figure_cache.stats())
 
 # --------------------- Dashboard Page ---------------------
 else:
-    if "new_airports" in st.session_state and st.session_state["new_airports"]:
-        new_df = pd.DataFrame(st.session_state["new_airports"])
-        df = pd.concat([df, new_df], ignore_index=True)
+    # airports that are submitted but not written yet, cleaned like the table
+    pending_airports = writer.pending("airports")
+    if not pending_airports.empty:
+        df = pd.concat([df, clean_airports(pending_airports)], ignore_index=True)
         
     with open(os.path.join(BASE_DIR, "..", "figures", "airplane.png"), "rb") as f:  
         encoded_image = base64.b64encode(f.read()).decode()
@@ -738,61 +740,61 @@ else:
                                      min_value=datetime.date(2023, 1, 1), max_value=datetime.date(2023, 12, 31),
                                      key="end_date")
     
-    conn = sqlite3.connect(db_path)
-    query = "SELECT * FROM flights WHERE year = 2023"
-    flights_df = pd.read_sql_query(query, conn)
-    conn.close()
-    flights_df['flight_date'] = pd.to_datetime(flights_df[['year','month','day']])
-    mask = (flights_df['flight_date'] >= pd.to_datetime(start_date)) & (flights_df['flight_date'] <= pd.to_datetime(end_date))
-    flights_df = flights_df[mask]
-        
-    if not flights_df.empty:
+    window_key = ("dashboard", table_version(db_path, *DATASET_TABLES), start_date, end_date)
+    
+    def load_flights_window():
+        if (end_date - start_date).days < SQL_WINDOW_DAYS:
+            # a few days (and only the columns shown) are read straight from the database
+            return figure_cache.get(window_key + ("window",), lambda: load_window(start_date, end_date, db_path))
+        # wider ranges are a slice of the process-wide dataset, which is never copied into the cache
+        return get_shared_dataset(db_path).between(start_date, end_date)
+    
+    def build_route_stats(window_df):
+        # average delay and distance of the route of every flight, in the order of the window
+        return window_df.groupby(['origin', 'dest'])[['dep_delay', 'distance']].transform('mean').to_numpy()
+    
+    def build_metrics():
+        # the metrics come from the daily summary tables instead of the raw rows
         conn = sqlite3.connect(db_path)
-        airlines_df = pd.read_sql_query("SELECT * FROM airlines", conn)
-        planes_df = pd.read_sql_query("SELECT * FROM planes", conn)
-        airports_df = pd.read_sql_query("SELECT * FROM airports", conn)
-        weather_df = pd.read_sql_query("SELECT * FROM weather", conn)
-        conn.close()
-        
-        flights_df = flights_df.merge(airlines_df, on='carrier', how='left', suffixes=('', '_airline'))
-        flights_df = flights_df.rename(columns={"name": "name_airline"})
-        flights_df = flights_df.merge(planes_df, on='tailnum', how='left', suffixes=('', '_plane'))
-        flights_df = flights_df.merge(airports_df[['faa','name','lat','lon']], left_on='origin', right_on='faa', how='left', suffixes=('', '_origin'))
-        flights_df = flights_df.rename(columns={'name': 'origin_name', 'lat': 'origin_lat', 'lon': 'origin_lon'})
-        flights_df = flights_df.merge(airports_df[['faa','name','lat','lon']], left_on='dest', right_on='faa', how='left', suffixes=('', '_dest'))
-        flights_df = flights_df.rename(columns={'name': 'dest_name', 'lat': 'dest_lat', 'lon': 'dest_lon'})
-        flights_df = flights_df.merge(weather_df[['origin','year','month','day','hour','wind_dir','wind_speed']],
-                                      on=['origin','year','month','day','hour'], how='left')
+        try:
+            return range_metrics(conn, start_date, end_date, pending_df)
+        finally:
+            conn.close()
+    
+    # cached frames are shared between sessions and must not be modified in place
+    window_df = load_flights_window()
+    # rows the background writer has not committed yet are shown as well
+    pending_flights = writer.pending("flights")
+    pending_df = join_pending_flights(pending_flights, start_date, end_date, db_path)
+    if pending_df is not None:
+        window_df = pd.concat([window_df, pending_df], ignore_index=True)
+    results_key = window_key + (frame_key(pending_flights),)
+    route_stats = figure_cache.get(results_key + ("route_stats",), lambda: build_route_stats(window_df))
+    flights_df = window_df.assign(avg_dep_delay=route_stats[:, 0], avg_distance=route_stats[:, 1])
         
-        route_stats = flights_df.groupby(['origin','dest']).agg(
-            avg_dep_delay=('dep_delay', 'mean'),
-            avg_distance=('distance', 'mean')
-        ).reset_index()
-        flights_df = flights_df.merge(route_stats, on=['origin','dest'], how='left')
-        flights_df['distance_km'] = flights_df['distance'] * 1.60934
-        flights_df['speed'] = flights_df.apply(lambda row: (row['distance_km'] * 60 / row['air_time']) if row['air_time'] and row['air_time'] > 0 else None, axis=1)
+    if not flights_df.empty:
+        metrics = figure_cache.get(results_key + ("metrics",), build_metrics)
+        total_flights = metrics["total_flights"]
+        fig_avg_delay = figure_cache.get(results_key + ("fig_avg_delay",), lambda: px.bar(
+            metrics["avg_delay_by_airline"], x='name_airline', y='dep_delay',
+            labels={'name_airline': 'Airline', 'dep_delay': 'Avg Departure Delay (min)'}))
+        fig_avg_delay.update_layout(title=t("airlines_avg_delay", selected_language))
         
-        total_flights = len(flights_df)
-        avg_delay_by_airline = flights_df.groupby('name_airline')['dep_delay'].mean().reset_index()
-        fig_avg_delay = px.bar(avg_delay_by_airline, x='name_airline', y='dep_delay',
-                               labels={'name_airline': 'Airline', 'dep_delay': 'Avg Departure Delay (min)'},
-                               title=t("airlines_avg_delay", selected_language))
-        manufacturer_counts = flights_df['manufacturer'].value_counts().reset_index()
-        manufacturer_counts.columns = ['manufacturer', 'count']
-        fig_manufacturers = px.pie(manufacturer_counts, names='manufacturer', values='count',
-                                   title=t("aircraft_manufacturers", selected_language))
-        fig_manufacturers.update_layout(
-            margin=dict(l=10, r=10, t=40, b=10),
-            legend=dict(orientation="h", x=0.5, xanchor="center"),
-            height=350
-        )
+        def build_manufacturers():
+            fig = px.pie(metrics["manufacturer_counts"], names='manufacturer', values='count')
+            fig.update_layout(
+                margin=dict(l=10, r=10, t=40, b=10),
+                legend=dict(orientation="h", x=0.5, xanchor="center"),
+                height=350
+            )
+            return fig
+        fig_manufacturers = figure_cache.get(results_key + ("fig_manufacturers",), build_manufacturers)
+        fig_manufacturers.update_layout(title=t("aircraft_manufacturers", selected_language))
         
-        unique_destinations = flights_df['dest'].nunique()
-        dest_counts = flights_df['dest'].value_counts()
-        most_visited = dest_counts.idxmax()
-        most_visited_count = dest_counts.max()
-        type_counts = flights_df['type'].value_counts().reset_index()
-        type_counts.columns = ['Aircraft Type', 'Count']
+        unique_destinations = metrics["unique_destinations"]
+        most_visited = metrics["most_visited"]
+        most_visited_count = metrics["most_visited_count"]
+        type_counts = metrics["type_counts"].set_axis(['Aircraft Type', 'Count'], axis=1)
         display_columns = [
             'origin_name',
             'origin',
@@ -817,6 +819,10 @@ else:
     # --------------------- Sidebar Filters and Inputs ---------------------
     destination_1 = st.sidebar.text_input(t("enter_departure_city", selected_language), key="destination_1")
     destination_2 = st.sidebar.text_input(t("enter_arrival_city", selected_language), key="destination_2")
+    for destination in (destination_1, destination_2):
+        suggestions = location_suggestions(destination, df)
+        if suggestions:
+            st.sidebar.caption(t("suggestions", selected_language).format(query=destination) + " " + "; ".join(suggestions))
     map_type = st.sidebar.radio(t("select_default_map_type", selected_language), ["US", "World"])
     tz_options = ['All'] + sorted(df['tz'].unique())
     selected_tz = st.sidebar.selectbox(t("select_time_zone", selected_language), options=tz_options, index=0)
@@ -824,26 +830,27 @@ else:
     
     # --------------------- Display Additional Visualizations ---------------------
     def display_visualizations(data):
+        data_key = ("airports", airports_key(data, ["faa", "alt", "tz", "lat", "lon"]))
         col1, col2 = st.columns(2)
         with col1:
-            fig_alt = px.histogram(
+            fig_alt = figure_cache.get(data_key + ("fig_alt",), lambda: px.histogram(
                 data, x="alt", nbins=50,
-                title=t("altitude_distribution", selected_language),
                 color_discrete_sequence=["blue"]
-            )
+            ))
+            fig_alt.update_layout(title=t("altitude_distribution", selected_language))
             st.plotly_chart(fig_alt, use_container_width=True, key="fig_alt")
         with col2:
-            fig_tz = px.histogram(
+            fig_tz = figure_cache.get(data_key + ("fig_tz",), lambda: px.histogram(
                 data, x="tz", nbins=20,
-                title=t("time_zone_distribution", selected_language),
                 color_discrete_sequence=["orange"]
-            )
+            ))
+            fig_tz.update_layout(title=t("time_zone_distribution", selected_language))
             st.plotly_chart(fig_tz, use_container_width=True, key="fig_tz")
-        fig_scatter = px.scatter(
+        fig_scatter = figure_cache.get(data_key + ("fig_scatter",), lambda: px.scatter(
             data, x="alt", y="distance",
-            title=t("altitude_vs_distance", selected_language),
-            color_discrete_sequence=["green"], opacity=0.7
-        )
+            color_discrete_sequence=["green"], opacity=0.7, render_mode="webgl"
+        ))
+        fig_scatter.update_layout(title=t("altitude_vs_distance", selected_language))
         st.plotly_chart(fig_scatter, use_container_width=True, key="fig_scatter")
     
     # --------------------- Main Page Content and Visualizations Layout ---------------------
@@ -858,26 +865,35 @@ else:
     
     with col_left:
         if destination_1 and destination_2:
+            nearby_airports = {}
             airport_1 = get_airport_from_input(destination_1, df)
             if airport_1 is None:
-                airport_1 = find_nearest_airport(destination_1, df)
+                nearby = find_nearest_airports(destination_1, df)
+                nearby_airports[destination_1] = nearby
+                airport_1 = nearby.iloc[0] if nearby is not None and not nearby.empty else None
             airport_2 = get_airport_from_input(destination_2, df)
             if airport_2 is None:
-                airport_2 = find_nearest_airport(destination_2, df)
+                nearby = find_nearest_airports(destination_2, df)
+                nearby_airports[destination_2] = nearby
+                airport_2 = nearby.iloc[0] if nearby is not None and not nearby.empty else None
             if airport_1 is not None and airport_2 is not None:
                 route_flights = flights_df[(flights_df['origin'] == airport_1['faa']) & (flights_df['dest'] == airport_2['faa'])]
                 if not route_flights.empty:
                     avg_distance = route_flights['distance_km'].mean()
                     avg_speed = route_flights['speed'].mean()
                 else:
-                    avg_distance = haversine_distance((airport_1['lat'], airport_1['lon']),
-                                                      (airport_2['lat'], airport_2['lon']))
+                    # looked up in the all-pairs matrix, stored on disk and rebuilt only when the airports change
+                    avg_distance = get_airport_matrix(df, method="ellipsoid").distance(airport_1['faa'], airport_2['faa'])
                     avg_speed = 600.0
                 flight_time_hr = avg_distance / avg_speed
                 st.markdown(f"{t('nearest_airport_1', selected_language)} {airport_1['name']} ({airport_1['faa']})")
                 st.markdown(f"{t('nearest_airport_2', selected_language)} {airport_2['name']} ({airport_2['faa']})")
                 st.markdown(f"{t('distance', selected_language)} {avg_distance:.2f} km")
                 st.markdown(f"{t('estimated_flight_time', selected_language)} {flight_time_hr:.2f} hours")
+                for city, nearby in nearby_airports.items():
+                    if nearby is not None and not nearby.empty:
+                        with st.expander(t("nearby_airports", selected_language).format(city=city)):
+                            st.dataframe(nearby[["faa", "name", "distance_km"]], hide_index=True)
                 st.markdown('<div style="max-width:300px;">', unsafe_allow_html=True)
                 flight_progress = st.slider(t("flight_progress", selected_language), 0.0, flight_time_hr, 0.0, step=0.1)
                 st.markdown('</div>', unsafe_allow_html=True)
@@ -886,23 +902,27 @@ else:
                 current_lon = airport_1['lon'] + progress_ratio * (airport_2['lon'] - airport_1['lon'])
                 center_coords = {"lat": 37.0902, "lon": -95.7129} if map_type == "US" else {"lat": 50, "lon": -90}
                 zoom_level = 2.5 if map_type == "US" else 1.2
-                fig = px.scatter_mapbox(
-                    filtered_df,
-                    lat="lat", lon="lon",
-                    color="alt", color_continuous_scale="viridis",
-                    size_max=10, zoom=zoom_level, center=center_coords,
-                    mapbox_style="open-street-map", opacity=0.7
-                )
-                fig.add_trace(go.Scattermapbox(
-                    mode="lines",
-                    lon=[airport_1['lon'], airport_2['lon']],
-                    lat=[airport_1['lat'], airport_2['lat']],
-                    line={'width': 2, 'color': 'blue'},
-                    name=t("flight_path", selected_language)
-                ))
-                with open("../figures/airplane.png", "rb") as f:
-                    encoded_image = base64.b64encode(f.read()).decode()
-                airplane_img = "data:image/png;base64," + encoded_image
+                
+                def build_route_map():
+                    fig = px.scatter_mapbox(
+                        filtered_df,
+                        lat="lat", lon="lon",
+                        color="alt", color_continuous_scale="viridis",
+                        size_max=10, mapbox_style="open-street-map", opacity=0.7
+                    )
+                    fig.add_trace(go.Scattermapbox(
+                        mode="lines",
+                        lon=[airport_1['lon'], airport_2['lon']],
+                        lat=[airport_1['lat'], airport_2['lat']],
+                        line={'width': 2, 'color': 'blue'}
+                    ))
+                    return fig
+                route_key = (airport_1['faa'], airport_1['lat'], airport_1['lon'],
+                             airport_2['faa'], airport_2['lat'], airport_2['lon'])
+                fig = figure_cache.get(("route_map", airports_key(filtered_df, ["faa", "lat", "lon", "alt"]))
+                                       + route_key, build_route_map)
+                fig.update_layout(mapbox_center=center_coords, mapbox_zoom=zoom_level)
+                fig.data[-1].name = t("flight_path", selected_language)
                 delta = 3
                 if airport_2['lon'] >= airport_1['lon']:
                     coordinates = [
@@ -933,13 +953,16 @@ else:
         else:
             center_coords = {"lat": 37.0902, "lon": -95.7129} if map_type == "US" else {"lat": 50, "lon": -90}
             zoom_level = 2.5 if map_type == "US" else 1
-            fig_default = px.scatter_mapbox(
-                filtered_df, lat="lat", lon="lon",
-                color="alt", color_continuous_scale="viridis",
-                size_max=10, zoom=zoom_level, center=center_coords,
-                mapbox_style="open-street-map", opacity=0.7
-            )
-            fig_default.update_layout(coloraxis_colorbar=dict(title="Altitude"))
+            fig_default = figure_cache.get(
+                ("default_map", airports_key(filtered_df, ["faa", "lat", "lon", "alt"])),
+                lambda: px.scatter_mapbox(
+                    filtered_df, lat="lat", lon="lon",
+                    color="alt", color_continuous_scale="viridis",
+                    size_max=10, mapbox_style="open-street-map", opacity=0.7
+                ))
+            # the map type only moves the view, the cached map is reused
+            fig_default.update_layout(mapbox_center=center_coords, mapbox_zoom=zoom_level,
+                                      coloraxis_colorbar=dict(title="Altitude"))
             st.plotly_chart(fig_default, use_container_width=True, key="default-map")
         st.plotly_chart(fig_avg_delay, use_container_width=True, key="fig_avg_delay")
     